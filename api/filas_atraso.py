@@ -0,0 +1,82 @@
+"""
+Filas de atraso para reprocessar consultas sem prender threads dormindo.
+
+Para cada espera de FILAS_ATRASO existe uma fila '<fila>.atraso.<N>s' sem consumidores,
+com x-message-ttl e dead-letter de volta para a fila de trabalho (exchange padrão): a de
+consultas ou, no modo distribuído, a de tarefas. Uma mensagem reagendada espera lá e volta
+sozinha quando o TTL vence; o cabeçalho x-tentativa conta quantas vezes isso já aconteceu e
+escolhe a próxima espera (cada vez maior). Passando da última, ou se a mensagem nem é JSON,
+ela vai para a fila de estacionamento, onde fica para análise em vez de circular para sempre.
+
+Como os períodos encerrados ficam nos checkpoints, uma consulta reentregue só refaz as
+tarefas (IE, operação, período) que falharam ou foram adiadas.
+"""
+import pika
+from config.config import RABBITMQ_QUEUE_IN, FILAS_ATRASO
+
+CABECALHO_TENTATIVA = "x-tentativa"
+CABECALHO_MOTIVO = "x-motivo"
+
+
+class ReagendarConsulta(Exception):
+    """A consulta (ou, no modo distribuído, a tarefa) precisa voltar mais tarde: falhou ou foi adiada."""
+
+
+def fila_atraso(segundos, fila=RABBITMQ_QUEUE_IN):
+    return f"{fila}.atraso.{int(segundos)}s"
+
+
+def fila_estacionamento(fila=RABBITMQ_QUEUE_IN):
+    return f"{fila}.estacionadas"
+
+
+def declarar_topologia(canal, fila=RABBITMQ_QUEUE_IN, atrasos=FILAS_ATRASO):
+    canal.queue_declare(queue=fila, durable=True)
+    for segundos in atrasos:
+        canal.queue_declare(queue=fila_atraso(segundos, fila), durable=True, arguments={
+            "x-message-ttl": int(segundos * 1000),
+            "x-dead-letter-exchange": "",
+            "x-dead-letter-routing-key": fila,
+        })
+    canal.queue_declare(queue=fila_estacionamento(fila), durable=True)
+
+
+def tentativa(properties):
+    """Quantas vezes a mensagem já foi reagendada (0 na primeira entrega)."""
+    headers = getattr(properties, "headers", None) or {}
+    try:
+        return int(headers.get(CABECALHO_TENTATIVA, 0))
+    except (TypeError, ValueError):
+        return 0
+
+
+def pode_reagendar(properties, atrasos=FILAS_ATRASO):
+    return tentativa(properties) < len(atrasos)
+
+
+def destino(properties, fila=RABBITMQ_QUEUE_IN, atrasos=FILAS_ATRASO):
+    """Fila para onde a mensagem vai se for reagendada agora."""
+    n = tentativa(properties)
+    return fila_atraso(atrasos[n], fila) if n < len(atrasos) else fila_estacionamento(fila)
+
+
+def _publicar(canal, fila, body, properties, motivo, proxima):
+    headers = dict(getattr(properties, "headers", None) or {})
+    headers[CABECALHO_TENTATIVA] = proxima
+    headers[CABECALHO_MOTIVO] = str(motivo)[:500]
+    # mandatory: com publisher confirms, uma fila inexistente vira erro em vez de descarte silencioso
+    canal.basic_publish(exchange="", routing_key=fila, body=body,
+                        properties=pika.BasicProperties(headers=headers, delivery_mode=2), mandatory=True)
+
+
+def reagendar(canal, body, properties, motivo, fila=RABBITMQ_QUEUE_IN, atrasos=FILAS_ATRASO):
+    """Publica na próxima fila de atraso de `fila` (ou no estacionamento). Retorna a fila usada."""
+    proxima = destino(properties, fila, atrasos)
+    _publicar(canal, proxima, body, properties, motivo, tentativa(properties) + 1)
+    return proxima
+
+
+def estacionar(canal, body, properties, motivo, fila=RABBITMQ_QUEUE_IN):
+    estacionamento = fila_estacionamento(fila)
+    _publicar(canal, estacionamento, body, properties, motivo, tentativa(properties))
+    return estacionamento
@@ -1,35 +1,178 @@
 import pika
 import json
+import functools
 import threading
+from concurrent.futures import ThreadPoolExecutor
 from config import config, secrets
-from automation.message_processor import process_message
+from message_processor import process_message
 from config.config import LOG_OK
 from utils.logger import log_monitoramento
+from utils.capacidade import ControleAdmissao
+from utils.disjuntor import get_disjuntor
+from api import filas_atraso
 
-def consume_messages():
-    connection = pika.BlockingConnection(
+def conectar():
+    return pika.BlockingConnection(
         pika.ConnectionParameters(
             host=secrets.RABBITMQ_HOST,
             port=secrets.RABBITMQ_PORT,
             credentials=pika.PlainCredentials(secrets.RABBITMQ_USER, secrets.RABBITMQ_PASSWORD)
         )
     )
+
+def consume_messages(max_workers=None, parar=None, sinal=None, conexao_factory=None, processar=None, disjuntor=None,
+                     fila=None, usar_disjuntor=True):
+    # Número fixo de workers; o prefetch garante que o RabbitMQ só entregue
+    # o que cabe no pool, o resto continua na fila (e sobrevive a um restart).
+    # `parar` (threading/multiprocessing Event) encerra o consumo e drena o que está em andamento.
+    # Com `sinal` (SinalCapacidade do monitor), o prefetch acompanha a capacidade da máquina (AIMD)
+    # e o consumo é pausado quando ela fica crítica.
+    # `conexao_factory` e `processar` permitem rodar o consumidor contra um broker falso (benchmarks).
+    # Com o disjuntor do portal aberto (SEFAZ fora do ar) o consumo também para; este processo
+    # sonda o portal quando for a vez dele e o consumo volta sozinho quando o disjuntor fecha.
+    # `fila`: no modo distribuído o mesmo consumidor atende a fila de tarefas e a de resultados;
+    # planejador e agregador não acessam o portal e rodam com `usar_disjuntor=False`.
+    fila = fila or config.RABBITMQ_QUEUE_IN
+    max_workers = max_workers or config.CONSUMER_WORKERS
+    processar = processar or process_message
+    controle = ControleAdmissao(max_workers, sinal) if sinal is not None else None
+    disjuntor = (disjuntor or get_disjuntor()) if config.DISJUNTOR_ATIVO and usar_disjuntor else None
+    sonda = {"thread": None}
+    connection = (conexao_factory or conectar)()
     channel = connection.channel()
-    channel.queue_declare(queue=config.RABBITMQ_QUEUE_IN, durable=True)
+    atraso = {"canal": None}
+    if config.FILAS_ATRASO_ATIVAS:
+        filas_atraso.declarar_topologia(channel, fila)
+    else:
+        channel.queue_declare(queue=fila, durable=True)
+    # global_qos: o limite vale para o canal todo e muda na hora quando o controle ajusta
+    channel.basic_qos(prefetch_count=controle.limite if controle else max_workers, global_qos=True)
+    executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="consumer")
+    pendentes = {}
+    consumo = {"tag": None}
 
-    def callback(ch, method, properties, body):
-        def worker():
+    def canal_atraso():
+        # Canal próprio com publisher confirms (como o PublisherService): basic_publish só
+        # retorna depois que o broker guardou a cópia e falha se ela foi recusada
+        if atraso["canal"] is None or not atraso["canal"].is_open:
+            atraso["canal"] = connection.channel()
+            atraso["canal"].confirm_delivery()
+        return atraso["canal"]
+
+    def confirmar(delivery_tag, sucesso, redelivered, body=None, properties=None, motivo="", estacionar=False):
+        # Roda na thread da conexão (pika não é thread-safe)
+        pendentes.pop(delivery_tag, None)
+        if not channel.is_open:
+            return
+        if sucesso:
+            channel.basic_ack(delivery_tag=delivery_tag)
+        elif config.FILAS_ATRASO_ATIVAS:
+            # Volta pela fila de atraso (espera crescente) ou fica estacionada; a original só sai
+            # da fila depois que o broker confirmou a cópia
             try:
-                message = json.loads(body)
-                process_message(message, properties)
+                if estacionar:
+                    proxima = filas_atraso.estacionar(canal_atraso(), body, properties, motivo, fila)
+                else:
+                    proxima = filas_atraso.reagendar(canal_atraso(), body, properties, motivo, fila)
             except Exception as e:
-                pass
-        threading.Thread(target=worker).start()
+                log_monitoramento(f"Mensagem {delivery_tag}: falha ao publicar na fila de atraso ({e}); devolvida à fila.")
+                channel.basic_nack(delivery_tag=delivery_tag, requeue=True)
+                return
+            channel.basic_ack(delivery_tag=delivery_tag)
+            log_monitoramento(f"Mensagem {delivery_tag} (tentativa {filas_atraso.tentativa(properties) + 1}) enviada para {proxima}: {motivo}")
+        else:
+            # Devolve à fila uma única vez; na segunda falha a mensagem é descartada
+            channel.basic_nack(delivery_tag=delivery_tag, requeue=not redelivered)
 
-    channel.basic_consume(
-        queue=config.RABBITMQ_QUEUE_IN,
-        on_message_callback=callback,
-        auto_ack=True
-    )
+    def worker(method, properties, body):
+        sucesso = False
+        motivo = ""
+        estacionar = False
+        try:
+            message = json.loads(body)
+        except ValueError as e:
+            message = None
+            motivo = f"Mensagem não é um JSON válido: {e}"
+            estacionar = True
+            log_monitoramento(f"Mensagem {method.delivery_tag} da fila {fila} inválida: {e}")
+        if message is not None:
+            try:
+                processar(message, properties)
+                sucesso = True
+            except filas_atraso.ReagendarConsulta as e:
+                motivo = str(e)
+            except Exception as e:
+                motivo = f"Erro ao processar: {e}"
+                log_monitoramento(f"Erro ao processar mensagem {method.delivery_tag} da fila {fila}: {e}")
+        connection.add_callback_threadsafe(
+            functools.partial(confirmar, method.delivery_tag, sucesso, method.redelivered, body, properties, motivo, estacionar)
+        )
+
+    def callback(ch, method, properties, body):
+        pendentes[method.delivery_tag] = executor.submit(worker, method, properties, body)
+
+    def iniciar_consumo():
+        consumo["tag"] = channel.basic_consume(
+            queue=fila,
+            on_message_callback=callback,
+            auto_ack=False
+        )
+
+    def parar_consumo():
+        if consumo["tag"] is not None:
+            channel.basic_cancel(consumo["tag"])
+            consumo["tag"] = None
+
+    def ajustar_admissao():
+        if controle is None or not controle.atualizar():
+            return
+        channel.basic_qos(prefetch_count=controle.limite, global_qos=True)
+        if controle.pausado and consumo["tag"] is not None:
+            parar_consumo()
+            log_monitoramento(f"Consumidor: máquina em estado crítico, consumo pausado ({len(pendentes)} em andamento).")
+        elif not controle.pausado and consumo["tag"] is None and not portal_fora():
+            iniciar_consumo()
+            log_monitoramento(f"Consumidor: consumo retomado com limite {controle.limite}.")
+        else:
+            log_monitoramento(f"Consumidor: limite de concorrência ajustado para {controle.limite}.")
+
+    def portal_fora():
+        return disjuntor is not None and disjuntor.aberto()
+
+    def verificar_disjuntor():
+        if disjuntor is None:
+            return
+        if not disjuntor.aberto():
+            if consumo["tag"] is None and not (controle is not None and controle.pausado):
+                iniciar_consumo()
+                log_monitoramento("Consumidor: portal de volta, consumo retomado.")
+            return
+        if consumo["tag"] is not None:
+            parar_consumo()
+            log_monitoramento(f"Consumidor: portal fora do ar (disjuntor aberto), consumo pausado ({len(pendentes)} em andamento).")
+        if (sonda["thread"] is None or not sonda["thread"].is_alive()) and disjuntor.reservar_sonda():
+            sonda["thread"] = threading.Thread(target=disjuntor.sondar, daemon=True, name="disjuntor-sonda")
+            sonda["thread"].start()
+
+    if not portal_fora():
+        iniciar_consumo()
+
+    try:
+        while not (parar is not None and parar.is_set()):
+            connection.process_data_events(time_limit=1)
+            ajustar_admissao()
+            verificar_disjuntor()
 
-    channel.start_consuming()
+        # Drenagem: para de receber, devolve à fila o que ainda não começou
+        # e espera as mensagens em andamento terminarem (e serem confirmadas).
+        log_monitoramento(f"Consumidor: encerrando, {len(pendentes)} mensagens pendentes.")
+        parar_consumo()
+        for delivery_tag, futuro in list(pendentes.items()):
+            if futuro.cancel():
+                pendentes.pop(delivery_tag, None)
+                channel.basic_nack(delivery_tag=delivery_tag, requeue=True)
+        while pendentes:
+            connection.process_data_events(time_limit=1)
+        connection.close()
+    finally:
+        executor.shutdown(wait=False)
@@ -1,24 +1,138 @@
+import os
 import pika
 import json
+import time
+import queue
+import threading
+from concurrent.futures import Future
 from config import config, secrets
 from utils.logger import setup_logger
 from config.config import LOG_OK
 
-logger = setup_logger('operation', LOG_OK)
+# LOG_OK é uma pasta; o log de envio fica em um arquivo dentro dela
+logger = setup_logger('operation', os.path.join(LOG_OK, 'operation.log'))
 
-def publish_message(message):
-    connection = pika.BlockingConnection(
+def conectar():
+    return pika.BlockingConnection(
         pika.ConnectionParameters(host=secrets.RABBITMQ_HOST, port=secrets.RABBITMQ_PORT,
+                                  blocked_connection_timeout=300,
                                   credentials=pika.PlainCredentials(secrets.RABBITMQ_USER, secrets.RABBITMQ_PASSWORD)))
-    channel = connection.channel()
-    channel.queue_declare(queue=config.RABBITMQ_QUEUE_OUT, durable=True)
 
-    channel.basic_publish(
-        exchange='',
-        routing_key=config.RABBITMQ_QUEUE_OUT,
-        body=json.dumps(message),
-        properties=pika.BasicProperties(delivery_mode=2)
-    )
 
+class PublisherService:
+    """
+    Publica mensagens em conexões/canais de longa duração.
+
+    Cada thread do serviço é dona de uma conexão (o pika não é thread-safe);
+    quem publica só coloca o pedido na fila interna e aguarda o Future.
+    Com `confirmar=True` o canal usa publisher confirms, então o Future só
+    termina quando o broker confirmou a mensagem. Se a conexão cair, a thread
+    reconecta e tenta de novo.
+    """
+
+    def __init__(self, conexao_factory=None, conexoes=config.PUBLISHER_CONEXOES,
+                 confirmar=config.PUBLISHER_CONFIRMACAO, tentativas=config.PUBLISHER_TENTATIVAS):
+        self.conexao_factory = conexao_factory or conectar
+        self.conexoes = conexoes
+        self.confirmar = confirmar
+        self.tentativas = tentativas
+        self._pedidos = queue.Queue()
+        self._threads = []
+        self._lock = threading.Lock()
+
+    def iniciar(self):
+        with self._lock:
+            if self._threads:
+                return
+            for i in range(self.conexoes):
+                t = threading.Thread(target=self._loop, name=f"publisher-{i + 1}", daemon=True)
+                t.start()
+                self._threads.append(t)
+
+    def publicar(self, fila, mensagem, headers=None, persistente=False, aguardar=True, timeout=60):
+        self.iniciar()
+        corpo = mensagem if isinstance(mensagem, (bytes, str)) else json.dumps(mensagem)
+        props = pika.BasicProperties(headers=headers, delivery_mode=2 if persistente else None)
+        futuro = Future()
+        self._pedidos.put((fila, corpo, props, futuro))
+        if aguardar:
+            return futuro.result(timeout=timeout)
+        return futuro
+
+    def encerrar(self, timeout=10):
+        with self._lock:
+            threads, self._threads = self._threads, []
+        for _ in threads:
+            self._pedidos.put(None)
+        for t in threads:
+            t.join(timeout)
+
+    def _loop(self):
+        conexao = None
+        canal = None
+        declaradas = set()
+        while True:
+            try:
+                pedido = self._pedidos.get(timeout=1)
+            except queue.Empty:
+                # Mantém heartbeats da conexão ociosa em dia
+                if conexao is not None:
+                    try:
+                        conexao.process_data_events(time_limit=0)
+                    except Exception:
+                        conexao = self._fechar(conexao)
+                continue
+            if pedido is None:
+                self._fechar(conexao)
+                return
+
+            fila, corpo, props, futuro = pedido
+            ultimo_erro = None
+            for tentativa in range(1, self.tentativas + 1):
+                try:
+                    if conexao is None:
+                        conexao = self.conexao_factory()
+                        canal = conexao.channel()
+                        if self.confirmar:
+                            canal.confirm_delivery()
+                        declaradas = set()
+                    if fila not in declaradas:
+                        canal.queue_declare(queue=fila, durable=True)
+                        declaradas.add(fila)
+                    canal.basic_publish(exchange='', routing_key=fila, body=corpo, properties=props)
+                    futuro.set_result(True)
+                    break
+                except Exception as e:
+                    ultimo_erro = e
+                    conexao = self._fechar(conexao)
+                    time.sleep(min(2 ** (tentativa - 1), 10))
+            else:
+                futuro.set_exception(ultimo_erro)
+
+    def _fechar(self, conexao):
+        if conexao is not None:
+            try:
+                conexao.close()
+            except Exception:
+                pass
+        return None
+
+
+_publisher = None
+_publisher_lock = threading.Lock()
+
+def get_publisher():
+    global _publisher
+    with _publisher_lock:
+        if _publisher is None:
+            _publisher = PublisherService()
+            _publisher.iniciar()
+        return _publisher
+
+def publicar(fila, mensagem, headers=None, persistente=False, aguardar=True, timeout=60):
+    return get_publisher().publicar(fila, mensagem, headers=headers, persistente=persistente,
+                                    aguardar=aguardar, timeout=timeout)
+
+def publish_message(message):
+    publicar(config.RABBITMQ_QUEUE_OUT, message, persistente=True)
     logger.info(f"Mensagem enviada: {message}")
-    connection.close()
\ No newline at end of file
@@ -1,10 +1,17 @@
 from selenium import webdriver
+from config.config import CHROME_HEADLESS
 
 def get_driver(download_dir):
     options = webdriver.ChromeOptions()
-    prefs = {"download.default_directory": download_dir}
+    prefs = {
+        "download.default_directory": download_dir,
+        "download.prompt_for_download": False,
+        "download.directory_upgrade": True,
+    }
     options.add_experimental_option("prefs", prefs)
     options.add_argument('--no-sandbox')
     options.add_argument('--disable-dev-shm-usage')
+    if CHROME_HEADLESS:
+        options.add_argument('--headless=new')
     driver = webdriver.Chrome(options=options)
     return driver
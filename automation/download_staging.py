@@ -0,0 +1,83 @@
+import os
+import uuid
+import shutil
+import psutil
+from config.config import DOWNLOAD_STAGING_DIRECTORY
+from utils.logger import log_monitoramento
+
+# Cada Chrome baixa em sua própria pasta: <staging>/p<pid>_<id>. O pid no nome
+# permite apagar pastas deixadas por processos que morreram.
+PREFIXO = "p"
+# Folga (s) na comparação entre o início do processo e a pasta: create_time é arredondado
+MARGEM_INICIO = 2
+
+
+def criar_pasta(base=DOWNLOAD_STAGING_DIRECTORY):
+    pasta = os.path.join(base, f"{PREFIXO}{os.getpid()}_{uuid.uuid4().hex[:12]}")
+    os.makedirs(pasta, exist_ok=True)
+    return pasta
+
+
+def limpar_pasta(pasta):
+    """Apaga o conteúdo da pasta (sobras da tarefa anterior), mantendo a pasta."""
+    if not os.path.isdir(pasta):
+        os.makedirs(pasta, exist_ok=True)
+        return
+    for nome in os.listdir(pasta):
+        caminho = os.path.join(pasta, nome)
+        try:
+            if os.path.isdir(caminho):
+                shutil.rmtree(caminho, ignore_errors=True)
+            else:
+                os.remove(caminho)
+        except OSError:
+            pass
+
+
+def remover_pasta(pasta):
+    shutil.rmtree(pasta, ignore_errors=True)
+
+
+def _pid_da_pasta(nome):
+    if not nome.startswith(PREFIXO) or "_" not in nome:
+        return None
+    try:
+        return int(nome[len(PREFIXO):nome.index("_")])
+    except ValueError:
+        return None
+
+
+def _dono_vivo(pid, modificada_em):
+    """
+    O processo que criou a pasta ainda existe. Um processo com o mesmo pid que começou
+    depois da última modificação da pasta é outro (pid reaproveitado).
+    """
+    try:
+        return psutil.Process(pid).create_time() <= modificada_em + MARGEM_INICIO
+    except psutil.NoSuchProcess:
+        return False
+    except psutil.Error:
+        # Sem acesso ao processo (outro usuário): na dúvida, a pasta fica
+        return True
+
+
+def remover_orfas(base=DOWNLOAD_STAGING_DIRECTORY):
+    """Remove pastas de download de processos que não existem mais."""
+    if not os.path.isdir(base):
+        return 0
+    removidas = 0
+    for nome in os.listdir(base):
+        pid = _pid_da_pasta(nome)
+        if pid is None or pid == os.getpid():
+            continue
+        caminho = os.path.join(base, nome)
+        try:
+            modificada_em = os.path.getmtime(caminho)
+        except OSError:
+            continue
+        if not _dono_vivo(pid, modificada_em):
+            remover_pasta(caminho)
+            removidas += 1
+    if removidas:
+        log_monitoramento(f"Staging de downloads: {removidas} pastas órfãs removidas de {base}.")
+    return removidas
@@ -0,0 +1,165 @@
+import os
+import sys
+import time
+import select
+import struct
+import ctypes
+import ctypes.util
+
+SUFIXOS_PARCIAIS = (".crdownload", ".tmp", ".part")
+
+# inotify (Linux): usado só para acordar quando algo muda na pasta
+IN_MODIFY = 0x00000002
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_NONBLOCK = os.O_NONBLOCK
+IN_CLOEXEC = 0o2000000
+_EVENTO = struct.Struct("iIII")
+
+
+class _Inotify:
+    def __init__(self, pasta):
+        libc = ctypes.CDLL(ctypes.util.find_library("c"), use_errno=True)
+        self.fd = libc.inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1")
+        mascara = IN_MODIFY | IN_CLOSE_WRITE | IN_MOVED_TO | IN_CREATE | IN_DELETE
+        if libc.inotify_add_watch(self.fd, os.fsencode(pasta), mascara) < 0:
+            os.close(self.fd)
+            raise OSError(ctypes.get_errno(), "inotify_add_watch")
+
+    def esperar(self, timeout):
+        prontos, _, _ = select.select([self.fd], [], [], max(0, timeout))
+        if not prontos:
+            return False
+        try:
+            while os.read(self.fd, 64 * 1024):
+                pass
+        except BlockingIOError:
+            pass
+        return True
+
+    def fechar(self):
+        if self.fd is None:
+            return
+        try:
+            os.close(self.fd)
+        except OSError:
+            pass
+        self.fd = None
+
+    def __del__(self):
+        self.fechar()
+
+
+class _Polling:
+    def __init__(self, pasta, intervalo=0.2):
+        self.intervalo = intervalo
+
+    def esperar(self, timeout):
+        time.sleep(max(0, min(timeout, self.intervalo)))
+        return True
+
+    def fechar(self):
+        pass
+
+
+class Download:
+    def __init__(self, nome, caminho, bytes_, inicio, fim):
+        self.nome = nome
+        self.caminho = caminho
+        self.bytes = bytes_
+        self.inicio = inicio
+        self.fim = fim
+
+    @property
+    def duracao(self):
+        return self.fim - self.inicio
+
+    def __repr__(self):
+        return f"Download({self.nome!r}, {self.bytes} bytes, {self.duracao:.1f}s)"
+
+
+class DownloadTracker:
+    """
+    Acompanha os downloads do Chrome em uma pasta.
+
+    Crie o tracker ANTES de clicar no botão de download: o que já existia na
+    pasta nesse momento é ignorado, então `aguardar()` devolve exatamente o
+    arquivo gerado por aquele clique (nome final, bytes e tempo).
+
+    No Linux a espera é feita com inotify; nos demais sistemas a pasta é
+    verificada a cada 0,2s.
+    """
+
+    def __init__(self, pasta, extensoes=(".zip",), ignorar_existentes=True):
+        self.pasta = pasta
+        self.extensoes = extensoes
+        self.criado_em = time.time()
+        self.inicio = None
+        self._existentes = set(os.listdir(pasta)) if ignorar_existentes else set()
+        self._entregues = set()
+        self._observador = self._criar_observador(pasta)
+
+    def _criar_observador(self, pasta):
+        if sys.platform.startswith("linux"):
+            try:
+                return _Inotify(pasta)
+            except Exception:
+                pass
+        return _Polling(pasta)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.fechar()
+
+    def fechar(self):
+        self._observador.fechar()
+
+    def _estado(self):
+        parciais = {}
+        concluidos = []
+        with os.scandir(self.pasta) as entradas:
+            for entrada in entradas:
+                nome = entrada.name
+                if nome in self._existentes or nome in self._entregues:
+                    continue
+                try:
+                    tamanho = entrada.stat().st_size
+                except OSError:
+                    continue
+                if nome.endswith(SUFIXOS_PARCIAIS):
+                    parciais[nome] = tamanho
+                elif nome.lower().endswith(self.extensoes):
+                    concluidos.append((nome, tamanho))
+        return parciais, concluidos
+
+    def aguardar(self, timeout=120, ao_progresso=None):
+        """
+        Espera o próximo download concluído. `ao_progresso(bytes_parciais)` é chamado
+        sempre que o tamanho dos arquivos em andamento muda. Retorna um Download ou None.
+        """
+        limite = time.time() + timeout
+        ultimo_progresso = None
+        while True:
+            parciais, concluidos = self._estado()
+            if (parciais or concluidos) and self.inicio is None:
+                self.inicio = time.time()
+            if concluidos and not parciais:
+                nome, tamanho = sorted(concluidos)[0]
+                self._entregues.add(nome)
+                return Download(nome, os.path.join(self.pasta, nome), tamanho,
+                                self.inicio or self.criado_em, time.time())
+            if ao_progresso is not None and parciais:
+                progresso = sum(parciais.values())
+                if progresso != ultimo_progresso:
+                    ultimo_progresso = progresso
+                    ao_progresso(progresso)
+            restante = limite - time.time()
+            if restante <= 0:
+                return None
+            self._observador.esperar(min(restante, 1.0))
@@ -0,0 +1,238 @@
+import time
+import atexit
+import threading
+import itertools
+from contextlib import contextmanager
+from config.config import (
+    MAX_CHROME_INSTANCES, DRIVER_POOL_AQUECIDOS, DRIVER_POOL_MAX_USOS,
+    DRIVER_POOL_TIMEOUT, DRIVER_POOL_SESSAO_TTL
+)
+from utils.logger import log_monitoramento
+from automation import download_staging
+
+_contador_ids = itertools.count(1)
+
+
+class PoolEsgotado(Exception):
+    """Nenhum Chrome livre no pool dentro do timeout (espera local, não é lentidão do portal)."""
+
+
+class SessaoChrome:
+    """
+    Um Chrome do pool. Guarda para qual CPF de contador ele está logado na SEFAZ
+    e a URL da área restrita, para que a próxima tarefa do mesmo contador não
+    precise refazer o login.
+
+    Cada sessão baixa em `pasta_download`, exclusiva dela, que é esvaziada
+    a cada nova tarefa.
+    """
+
+    def __init__(self, driver, pasta_download):
+        self.id = next(_contador_ids)
+        self.driver = driver
+        self.pasta_download = pasta_download
+        self.usos = 0
+        self.criado_em = time.time()
+        self.cpf = None
+        self.url_logado = None
+        self.logado_em = 0
+
+    def saudavel(self):
+        try:
+            self.driver.window_handles
+            self.driver.current_url
+            return True
+        except Exception:
+            return False
+
+    def autenticada_para(self, cpf, ttl=DRIVER_POOL_SESSAO_TTL):
+        return (
+            self.cpf is not None
+            and self.cpf == cpf
+            and self.url_logado is not None
+            and time.time() - self.logado_em < ttl
+        )
+
+    def marcar_login(self, cpf):
+        self.cpf = cpf
+        self.url_logado = self.driver.current_url
+        self.logado_em = time.time()
+
+    def esquecer_login(self):
+        self.cpf = None
+        self.url_logado = None
+        self.logado_em = 0
+
+    def encerrar(self):
+        try:
+            self.driver.quit()
+        except Exception:
+            pass
+        download_staging.remover_pasta(self.pasta_download)
+
+
+class DriverPool:
+    """
+    Pool de Chrome reaproveitáveis entre tarefas.
+
+    - Nunca existem mais que `tamanho_max` Chrome abertos (MAX_CHROME_INSTANCES).
+    - `adquirir(cpf)` prefere um Chrome livre que já esteja logado com o mesmo CPF.
+    - Na devolução o Chrome é checado e reciclado após `max_usos` tarefas.
+    - `fabrica(pasta_download)` abre o Chrome (padrão: automation.browser_driver.get_driver).
+    """
+
+    def __init__(self, fabrica=None, tamanho_max=MAX_CHROME_INSTANCES, aquecidos=DRIVER_POOL_AQUECIDOS,
+                 max_usos=DRIVER_POOL_MAX_USOS, sessao_ttl=DRIVER_POOL_SESSAO_TTL):
+        if fabrica is None:
+            # Fábrica da automação: opções do Chrome e pasta de download da sessão
+            from automation.browser_driver import get_driver
+            fabrica = get_driver
+        self.fabrica = fabrica
+        self.tamanho_max = tamanho_max
+        self.aquecidos = min(aquecidos, tamanho_max)
+        self.max_usos = max_usos
+        self.sessao_ttl = sessao_ttl
+        self._livres = []
+        self._total = 0
+        self._encerrado = False
+        self._cond = threading.Condition()
+
+    @property
+    def total(self):
+        with self._cond:
+            return self._total
+
+    @property
+    def livres(self):
+        with self._cond:
+            return len(self._livres)
+
+    def aquecer(self):
+        """Abre Chrome até ter `aquecidos` sessões livres, sem ultrapassar o limite do pool."""
+        while True:
+            with self._cond:
+                if self._encerrado or len(self._livres) >= self.aquecidos or self._total >= self.tamanho_max:
+                    return
+                self._total += 1
+            try:
+                sessao = self._criar_sessao()
+            except Exception:
+                return
+            with self._cond:
+                self._livres.append(sessao)
+                self._cond.notify()
+
+    def aquecer_em_segundo_plano(self):
+        threading.Thread(target=self.aquecer, daemon=True).start()
+
+    def _criar_sessao(self):
+        # Deve ser chamado com uma vaga já reservada em self._total
+        pasta = None
+        try:
+            pasta = download_staging.criar_pasta()
+            return SessaoChrome(self.fabrica(pasta), pasta)
+        except Exception as e:
+            if pasta:
+                download_staging.remover_pasta(pasta)
+            with self._cond:
+                self._total -= 1
+                self._cond.notify()
+            log_monitoramento(f"Pool Chrome: falha ao abrir Chrome: {e}")
+            raise
+
+    def _escolher_livre(self, cpf):
+        for i, sessao in enumerate(self._livres):
+            if cpf and sessao.autenticada_para(cpf, self.sessao_ttl):
+                return self._livres.pop(i)
+        # Sem sessão logada para o CPF: usa a que está ociosa há mais tempo
+        if self._livres:
+            return self._livres.pop(0)
+        return None
+
+    def adquirir(self, cpf=None, timeout=DRIVER_POOL_TIMEOUT):
+        limite = time.time() + timeout
+        while True:
+            criar = False
+            with self._cond:
+                while True:
+                    if self._encerrado:
+                        raise Exception("Pool de Chrome encerrado.")
+                    sessao = self._escolher_livre(cpf)
+                    if sessao is not None:
+                        break
+                    if self._total < self.tamanho_max:
+                        self._total += 1
+                        criar = True
+                        break
+                    restante = limite - time.time()
+                    if restante <= 0:
+                        raise PoolEsgotado(f"Timeout aguardando Chrome livre no pool ({self.tamanho_max} em uso).")
+                    self._cond.wait(restante)
+
+            if criar:
+                sessao = self._criar_sessao()
+            elif not sessao.saudavel():
+                log_monitoramento(f"Pool Chrome: sessão {sessao.id} não respondeu ao health-check, descartando.")
+                self._descartar(sessao)
+                continue
+
+            download_staging.limpar_pasta(sessao.pasta_download)
+            sessao.usos += 1
+            return sessao
+
+    def devolver(self, sessao, descartar=False):
+        if sessao is None:
+            return
+        if descartar or self._encerrado or sessao.usos >= self.max_usos or not sessao.saudavel():
+            self._descartar(sessao)
+            return
+        with self._cond:
+            self._livres.append(sessao)
+            self._cond.notify()
+
+    def _descartar(self, sessao):
+        sessao.encerrar()
+        with self._cond:
+            self._total -= 1
+            self._cond.notify()
+
+    @contextmanager
+    def sessao(self, cpf=None, timeout=DRIVER_POOL_TIMEOUT):
+        sessao = self.adquirir(cpf, timeout)
+        descartar = True
+        try:
+            yield sessao
+            descartar = False
+        finally:
+            self.devolver(sessao, descartar=descartar)
+
+    def encerrar(self):
+        with self._cond:
+            self._encerrado = True
+            livres, self._livres = self._livres, []
+            self._total -= len(livres)
+            self._cond.notify_all()
+        for sessao in livres:
+            sessao.encerrar()
+
+
+_pool = None
+_pool_lock = threading.Lock()
+_limite_processo = MAX_CHROME_INSTANCES
+
+
+def definir_limite_processo(limite):
+    """Com vários processos worker, cada um fica com uma fatia de MAX_CHROME_INSTANCES."""
+    global _limite_processo
+    _limite_processo = max(1, min(limite, MAX_CHROME_INSTANCES))
+
+
+def get_pool(fabrica=None):
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            download_staging.remover_orfas()
+            _pool = DriverPool(fabrica=fabrica, tamanho_max=_limite_processo)
+            _pool.aquecer_em_segundo_plano()
+            atexit.register(_pool.encerrar)
+        return _pool
@@ -0,0 +1,197 @@
+"""
+Motor HTTP: pesquisa e download do "Baixar XML NFE" sem passar pela interface.
+
+O Chrome continua fazendo o login; os cookies da sessão logada são copiados para
+uma requests.Session e as mesmas requisições que o formulário faria são enviadas
+direto ao portal. O ZIP é gravado em disco em streaming, sem esperar o modal
+"Concluído". Os resultados usam o mesmo vocabulário de automation.sefaz_pages.
+
+Contrato esperado do portal (caminhos em config: SEFAZ_HTTP_PESQUISA / SEFAZ_HTTP_DOWNLOAD):
+  - pesquisa: POST com os campos do formulário; responde o HTML da tela de resultados
+    (alertas 'alert-danger', legenda 'table-legend-right-container' e 'pagination-container').
+  - download: POST com os campos do formulário e do modal; responde o ZIP ou um HTML
+    com o alerta de erro interno.
+"""
+import os
+import re
+import time
+import uuid
+import threading
+import requests
+from html import unescape
+from urllib.parse import urljoin
+from requests.adapters import HTTPAdapter
+from config.config import (
+    SEFAZ_URL_BASE, SEFAZ_HTTP_PESQUISA, SEFAZ_HTTP_DOWNLOAD,
+    SEFAZ_HTTP_TIMEOUT, SEFAZ_HTTP_DOWNLOAD_TIMEOUT, MAX_CHROME_INSTANCES
+)
+from automation.download_tracker import Download
+from utils.limitador import get_limitador, PESQUISA, DOWNLOAD
+from automation.sefaz_pages import (
+    ALERTAS_DATA, RESULTADOS, SEM_RESULTADOS, PERMISSAO_NEGADA, ALERTA_DATA, CONCLUIDO, ERRO_INTERNO
+)
+
+BLOCO_STREAM = 1024 * 1024
+ASSINATURAS_ZIP = (b"PK\x03\x04", b"PK\x05\x06")
+
+_RE_ALERTA = re.compile(r"<div([^>]*class=\"[^\"]*alert-danger[^\"]*\"[^>]*)>(.*?)</div>", re.S | re.I)
+_RE_TAG = re.compile(r"<[^>]+>")
+_RE_TOTAL = re.compile(r"table-legend-right-container[^>]*>\s*<div[^>]*>\s*([\d.]+)\s*<", re.S)
+_RE_PAGINA = re.compile(r"<li[^>]*\bdata=\"(\d+)\"")
+_RE_NOME_ARQUIVO = re.compile(r"filename\*?=(?:UTF-8'')?\"?([^\";]+)\"?", re.I)
+
+
+class SessaoHttpExpirada(Exception):
+    """O portal redirecionou para o login: a sessão do Chrome precisa logar de novo."""
+
+
+_adaptador = None
+_adaptador_lock = threading.Lock()
+
+
+def get_adaptador():
+    """Pool de conexões HTTP compartilhado por todas as sessões do processo."""
+    global _adaptador
+    with _adaptador_lock:
+        if _adaptador is None:
+            _adaptador = HTTPAdapter(pool_connections=4, pool_maxsize=MAX_CHROME_INSTANCES, max_retries=0)
+        return _adaptador
+
+
+def _texto(html):
+    return " ".join(unescape(_RE_TAG.sub(" ", html)).split())
+
+
+def interpretar_pesquisa(html):
+    """Lê o HTML de resposta da pesquisa. Retorna dict(resultado, detalhe, total_notas, ultima_pagina)."""
+    resposta = {"resultado": None, "detalhe": "", "total_notas": 0, "ultima_pagina": 1}
+    if "Você não tem permissão para acessar esta página" in html:
+        resposta.update(resultado=PERMISSAO_NEGADA, detalhe="Você não tem permissão para acessar esta página")
+        return resposta
+    for atributos, conteudo in _RE_ALERTA.findall(html):
+        if "display:none" in atributos.replace(" ", "").lower() or "hidden" in atributos:
+            continue
+        texto = _texto(conteudo)
+        alerta = next((a for a in ALERTAS_DATA if a in texto), None)
+        if alerta:
+            resposta.update(resultado=ALERTA_DATA, detalhe=alerta)
+            return resposta
+        if "Sem Resultados!" in texto:
+            resposta.update(resultado=SEM_RESULTADOS, detalhe=texto)
+            return resposta
+    total = _RE_TOTAL.search(html)
+    if not total or "btn-download-all" not in html:
+        raise Exception("Resposta da pesquisa HTTP não reconhecida (sem alerta e sem tabela de resultados).")
+    resposta["resultado"] = RESULTADOS
+    resposta["total_notas"] = int(total.group(1).replace(".", ""))
+    inicio_paginacao = html.find("pagination-container")
+    if inicio_paginacao >= 0:
+        paginas = [int(p) for p in _RE_PAGINA.findall(html[inicio_paginacao:])]
+        if paginas:
+            resposta["ultima_pagina"] = max(paginas)
+    return resposta
+
+
+class MotorHttp:
+
+    def __init__(self, driver=None, base_url=SEFAZ_URL_BASE, timeout=SEFAZ_HTTP_TIMEOUT):
+        self.base_url = base_url.rstrip("/") + "/"
+        self.timeout = timeout
+        self.http = requests.Session()
+        adaptador = get_adaptador()
+        self.http.mount("https://", adaptador)
+        self.http.mount("http://", adaptador)
+        if driver is not None:
+            self.importar_sessao(driver)
+
+    def importar_sessao(self, driver):
+        """Copia cookies e User-Agent do Chrome já logado."""
+        for cookie in driver.get_cookies():
+            self.http.cookies.set(
+                cookie["name"], cookie["value"],
+                domain=cookie.get("domain"), path=cookie.get("path", "/")
+            )
+        try:
+            self.http.headers["User-Agent"] = driver.execute_script("return navigator.userAgent")
+        except Exception:
+            pass
+
+    def _url(self, caminho):
+        return urljoin(self.base_url, caminho.lstrip("/"))
+
+    def _checar_login(self, resposta):
+        if "acessoRestrito/login" in resposta.url:
+            raise SessaoHttpExpirada("Sessão expirada no portal (redirecionado para o login).")
+
+    def _formulario(self, ini, fim, tipo_oper):
+        return {
+            "cmpDataInicial": ini,
+            "cmpDataFinal": fim,
+            "cmpTipoNota": "0" if tipo_oper == "1" else "1",
+            "cmpModelo": "-",
+        }
+
+    def pesquisar(self, ini, fim, tipo_oper):
+        get_limitador().aguardar(PESQUISA)
+        resposta = self.http.post(self._url(SEFAZ_HTTP_PESQUISA), data=self._formulario(ini, fim, tipo_oper), timeout=self.timeout)
+        self._checar_login(resposta)
+        resposta.raise_for_status()
+        return interpretar_pesquisa(resposta.text)
+
+    def baixar(self, ini, fim, tipo_oper, pasta, pagina_ini=None, pagina_fim=None):
+        """
+        Baixa o ZIP do período (ou do intervalo de páginas) para `pasta`.
+        Retorna (CONCLUIDO, Download) ou (ERRO_INTERNO, None).
+        """
+        dados = self._formulario(ini, fim, tipo_oper)
+        if pagina_ini is not None:
+            dados.update(campoSelectTipodwnload="4", cmpPagIni=str(pagina_ini), cmpPagFin=str(pagina_fim))
+        get_limitador().aguardar(DOWNLOAD)
+        inicio = time.time()
+        with self.http.post(self._url(SEFAZ_HTTP_DOWNLOAD), data=dados, stream=True,
+                            timeout=(self.timeout, SEFAZ_HTTP_DOWNLOAD_TIMEOUT)) as resposta:
+            self._checar_login(resposta)
+            resposta.raise_for_status()
+            blocos = resposta.iter_content(BLOCO_STREAM)
+            primeiro = next(blocos, b"")
+            if not primeiro.startswith(ASSINATURAS_ZIP):
+                corpo = (primeiro + b"".join(blocos)).decode(resposta.encoding or "utf-8", errors="replace")
+                if "erro interno ao realizar o download" in corpo:
+                    get_limitador().sinalizar_limitacao()
+                    return ERRO_INTERNO, None
+                raise Exception(f"Download HTTP não retornou um ZIP (Content-Type: {resposta.headers.get('Content-Type')}).")
+
+            nome = self._nome_arquivo(resposta, pagina_ini, pagina_fim)
+            if os.path.exists(os.path.join(pasta, nome)):
+                # Blocos diferentes podem vir com o mesmo nome
+                raiz, ext = os.path.splitext(nome)
+                nome = f"{raiz}_{uuid.uuid4().hex[:8]}{ext}"
+            caminho = os.path.join(pasta, nome)
+            parcial = caminho + ".part"
+            tamanho = 0
+            try:
+                with open(parcial, "wb") as arquivo:
+                    arquivo.write(primeiro)
+                    tamanho += len(primeiro)
+                    for bloco in blocos:
+                        arquivo.write(bloco)
+                        tamanho += len(bloco)
+                os.replace(parcial, caminho)
+            except BaseException:
+                if os.path.exists(parcial):
+                    os.remove(parcial)
+                raise
+        return CONCLUIDO, Download(nome, caminho, tamanho, inicio, time.time())
+
+    def _nome_arquivo(self, resposta, pagina_ini, pagina_fim):
+        achado = _RE_NOME_ARQUIVO.search(resposta.headers.get("Content-Disposition", ""))
+        if achado:
+            nome = os.path.basename(achado.group(1).strip())
+            if nome:
+                return nome
+        sufixo = f"{pagina_ini}-{pagina_fim}" if pagina_ini is not None else "todos"
+        return f"xml_{sufixo}_{uuid.uuid4().hex[:8]}.zip"
+
+    def fechar(self):
+        # Só fecha a sessão; o adaptador (pool de conexões) é compartilhado
+        self.http.cookies.clear()
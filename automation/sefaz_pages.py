@@ -0,0 +1,337 @@
+import re
+import time
+import threading
+from contextlib import contextmanager
+from selenium.webdriver.common.by import By
+from selenium.webdriver.support.ui import WebDriverWait, Select
+from selenium.webdriver.support import expected_conditions as EC
+from selenium.common.exceptions import (
+    TimeoutException, NoSuchElementException, StaleElementReferenceException
+)
+from config.config import SEFAZ_URL_LOGIN, PAGINA_TIMEOUT, PAGINA_POLL
+from utils.limitador import get_limitador, LOGIN, PESQUISA, DOWNLOAD
+
+# Resultados possíveis de uma pesquisa na tela "Baixar XML NFE"
+RESULTADOS = "RESULTADOS"
+SEM_RESULTADOS = "SEM_RESULTADOS"
+PERMISSAO_NEGADA = "PERMISSAO_NEGADA"
+ALERTA_DATA = "ALERTA_DATA"
+
+# Situações do modal de download
+CONCLUIDO = "CONCLUIDO"
+ERRO_INTERNO = "ERRO_INTERNO"
+
+ALERTAS_DATA = [
+    "A data inicial é obrigatória",
+    "A data final é obrigatória",
+    "A data inicial é inválida",
+    "A data final é inválida"
+]
+
+XP_ALERTA = "//div[contains(@class,'alert-danger')]"
+XP_PERMISSAO = "//label[contains(.,'Você não tem permissão para acessar esta página')]"
+XP_BAIXAR_TODOS = "//button[contains(@class, 'btn-download-all')]"
+XP_TOTAL_NOTAS = "//div[contains(@class, 'table-legend-right-container')]/div"
+XP_ULTIMA_PAGINA = "//*[@id='pagination-container']/div/ul/li[last()]"
+XP_LINK_BAIXAR_XML = "//a[contains(text(),'Baixar XML NFE')]"
+XP_MODAL_BAIXAR = "//button[contains(@class,'btn-info') and contains(.,'Baixar')]"
+XP_MODAL_CONCLUIDO = "//div[contains(@class, 'modal-content')]//h4[contains(.,'Concluído')]"
+XP_MODAL_FECHAR = "/html/body/div[5]/div/div/div[3]/button[2]"
+XP_ERRO_INTERNO = "//div[contains(@class,'alert-danger') and contains(.,'erro interno ao realizar o download')]"
+XP_ERRO_LOGIN = "//*[@id='richValidationBox7']"
+
+# Se o portal reaproveitar o mesmo elemento de resultado da pesquisa anterior,
+# depois desse tempo (s) o que estiver na tela é aceito como resposta.
+TOLERANCIA_REUSO = 5
+
+
+class EstatisticasTransicao:
+    """Tempo gasto em cada transição de tela (quantidade, média, máximo e falhas)."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._dados = {}
+
+    def registrar(self, nome, duracao, ok=True):
+        with self._lock:
+            d = self._dados.setdefault(nome, {"qtd": 0, "total": 0.0, "max": 0.0, "falhas": 0})
+            d["qtd"] += 1
+            d["total"] += duracao
+            d["max"] = max(d["max"], duracao)
+            if not ok:
+                d["falhas"] += 1
+
+    def dados(self):
+        with self._lock:
+            return {nome: dict(d) for nome, d in self._dados.items()}
+
+    def resumo(self):
+        partes = []
+        for nome, d in sorted(self.dados().items()):
+            media = d["total"] / d["qtd"] if d["qtd"] else 0
+            partes.append(f"{nome}: n={d['qtd']} média={media:.2f}s máx={d['max']:.2f}s falhas={d['falhas']}")
+        return " | ".join(partes)
+
+    def zerar(self):
+        with self._lock:
+            self._dados.clear()
+
+
+ESTATISTICAS = EstatisticasTransicao()
+
+
+@contextmanager
+def medir(nome):
+    inicio = time.monotonic()
+    ok = False
+    try:
+        yield
+        ok = True
+    finally:
+        ESTATISTICAS.registrar(nome, time.monotonic() - inicio, ok)
+
+
+def aguardar(driver, condicao, timeout=PAGINA_TIMEOUT, mensagem=""):
+    """WebDriverWait com polling curto, ignorando elementos que somem/são recriados durante a checagem."""
+    return WebDriverWait(
+        driver, timeout, poll_frequency=PAGINA_POLL,
+        ignored_exceptions=(NoSuchElementException, StaleElementReferenceException)
+    ).until(condicao, mensagem)
+
+
+def visivel(driver, xpath):
+    try:
+        return any(el.is_displayed() for el in driver.find_elements(By.XPATH, xpath))
+    except StaleElementReferenceException:
+        return False
+
+
+def _digitos(valor):
+    return re.sub(r"\D", "", valor or "")
+
+
+def preencher_campo(driver, elemento_id, valor, timeout=5):
+    """
+    Limpa e digita no campo, esperando o valor aparecer (só os dígitos são comparados,
+    porque os campos de data têm máscara). Substitui os sleeps entre clear() e send_keys().
+    """
+    valor = str(valor)
+    campo = aguardar(driver, EC.element_to_be_clickable((By.ID, elemento_id)), timeout)
+    campo.clear()
+    campo.send_keys(valor)
+    esperado = _digitos(valor) or valor
+    aguardar(
+        driver,
+        lambda d: (_digitos(d.find_element(By.ID, elemento_id).get_attribute("value")) or
+                   d.find_element(By.ID, elemento_id).get_attribute("value")) == esperado,
+        timeout, f"Campo {elemento_id} não ficou com o valor {valor}."
+    )
+
+
+class PaginaLogin:
+
+    def __init__(self, driver, url=SEFAZ_URL_LOGIN):
+        self.driver = driver
+        self.url = url
+
+    def autenticar(self, cpf, senha, timeout=8):
+        """Levanta Exception("INVALID_LOGIN") se continuar na tela de login."""
+        driver = self.driver
+        get_limitador().aguardar(LOGIN)
+        with medir("login"):
+            driver.set_page_load_timeout(90)
+            driver.get(self.url)
+            aguardar(driver, EC.presence_of_element_located((By.ID, "NetAccess.Login"))).send_keys(cpf)
+            driver.find_element(By.ID, "NetAccess.Password").send_keys(senha)
+            driver.find_element(By.ID, "btnAuthenticate").click()
+
+            # Login com sucesso (saiu da tela de login) OU alerta de erro visível
+            try:
+                aguardar(driver, lambda d: "acessoRestrito/login" not in d.current_url or visivel(d, XP_ERRO_LOGIN), timeout)
+            except TimeoutException:
+                pass
+
+            if "acessoRestrito/login" in driver.current_url:
+                raise Exception("INVALID_LOGIN")
+
+
+class AreaRestrita:
+    """Área logada do portal: iframe 'iNetaccess' e o menu 'Baixar XML NFE'."""
+
+    def __init__(self, driver):
+        self.driver = driver
+
+    def entrar_iframe(self, timeout=PAGINA_TIMEOUT):
+        with medir("iframe"):
+            aguardar(self.driver, EC.frame_to_be_available_and_switch_to_it((By.ID, "iNetaccess")), timeout)
+
+    def abrir_baixar_xml(self, timeout=PAGINA_TIMEOUT):
+        with medir("abrir_baixar_xml"):
+            aguardar(self.driver, EC.element_to_be_clickable((By.XPATH, XP_LINK_BAIXAR_XML)), timeout).click()
+            aguardar(self.driver, EC.element_to_be_clickable((By.ID, "btnPesquisar")), timeout)
+        return FormularioBusca(self.driver)
+
+    def recarregar(self):
+        self.driver.refresh()
+        self.entrar_iframe()
+        return self.abrir_baixar_xml()
+
+
+class FormularioBusca:
+
+    def __init__(self, driver):
+        self.driver = driver
+
+    def preencher_periodo(self, ini, fim):
+        with medir("preencher_datas"):
+            preencher_campo(self.driver, "cmpDataInicial", ini)
+            preencher_campo(self.driver, "cmpDataFinal", fim)
+
+    def preencher_ie(self, ie):
+        preencher_campo(self.driver, "cmpNumIeDest", ie)
+
+    def selecionar_operacao(self, tipo_oper):
+        # Operação "1" marca o rádio de valor 0 e vice-versa
+        valor = "0" if tipo_oper == "1" else "1"
+        self.driver.find_element(By.XPATH, f"//input[@id='cmpTipoNota' and @value='{valor}']").click()
+
+    def selecionar_modelo(self, valor="-"):
+        Select(self.driver.find_element(By.ID, "cmpModelo")).select_by_value(valor)
+
+    def _estado(self):
+        """Lista (resultado, detalhe, elemento) do que está na tela agora, do mais para o menos prioritário."""
+        driver = self.driver
+        achados = []
+        for el in driver.find_elements(By.XPATH, XP_PERMISSAO):
+            if el.is_displayed():
+                achados.append((PERMISSAO_NEGADA, el.text, el))
+        for el in driver.find_elements(By.XPATH, XP_ALERTA):
+            if not el.is_displayed():
+                continue
+            texto = el.text
+            alerta = next((a for a in ALERTAS_DATA if a in texto), None)
+            if alerta:
+                achados.append((ALERTA_DATA, alerta, el))
+            elif "Sem Resultados!" in texto:
+                achados.append((SEM_RESULTADOS, texto, el))
+        for el in driver.find_elements(By.XPATH, XP_BAIXAR_TODOS):
+            achados.append((RESULTADOS, "", el))
+        return achados
+
+    def pesquisar(self, timeout=PAGINA_TIMEOUT):
+        """
+        Clica em 'Pesquisar' e espera a resposta da pesquisa. Só aceita elementos que não
+        estavam na tela antes do clique, para não confundir com o resultado da pesquisa anterior.
+        Retorna (resultado, detalhe).
+        """
+        try:
+            anteriores = {el.id for _, _, el in self._estado()}
+        except StaleElementReferenceException:
+            anteriores = set()
+        inicio = time.monotonic()
+
+        def resposta(_):
+            estado = self._estado()
+            for resultado, detalhe, el in estado:
+                if el.id not in anteriores:
+                    return resultado, detalhe
+            if estado and time.monotonic() - inicio > TOLERANCIA_REUSO:
+                return estado[0][0], estado[0][1]
+            return False
+
+        get_limitador().aguardar(PESQUISA)
+        with medir("pesquisar"):
+            self.driver.find_element(By.ID, "btnPesquisar").click()
+            return aguardar(self.driver, resposta, timeout, "Pesquisa sem resposta do portal.")
+
+    def buscar(self, ini, fim, tipo_oper=None, max_tentativas=3, ao_alerta=None):
+        """
+        Marca a operação, preenche as datas e pesquisa uma única vez. Se o portal acusar
+        erro de data (obrigatória/inválida), repreenche e pesquisa de novo até `max_tentativas`.
+        Retorna (resultado, detalhe).
+        """
+        if tipo_oper is not None:
+            self.selecionar_operacao(tipo_oper)
+        for tentativa in range(1, max_tentativas + 1):
+            self.preencher_periodo(ini, fim)
+            resultado, detalhe = self.pesquisar()
+            if resultado != ALERTA_DATA:
+                return resultado, detalhe
+            if ao_alerta:
+                ao_alerta(tentativa, detalhe)
+        raise Exception(f"Erro ao preencher datas {ini} a {fim}: não conseguiu validar após {max_tentativas} tentativas.")
+
+
+class TabelaResultados:
+
+    def __init__(self, driver):
+        self.driver = driver
+
+    def total_notas(self, timeout=PAGINA_TIMEOUT):
+        legenda = aguardar(
+            self.driver,
+            lambda d: d.find_element(By.XPATH, XP_TOTAL_NOTAS).text.strip().isdigit() and d.find_element(By.XPATH, XP_TOTAL_NOTAS),
+            timeout, "Total de notas não apareceu na tabela de resultados."
+        )
+        return int(legenda.text.strip())
+
+    def ultima_pagina(self):
+        return int(self.driver.find_element(By.XPATH, XP_ULTIMA_PAGINA).get_attribute("data"))
+
+
+class ModalDownload:
+
+    def __init__(self, driver):
+        self.driver = driver
+        self._botao = None
+        self._confirmado_em = None
+
+    def _abrir(self, timeout):
+        aguardar(self.driver, EC.element_to_be_clickable((By.XPATH, XP_BAIXAR_TODOS)), timeout).click()
+
+    def abrir_tudo(self, timeout=PAGINA_TIMEOUT):
+        with medir("abrir_modal"):
+            self._abrir(timeout)
+            aguardar(self.driver, EC.visibility_of_element_located((By.XPATH, XP_MODAL_BAIXAR)), timeout)
+        self._botao = (By.XPATH, XP_MODAL_BAIXAR)
+
+    def abrir_paginas(self, pagina_ini, pagina_fim, timeout=PAGINA_TIMEOUT):
+        with medir("abrir_modal"):
+            self._abrir(timeout)
+            aguardar(self.driver, EC.presence_of_element_located((By.ID, "campoSelectTipodwnload")), timeout)
+            Select(self.driver.find_element(By.ID, "campoSelectTipodwnload")).select_by_value("4")
+            preencher_campo(self.driver, "cmpPagIni", pagina_ini)
+            preencher_campo(self.driver, "cmpPagFin", pagina_fim)
+        self._botao = (By.ID, "dnwld-all-btn-ok")
+
+    def confirmar(self):
+        if self._botao is None:
+            raise Exception("Modal de download não foi aberto.")
+        get_limitador().aguardar(DOWNLOAD)
+        self.driver.find_element(*self._botao).click()
+        self._confirmado_em = time.monotonic()
+
+    def aguardar_conclusao(self, timeout):
+        """Espera 'Concluído' ou o alerta de erro interno. Levanta TimeoutException se nenhum aparecer."""
+        def situacao(d):
+            if visivel(d, XP_MODAL_CONCLUIDO):
+                return CONCLUIDO
+            if visivel(d, XP_ERRO_INTERNO):
+                return ERRO_INTERNO
+            return False
+
+        inicio = self._confirmado_em or time.monotonic()
+        try:
+            resultado = aguardar(self.driver, situacao, timeout, "Download não concluiu no portal.")
+        except TimeoutException:
+            ESTATISTICAS.registrar("download_portal", time.monotonic() - inicio, ok=False)
+            raise
+        ESTATISTICAS.registrar("download_portal", time.monotonic() - inicio, ok=resultado == CONCLUIDO)
+        if resultado == ERRO_INTERNO:
+            get_limitador().sinalizar_limitacao()
+        return resultado
+
+    def fechar(self, timeout=PAGINA_TIMEOUT):
+        with medir("fechar_modal"):
+            self.driver.find_element(By.XPATH, XP_MODAL_FECHAR).click()
+            aguardar(self.driver, EC.invisibility_of_element_located((By.XPATH, XP_MODAL_CONCLUIDO)), timeout)
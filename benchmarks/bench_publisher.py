@@ -0,0 +1,58 @@
+"""
+Compara mensagens/s publicando status pelo caminho antigo (uma conexão por
+mensagem) e pelo PublisherService (conexões persistentes).
+
+Uso:
+    python -m benchmarks.bench_publisher --mensagens 500 --threads 8
+"""
+import time
+import argparse
+from concurrent.futures import ThreadPoolExecutor
+from benchmarks.broker_falso import BrokerFalso
+from api.rabbitmq_publisher import PublisherService
+
+FILA = 'retorno-consulta-xml'
+
+
+def publicar_conexao_por_mensagem(broker, mensagem):
+    # Mesmo fluxo que enviar_retorno/atualizar_status_parcial faziam antes
+    connection = broker.conectar()
+    channel = connection.channel()
+    channel.queue_declare(queue=FILA, durable=True)
+    channel.basic_publish(exchange='', routing_key=FILA, body=str(mensagem))
+    connection.close()
+
+
+def medir(nome, publicar, mensagens, threads):
+    inicio = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=threads) as executor:
+        list(executor.map(publicar, range(mensagens)))
+    duracao = time.perf_counter() - inicio
+    print(f"{nome:<28} {mensagens:>6} msgs em {duracao:7.2f}s -> {mensagens / duracao:9.1f} msgs/s")
+    return mensagens / duracao
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--mensagens", type=int, default=300)
+    parser.add_argument("--threads", type=int, default=4)
+    parser.add_argument("--conexoes", type=int, default=2)
+    parser.add_argument("--latencia-conexao", type=float, default=0.03)
+    parser.add_argument("--latencia-publicacao", type=float, default=0.001)
+    args = parser.parse_args()
+
+    broker = BrokerFalso(args.latencia_conexao, args.latencia_publicacao)
+    antigo = medir("conexão por mensagem", lambda i: publicar_conexao_por_mensagem(broker, i),
+                   args.mensagens, args.threads)
+
+    broker = BrokerFalso(args.latencia_conexao, args.latencia_publicacao)
+    servico = PublisherService(conexao_factory=broker.conectar, conexoes=args.conexoes)
+    novo = medir("PublisherService", lambda i: servico.publicar(FILA, {"i": i}),
+                 args.mensagens, args.threads)
+    servico.encerrar()
+
+    print(f"Ganho: {novo / antigo:.1f}x (confirmadas pelo PublisherService: {broker.total(FILA)})")
+
+
+if __name__ == "__main__":
+    main()
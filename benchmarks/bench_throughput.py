@@ -0,0 +1,225 @@
+"""
+Throughput de ponta a ponta: o consumidor real (consume_messages + process_message
++ pool de Chrome) contra o portal falso e o broker falso, com concorrência 1..N.
+
+Reporta jobs/hora, latência por IE (da entrega da mensagem até o status
+"Processando i/n - IE x" daquela IE) e o pico de RSS do processo somado aos
+Chrome/chromedriver filhos. Precisa de Chrome + chromedriver, como em produção.
+
+Uso:
+    python -m benchmarks.bench_throughput --jobs 6 --concorrencia 1 2 4 --ies 2 --dias 60
+    python -m benchmarks.bench_throughput --motor http --erro-interno 0.1
+"""
+import os
+import json
+import time
+import socket
+import shutil
+import argparse
+import tempfile
+import threading
+from collections import Counter
+from datetime import date, timedelta
+from types import SimpleNamespace
+
+
+def porta_livre():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def percentil(valores, p):
+    if not valores:
+        return 0.0
+    ordenados = sorted(valores)
+    return ordenados[min(len(ordenados) - 1, int(round(p / 100 * (len(ordenados) - 1))))]
+
+
+class AmostradorMemoria(threading.Thread):
+    """Pico de RSS do processo + filhos (Chrome, chromedriver)."""
+
+    def __init__(self, intervalo=0.2):
+        super().__init__(daemon=True)
+        import psutil
+        self.processo = psutil.Process()
+        self.intervalo = intervalo
+        self.pico = 0
+        self._parar = threading.Event()
+
+    def amostrar(self):
+        total = 0
+        for p in [self.processo] + self.processo.children(recursive=True):
+            try:
+                total += p.memory_info().rss
+            except Exception:
+                pass
+        self.pico = max(self.pico, total)
+
+    def run(self):
+        while not self._parar.wait(self.intervalo):
+            self.amostrar()
+
+    def parar(self):
+        self._parar.set()
+        self.join()
+        self.amostrar()
+
+
+def criar_job(rodada, i, args):
+    ini = date(2024, 1, 1)
+    fim = ini + timedelta(days=args.dias - 1)
+    mensagem = {
+        "id": f"bench-{rodada}-{i}",
+        "dataInicial": f"{ini.isoformat()}T00:00:00",
+        "dataFinal": f"{fim.isoformat()}T00:00:00",
+        "contador": {"cpf": f"{i % args.contadores:011d}", "senha": "bench"},
+        "empresas": [{"ie": f"10{i:05d}{k:02d}", "oper": args.oper} for k in range(args.ies)],
+    }
+    propriedades = SimpleNamespace(headers={"identificador": f"EMP{i:04d}", "token": "bench"})
+    return mensagem, propriedades
+
+
+def executar_rodada(concorrencia, args, broker, portal):
+    from config.config import RABBITMQ_QUEUE_IN, RABBITMQ_QUEUE_OUT
+    from api.rabbitmq_consumer import consume_messages
+    from automation import driver_pool
+    import message_processor
+
+    # Pool novo a cada rodada: logins e Chrome aquecidos não passam de uma rodada para outra
+    if driver_pool._pool is not None:
+        driver_pool._pool.encerrar()
+        driver_pool._pool = None
+
+    ids = set()
+    for i in range(args.jobs):
+        mensagem, propriedades = criar_job(concorrencia, i, args)
+        ids.add(mensagem["id"])
+        broker.enfileirar(RABBITMQ_QUEUE_IN, json.dumps(mensagem), propriedades)
+
+    base = broker.confirmadas + broker.descartadas
+    portal_antes = dict(portal.contadores)
+    parar = threading.Event()
+    memoria = AmostradorMemoria()
+    memoria.start()
+    inicio = time.time()
+    consumidor = threading.Thread(
+        target=consume_messages, name="bench-consumidor", daemon=True,
+        kwargs=dict(max_workers=concorrencia, parar=parar, conexao_factory=broker.conectar,
+                    processar=message_processor.process_message)
+    )
+    consumidor.start()
+    while broker.confirmadas + broker.descartadas - base < args.jobs and time.time() - inicio < args.timeout:
+        time.sleep(0.2)
+    duracao = time.time() - inicio
+    parar.set()
+    consumidor.join(60)
+    memoria.parar()
+
+    entregas = {}
+    for instante, _, _, body in broker.eventos("entregue", RABBITMQ_QUEUE_IN):
+        entregas.setdefault(json.loads(body)["id"], instante)
+    latencias, finais = [], Counter()
+    for instante, _, _, body in broker.eventos("publicada", RABBITMQ_QUEUE_OUT):
+        payload = json.loads(body)
+        if payload.get("id") not in ids:
+            continue
+        if payload["status"] == "PROCESSING":
+            if " - IE " in payload.get("obs", "") and payload["id"] in entregas:
+                latencias.append(instante - entregas[payload["id"]])
+        else:
+            finais[payload["status"]] += 1
+
+    concluidos = broker.confirmadas + broker.descartadas - base
+    return {
+        "concorrencia": concorrencia,
+        "jobs": concluidos,
+        "duracao": duracao,
+        "jobs_hora": concluidos / duracao * 3600 if duracao else 0,
+        "ie_p50": percentil(latencias, 50),
+        "ie_p95": percentil(latencias, 95),
+        "ie_max": max(latencias) if latencias else 0,
+        "pico_rss_mb": memoria.pico / 1024 / 1024,
+        "finais": dict(finais),
+        "portal": {k: portal.contadores[k] - portal_antes.get(k, 0) for k in portal.contadores},
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--jobs", type=int, default=4, help="mensagens consulta-xml por rodada")
+    parser.add_argument("--concorrencia", type=int, nargs="+", default=[1, 2, 4])
+    parser.add_argument("--ies", type=int, default=2, help="IEs por mensagem")
+    parser.add_argument("--dias", type=int, default=60, help="tamanho do período de cada mensagem")
+    parser.add_argument("--oper", default="Todos")
+    parser.add_argument("--contadores", type=int, default=2, help="CPFs de contador distintos")
+    parser.add_argument("--motor", choices=["interface", "http"], default="interface")
+    parser.add_argument("--latencia", type=float, default=0.05)
+    parser.add_argument("--latencia-por-nota", type=float, default=0.0005)
+    parser.add_argument("--notas-por-dia", type=int, default=30)
+    parser.add_argument("--erro-interno", type=float, default=0.0)
+    parser.add_argument("--sem-resultados", type=float, default=0.0)
+    parser.add_argument("--permissao-negada", type=float, default=0.0)
+    parser.add_argument("--timeout", type=float, default=1800, help="limite (s) de cada rodada")
+    parser.add_argument("--com-janela", action="store_true", help="não usar Chrome headless")
+    parser.add_argument("--manter", action="store_true", help="não apagar a pasta temporária")
+    args = parser.parse_args()
+
+    # config.config lê essas variáveis na importação: tem que vir antes de importar o projeto
+    pasta = tempfile.mkdtemp(prefix="bench-throughput-")
+    porta = porta_livre()
+    os.environ["SEFAZ_URL_BASE"] = f"http://127.0.0.1:{porta}"
+    os.environ["DOWNLOAD_STAGING_DIRECTORY"] = os.path.join(pasta, "staging")
+    os.environ["SEFAZ_HTTP_ATIVO"] = "1" if args.motor == "http" else "0"
+    os.environ.setdefault("CHROME_HEADLESS", "0" if args.com_janela else "1")
+    os.makedirs(os.environ["DOWNLOAD_STAGING_DIRECTORY"], exist_ok=True)
+
+    from benchmarks.portal_falso import PortalFalso
+    from benchmarks.broker_falso import BrokerFalso
+    from api import rabbitmq_publisher
+    from automation import driver_pool
+    from utils.logger import flush_logs
+    from utils import checkpoints, armazem
+    import message_processor
+
+    portal = PortalFalso(
+        porta=porta, latencia=args.latencia, latencia_por_nota=args.latencia_por_nota,
+        notas_por_dia=args.notas_por_dia,
+        erros={"erro_interno": args.erro_interno, "sem_resultados": args.sem_resultados,
+               "permissao_negada": args.permissao_negada}
+    ).iniciar()
+    broker = BrokerFalso(latencia_conexao=0, latencia_publicacao=0)
+    # Status e retornos vão para o broker falso; XMLs para a pasta temporária; nada para o Discord
+    rabbitmq_publisher._publisher = rabbitmq_publisher.PublisherService(conexao_factory=broker.conectar)
+    rabbitmq_publisher._publisher.iniciar()
+    message_processor.XMLS_DIRECTORY = os.path.join(pasta, "xmls")
+    message_processor.enviar_discord_mensagem = lambda *a, **k: None
+    # Checkpoints/cobertura e armazém também na pasta temporária, nunca os de LOG_CONTROLE
+    checkpoints._checkpoints = checkpoints.CheckpointStore(os.path.join(pasta, "checkpoints.sqlite3"))
+    armazem._armazem = armazem.ArmazemXml(os.path.join(pasta, "xmls", "_armazem"))
+    # Toda rodada pede os mesmos cpf/IEs/datas: com cobertura ou plano adaptativo, as rodadas
+    # seguintes aproveitariam os ZIPs e o histórico da primeira em vez de ir ao portal falso
+    message_processor.COBERTURA_ATIVA = False
+    message_processor.PLANO_ADAPTATIVO = False
+
+    print(f"Portal falso em {portal.url} | motor {args.motor} | {args.jobs} jobs x {args.ies} IEs x {args.dias} dias")
+    print(f"{'conc':>4} {'jobs':>5} {'tempo':>8} {'jobs/h':>9} {'IE p50':>8} {'IE p95':>8} {'IE máx':>8} {'pico RSS':>10}  status / portal")
+    try:
+        for concorrencia in args.concorrencia:
+            r = executar_rodada(concorrencia, args, broker, portal)
+            print(f"{r['concorrencia']:>4} {r['jobs']:>5} {r['duracao']:>7.1f}s {r['jobs_hora']:>9.1f} "
+                  f"{r['ie_p50']:>7.1f}s {r['ie_p95']:>7.1f}s {r['ie_max']:>7.1f}s {r['pico_rss_mb']:>8.0f}MB  "
+                  f"{r['finais']} logins={r['portal']['logins']} pesquisas={r['portal']['pesquisas']} "
+                  f"downloads={r['portal']['downloads']} erros_internos={r['portal']['erros_internos']}")
+    finally:
+        if driver_pool._pool is not None:
+            driver_pool._pool.encerrar()
+        rabbitmq_publisher._publisher.encerrar()
+        flush_logs()
+        portal.encerrar()
+        if not args.manter:
+            shutil.rmtree(pasta, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,200 @@
+import time
+import queue
+import itertools
+import threading
+from types import SimpleNamespace
+from collections import defaultdict, deque
+
+
+class BrokerFalso:
+    """
+    Stand-in local do RabbitMQ para benchmarks, com a mesma superfície do
+    pika.BlockingConnection usada pelo projeto (channel, queue_declare,
+    basic_publish, confirm_delivery, process_data_events, close) e do lado
+    consumidor (basic_qos, basic_consume, basic_cancel, basic_ack, basic_nack).
+
+    `latencia_conexao` simula o handshake TCP + AMQP de uma conexão nova e
+    `latencia_publicacao` o round-trip de um basic_publish (com confirm).
+    Filas declaradas com x-message-ttl e x-dead-letter-routing-key (exchange
+    padrão) mandam as mensagens vencidas para a fila de dead-letter, como as
+    filas de atraso do RabbitMQ.
+    """
+
+    def __init__(self, latencia_conexao=0.03, latencia_publicacao=0.001):
+        self.latencia_conexao = latencia_conexao
+        self.latencia_publicacao = latencia_publicacao
+        self.filas = defaultdict(deque)
+        self.argumentos = {}
+        # fila com TTL -> instantes de expiração, na mesma ordem das mensagens da fila
+        self.expiracoes = defaultdict(deque)
+        self.conexoes_abertas = 0
+        self.lock = threading.Lock()
+        # (instante, evento, fila, body) de cada publicação/entrega/ack/nack
+        self.historico = []
+        self.confirmadas = 0
+        self.descartadas = 0
+
+    def conectar(self):
+        time.sleep(self.latencia_conexao)
+        with self.lock:
+            self.conexoes_abertas += 1
+        return ConexaoFalsa(self)
+
+    def total(self, fila):
+        with self.lock:
+            return len(self.filas[fila])
+
+    def enfileirar(self, fila, body, properties=None):
+        with self.lock:
+            self.publicar(fila, body, properties)
+
+    def publicar(self, fila, body, properties=None):
+        """Chamado com o lock: enfileira respeitando o TTL da fila."""
+        self.filas[fila].append((body, properties, False))
+        self.historico.append((time.time(), "publicada", fila, body))
+        ttl = self.argumentos.get(fila, {}).get("x-message-ttl")
+        if ttl is not None:
+            self.expiracoes[fila].append(time.time() + ttl / 1000)
+
+    def expirar(self):
+        """Move as mensagens com TTL vencido para a fila de dead-letter. Retorna quantas moveu."""
+        agora = time.time()
+        movidas = 0
+        with self.lock:
+            for fila, prazos in list(self.expiracoes.items()):
+                destino = self.argumentos[fila].get("x-dead-letter-routing-key")
+                while prazos and prazos[0] <= agora:
+                    prazos.popleft()
+                    body, properties, _ = self.filas[fila].popleft()
+                    self.historico.append((agora, "expirada", fila, body))
+                    if destino:
+                        self.publicar(destino, body, properties)
+                    movidas += 1
+        return movidas
+
+    def eventos(self, evento=None, fila=None):
+        with self.lock:
+            return [h for h in self.historico if (evento is None or h[1] == evento) and (fila is None or h[2] == fila)]
+
+
+class ConexaoFalsa:
+    def __init__(self, broker):
+        self.broker = broker
+        self.is_open = True
+        self.is_closed = False
+        self.canais = []
+        self._callbacks = queue.Queue()
+
+    def channel(self):
+        canal = CanalFalso(self)
+        self.canais.append(canal)
+        return canal
+
+    def process_data_events(self, time_limit=0):
+        # Como no pika: entrega mensagens e roda os callbacks agendados na thread de quem chamou
+        if self.is_closed:
+            raise Exception("Conexão fechada")
+        limite = time.time() + (time_limit or 0)
+        while True:
+            trabalhou = False
+            while True:
+                try:
+                    self._callbacks.get_nowait()()
+                    trabalhou = True
+                except queue.Empty:
+                    break
+            trabalhou = self.broker.expirar() > 0 or trabalhou
+            for canal in self.canais:
+                trabalhou = canal._entregar() or trabalhou
+            restante = limite - time.time()
+            if restante <= 0:
+                return
+            if not trabalhou:
+                try:
+                    self._callbacks.get(timeout=min(restante, 0.05))()
+                except queue.Empty:
+                    pass
+
+    def add_callback_threadsafe(self, callback):
+        self._callbacks.put(callback)
+
+    def close(self):
+        if self.is_open:
+            self.is_open = False
+            self.is_closed = True
+            with self.broker.lock:
+                self.broker.conexoes_abertas -= 1
+
+
+class CanalFalso:
+    def __init__(self, conexao):
+        self.conexao = conexao
+        self.is_open = True
+        self.prefetch = 0
+        self.consumidores = {}
+        self.nao_confirmadas = {}
+        self._tags = itertools.count(1)
+
+    def confirm_delivery(self):
+        pass
+
+    def queue_declare(self, queue, durable=False, arguments=None):
+        broker = self.conexao.broker
+        time.sleep(broker.latencia_publicacao)
+        with broker.lock:
+            if queue in broker.argumentos and broker.argumentos[queue] != (arguments or {}):
+                raise Exception(f"PRECONDITION_FAILED - argumentos diferentes para a fila '{queue}'")
+            broker.argumentos[queue] = dict(arguments or {})
+
+    def basic_publish(self, exchange, routing_key, body, properties=None, mandatory=False):
+        if self.conexao.is_closed:
+            raise Exception("Conexão fechada")
+        broker = self.conexao.broker
+        time.sleep(broker.latencia_publicacao)
+        with broker.lock:
+            broker.publicar(routing_key, body, properties)
+
+    def basic_qos(self, prefetch_count=0, global_qos=False):
+        self.prefetch = prefetch_count
+
+    def basic_consume(self, queue, on_message_callback, auto_ack=False):
+        tag = f"ctag-{next(self._tags)}"
+        self.consumidores[tag] = (queue, on_message_callback)
+        return tag
+
+    def basic_cancel(self, consumer_tag):
+        self.consumidores.pop(consumer_tag, None)
+
+    def _entregar(self):
+        broker = self.conexao.broker
+        entregou = False
+        for fila, callback in list(self.consumidores.values()):
+            while not self.prefetch or len(self.nao_confirmadas) < self.prefetch:
+                with broker.lock:
+                    if not broker.filas[fila]:
+                        break
+                    body, properties, redelivered = broker.filas[fila].popleft()
+                    broker.historico.append((time.time(), "entregue", fila, body))
+                delivery_tag = next(self._tags)
+                self.nao_confirmadas[delivery_tag] = (fila, body, properties)
+                metodo = SimpleNamespace(delivery_tag=delivery_tag, redelivered=redelivered, routing_key=fila)
+                callback(self, metodo, properties, body)
+                entregou = True
+        return entregou
+
+    def basic_ack(self, delivery_tag):
+        fila, body, _ = self.nao_confirmadas.pop(delivery_tag)
+        broker = self.conexao.broker
+        with broker.lock:
+            broker.confirmadas += 1
+            broker.historico.append((time.time(), "ack", fila, body))
+
+    def basic_nack(self, delivery_tag, requeue=True):
+        fila, body, properties = self.nao_confirmadas.pop(delivery_tag)
+        broker = self.conexao.broker
+        with broker.lock:
+            if requeue:
+                broker.filas[fila].appendleft((body, properties, True))
+            else:
+                broker.descartadas += 1
+            broker.historico.append((time.time(), "nack", fila, body))
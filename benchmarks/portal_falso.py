@@ -0,0 +1,448 @@
+"""
+Stand-in local do portal da SEFAZ-GO para benchmarks e testes de ponta a ponta.
+
+Imita o que a automação usa do portal: tela de login (NetAccess.Login /
+NetAccess.Password / btnAuthenticate / richValidationBox7), área restrita com o
+iframe 'iNetaccess', menu 'Baixar XML NFE', formulário de busca com os alertas
+'alert-danger', legenda de total, paginação e o modal de download
+(campoSelectTipodwnload / cmpPagIni / cmpPagFin / 'Concluído'). Os mesmos
+endpoints de pesquisa/download atendem o motor HTTP (automation.http_engine).
+
+As notas são geradas de forma determinística por (cpf, operação, dia): períodos
+que se sobrepõem devolvem as mesmas chaves. Latência, volume e erros são configuráveis.
+
+Uso:
+    python -m benchmarks.portal_falso --porta 8088 --notas-por-dia 80 --erro-interno 0.1
+    SEFAZ_URL_BASE=http://127.0.0.1:8088 python main.py
+"""
+import io
+import time
+import uuid
+import zlib
+import random
+import argparse
+import threading
+import zipfile
+from datetime import datetime, timedelta
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from http.cookies import SimpleCookie
+from urllib.parse import parse_qs, urlsplit
+from config.config import SEFAZ_HTTP_PESQUISA, SEFAZ_HTTP_DOWNLOAD
+
+CAMINHO_LOGIN = "/netaccess/000System/acessoRestrito/login/"
+CAMINHO_AREA = "/netaccess/000System/acessoRestrito/"
+CAMINHO_MENU = "/netaccess/000System/acessoRestrito/menu/"
+CAMINHO_FORMULARIO = "/nfeweb/sites/nfe/baixar-xml/"
+COOKIE_SESSAO = "JSESSIONID"
+NOTAS_POR_PAGINA = 20
+LIMITE_DOWNLOAD_UNICO = 10000
+
+PAGINA_LOGIN = """<!DOCTYPE html>
+<html><head><meta charset="utf-8"><title>Acesso Restrito</title></head>
+<body>
+<form method="post" action="{login}">
+  <input id="NetAccess.Login" name="login" type="text">
+  <input id="NetAccess.Password" name="senha" type="password">
+  <button id="btnAuthenticate" type="submit">Autenticar</button>
+</form>
+{erro}
+</body></html>"""
+
+PAGINA_AREA = """<!DOCTYPE html>
+<html><head><meta charset="utf-8"><title>Área Restrita</title></head>
+<body><iframe id="iNetaccess" src="{menu}" style="width:100%;height:900px"></iframe></body></html>"""
+
+PAGINA_MENU = """<!DOCTYPE html>
+<html><head><meta charset="utf-8"></head>
+<body><ul><li><a href="{formulario}">Baixar XML NFE</a></li></ul></body></html>"""
+
+# O modal precisa ser o 5º div do body: a automação fecha pelo XPath
+# /html/body/div[5]/div/div/div[3]/button[2]
+PAGINA_FORMULARIO = """<!DOCTYPE html>
+<html><head><meta charset="utf-8"><title>Baixar XML NFE</title>
+<style>.modal{{position:fixed;top:10%;left:20%;background:#fff;border:1px solid #999;padding:10px}}</style>
+</head>
+<body>
+<div id="formulario">
+  <input id="cmpDataInicial" name="cmpDataInicial" type="text">
+  <input id="cmpDataFinal" name="cmpDataFinal" type="text">
+  <input id="cmpNumIeDest" name="cmpNumIeDest" type="text">
+  <label><input id="cmpTipoNota" name="cmpTipoNota" type="radio" value="0" checked> Entrada</label>
+  <label><input id="cmpTipoNota" name="cmpTipoNota" type="radio" value="1"> Saída</label>
+  <select id="cmpModelo" name="cmpModelo"><option value="-">Todos</option><option value="55">55</option></select>
+  <button id="btnPesquisar" type="button">Pesquisar</button>
+</div>
+<div id="alertas"></div>
+<div id="resultado"></div>
+<div id="carregando" style="display:none">Carregando...</div>
+<div id="modalDownload" class="modal" style="display:none">
+  <div class="modal-dialog"><div class="modal-content">
+    <div class="modal-header"><h4 id="modalTitulo">Baixar XML</h4></div>
+    <div class="modal-body">
+      <select id="campoSelectTipodwnload"><option value="1">Todos</option><option value="4">Intervalo de páginas</option></select>
+      <input id="cmpPagIni" type="text"><input id="cmpPagFin" type="text">
+    </div>
+    <div class="modal-footer">
+      <button id="dnwld-all-btn-ok" class="btn btn-info" type="button">Baixar</button>
+      <button id="btnFecharModal" class="btn btn-default" type="button">Fechar</button>
+    </div>
+  </div></div>
+</div>
+<script>
+const $ = (id) => document.getElementById(id);
+function camposBusca() {{
+  const dados = new URLSearchParams();
+  ["cmpDataInicial", "cmpDataFinal", "cmpNumIeDest", "cmpModelo"].forEach((c) => dados.append(c, $(c).value));
+  dados.append("cmpTipoNota", document.querySelector("input[name=cmpTipoNota]:checked").value);
+  return dados;
+}}
+$("btnPesquisar").addEventListener("click", async () => {{
+  $("alertas").innerHTML = "";
+  $("resultado").innerHTML = "";
+  $("carregando").style.display = "";
+  const r = await fetch("{pesquisa}", {{method: "POST", body: camposBusca(), credentials: "same-origin"}});
+  $("carregando").style.display = "none";
+  $("resultado").innerHTML = await r.text();
+}});
+document.addEventListener("click", (e) => {{
+  if (!e.target.closest(".btn-download-all")) return;
+  $("modalTitulo").textContent = "Baixar XML";
+  $("modalDownload").style.display = "";
+}});
+$("btnFecharModal").addEventListener("click", () => {{
+  $("modalDownload").style.display = "none";
+  $("modalTitulo").textContent = "Baixar XML";
+}});
+$("dnwld-all-btn-ok").addEventListener("click", async () => {{
+  const dados = camposBusca();
+  ["campoSelectTipodwnload", "cmpPagIni", "cmpPagFin"].forEach((c) => dados.append(c, $(c).value));
+  $("modalTitulo").textContent = "Gerando arquivo...";
+  const r = await fetch("{download}", {{method: "POST", body: dados, credentials: "same-origin"}});
+  if ((r.headers.get("Content-Type") || "").includes("zip")) {{
+    const nome = (r.headers.get("Content-Disposition") || "").split("filename=")[1].replace(/"/g, "");
+    const link = document.createElement("a");
+    link.href = URL.createObjectURL(await r.blob());
+    link.download = nome;
+    link.click();
+    $("modalTitulo").textContent = "Concluído";
+  }} else {{
+    $("modalDownload").style.display = "none";
+    $("alertas").innerHTML = await r.text();
+  }}
+}});
+</script>
+</body></html>"""
+
+XML_NOTA = """<?xml version="1.0" encoding="UTF-8"?>
+<nfeProc xmlns="http://www.portalfiscal.inf.br/nfe" versao="4.00"><NFe><infNFe Id="NFe{chave}" versao="4.00">
+<ide><cUF>52</cUF><mod>55</mod><nNF>{numero}</nNF><dhEmi>{dh_emi}</dhEmi><tpNF>{tipo}</tpNF></ide>
+<emit><CNPJ>{cnpj_emit}</CNPJ><xNome>EMITENTE {cnpj_emit}</xNome></emit>
+<dest><CNPJ>{cnpj_dest}</CNPJ><xNome>DESTINATARIO {cnpj_dest}</xNome></dest>
+<total><ICMSTot><vNF>{valor}</vNF></ICMSTot></total>
+<infAdic><infCpl>{complemento}</infCpl></infAdic>
+</infNFe></NFe><protNFe versao="4.00"><infProt><chNFe>{chave}</chNFe><cStat>100</cStat></infProt></protNFe></nfeProc>
+"""
+
+
+def _semente(*partes):
+    return zlib.crc32("|".join(str(p) for p in partes).encode())
+
+
+class PortalFalso:
+    """
+    `latencia`            atraso (s) de cada requisição (login, telas, pesquisa).
+    `latencia_por_nota`   atraso extra (s) por nota no download, simulando a geração do ZIP.
+    `notas_por_dia`       média de notas por (contador, operação, dia).
+    `erros`               probabilidades: {"erro_interno", "sem_resultados", "permissao_negada"}.
+    `bytes_por_nota`      tamanho aproximado de cada XML dentro do ZIP.
+    """
+
+    def __init__(self, host="127.0.0.1", porta=0, latencia=0.05, latencia_por_nota=0.0005,
+                 notas_por_dia=50, erros=None, bytes_por_nota=2000, senha_invalida="invalida", semente=42):
+        self.latencia = latencia
+        self.latencia_por_nota = latencia_por_nota
+        self.notas_por_dia = notas_por_dia
+        self.erros = {"erro_interno": 0.0, "sem_resultados": 0.0, "permissao_negada": 0.0, **(erros or {})}
+        self.bytes_por_nota = bytes_por_nota
+        self.senha_invalida = senha_invalida
+        self.semente = semente
+        self._rng = random.Random(semente)
+        self._lock = threading.Lock()
+        self._sessoes = {}
+        self.contadores = {"logins": 0, "logins_invalidos": 0, "pesquisas": 0, "downloads": 0,
+                           "erros_internos": 0, "notas_baixadas": 0, "bytes_enviados": 0}
+        portal = self
+
+        class Handler(_Handler):
+            pass
+        Handler.portal = portal
+        self.servidor = ThreadingHTTPServer((host, porta), Handler)
+        self.servidor.daemon_threads = True
+        self._thread = None
+
+    @property
+    def url(self):
+        host, porta = self.servidor.server_address[:2]
+        return f"http://{host}:{porta}"
+
+    def iniciar(self):
+        self._thread = threading.Thread(target=self.servidor.serve_forever, daemon=True, name="portal-falso")
+        self._thread.start()
+        return self
+
+    def encerrar(self):
+        self.servidor.shutdown()
+        self.servidor.server_close()
+
+    def contar(self, nome, valor=1):
+        with self._lock:
+            self.contadores[nome] += valor
+
+    def sortear(self, erro):
+        with self._lock:
+            return self._rng.random() < self.erros.get(erro, 0.0)
+
+    # Sessões
+    def criar_sessao(self, cpf):
+        token = uuid.uuid4().hex
+        with self._lock:
+            self._sessoes[token] = cpf
+        return token
+
+    def cpf_da_sessao(self, token):
+        with self._lock:
+            return self._sessoes.get(token)
+
+    # Notas
+    def notas_no_dia(self, cpf, oper, dia):
+        rng = random.Random(_semente(self.semente, cpf, oper, dia.isoformat()))
+        return int(self.notas_por_dia * rng.uniform(0.5, 1.5))
+
+    def dias(self, ini, fim):
+        dia = ini
+        while dia <= fim:
+            yield dia
+            dia += timedelta(days=1)
+
+    def total_notas(self, cpf, oper, ini, fim):
+        return sum(self.notas_no_dia(cpf, oper, dia) for dia in self.dias(ini, fim))
+
+    def notas(self, cpf, oper, ini, fim, inicio=0, quantidade=None):
+        """Gera (chave, dia, índice) das notas do período, na ordem das páginas."""
+        posicao = 0
+        fim_faixa = None if quantidade is None else inicio + quantidade
+        for dia in self.dias(ini, fim):
+            n = self.notas_no_dia(cpf, oper, dia)
+            if posicao + n <= inicio:
+                posicao += n
+                continue
+            for i in range(n):
+                if posicao >= inicio and (fim_faixa is None or posicao < fim_faixa):
+                    yield dia, i
+                posicao += 1
+                if fim_faixa is not None and posicao >= fim_faixa:
+                    return
+
+    def xml_nota(self, cpf, oper, dia, indice):
+        rng = random.Random(_semente(self.semente, "nota", cpf, oper, dia.isoformat(), indice))
+        cnpj_emit = f"{rng.randrange(10 ** 13, 10 ** 14)}"
+        cnpj_dest = f"{rng.randrange(10 ** 13, 10 ** 14)}"
+        numero = rng.randrange(1, 10 ** 9)
+        chave = f"52{dia.strftime('%y%m')}{cnpj_emit}55001{numero:09d}1{rng.randrange(10 ** 8):08d}"[:43]
+        chave += str(sum(int(c) for c in chave) % 10)
+        dh_emi = f"{dia.isoformat()}T{rng.randrange(24):02d}:{rng.randrange(60):02d}:00-03:00"
+        xml = XML_NOTA.format(
+            chave=chave, numero=numero, dh_emi=dh_emi, tipo="0" if oper == "0" else "1",
+            cnpj_emit=cnpj_emit, cnpj_dest=cnpj_dest, valor=f"{rng.uniform(10, 50000):.2f}",
+            complemento="X" * max(0, self.bytes_por_nota - len(XML_NOTA))
+        )
+        return chave, xml
+
+    def gerar_zip(self, cpf, oper, ini, fim, inicio=0, quantidade=None):
+        buffer = io.BytesIO()
+        total = 0
+        with zipfile.ZipFile(buffer, "w", zipfile.ZIP_DEFLATED) as zf:
+            for dia, indice in self.notas(cpf, oper, ini, fim, inicio, quantidade):
+                chave, xml = self.xml_nota(cpf, oper, dia, indice)
+                zf.writestr(f"{chave}-nfe.xml", xml)
+                total += 1
+        return buffer.getvalue(), total
+
+
+def _data(valor):
+    return datetime.strptime(valor, "%d/%m/%Y").date()
+
+
+class _Handler(BaseHTTPRequestHandler):
+    portal = None
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, formato, *args):
+        pass
+
+    # Utilitários
+    def _responder(self, corpo, status=200, tipo="text/html; charset=utf-8", cabecalhos=None):
+        if isinstance(corpo, str):
+            corpo = corpo.encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", tipo)
+        self.send_header("Content-Length", str(len(corpo)))
+        for nome, valor in (cabecalhos or {}).items():
+            self.send_header(nome, valor)
+        self.end_headers()
+        self.wfile.write(corpo)
+        self.portal.contar("bytes_enviados", len(corpo))
+
+    def _redirecionar(self, destino, cabecalhos=None):
+        self.send_response(303)
+        self.send_header("Location", destino)
+        self.send_header("Content-Length", "0")
+        for nome, valor in (cabecalhos or {}).items():
+            self.send_header(nome, valor)
+        self.end_headers()
+
+    def _formulario(self):
+        tamanho = int(self.headers.get("Content-Length") or 0)
+        dados = parse_qs(self.rfile.read(tamanho).decode("utf-8"), keep_blank_values=True)
+        return {chave: valores[0] for chave, valores in dados.items()}
+
+    def _cpf_logado(self):
+        cookie = SimpleCookie(self.headers.get("Cookie", ""))
+        if COOKIE_SESSAO not in cookie:
+            return None
+        return self.portal.cpf_da_sessao(cookie[COOKIE_SESSAO].value)
+
+    def _exigir_login(self):
+        cpf = self._cpf_logado()
+        if cpf is None:
+            self._redirecionar(CAMINHO_LOGIN)
+        return cpf
+
+    # Rotas
+    def do_GET(self):
+        caminho = urlsplit(self.path).path
+        time.sleep(self.portal.latencia)
+        if caminho == CAMINHO_LOGIN:
+            return self._responder(PAGINA_LOGIN.format(login=CAMINHO_LOGIN, erro=""))
+        if self._exigir_login() is None:
+            return
+        if caminho == CAMINHO_AREA:
+            return self._responder(PAGINA_AREA.format(menu=CAMINHO_MENU))
+        if caminho == CAMINHO_MENU:
+            return self._responder(PAGINA_MENU.format(formulario=CAMINHO_FORMULARIO))
+        if caminho == CAMINHO_FORMULARIO:
+            return self._responder(PAGINA_FORMULARIO.format(pesquisa=SEFAZ_HTTP_PESQUISA, download=SEFAZ_HTTP_DOWNLOAD))
+        self._responder("Não encontrado", status=404)
+
+    def do_POST(self):
+        caminho = urlsplit(self.path).path
+        dados = self._formulario()
+        time.sleep(self.portal.latencia)
+        if caminho == CAMINHO_LOGIN:
+            return self._login(dados)
+        cpf = self._exigir_login()
+        if cpf is None:
+            return
+        if caminho == SEFAZ_HTTP_PESQUISA:
+            return self._pesquisar(cpf, dados)
+        if caminho == SEFAZ_HTTP_DOWNLOAD:
+            return self._baixar(cpf, dados)
+        self._responder("Não encontrado", status=404)
+
+    def _login(self, dados):
+        cpf, senha = dados.get("login", ""), dados.get("senha", "")
+        if not cpf or senha == self.portal.senha_invalida:
+            self.portal.contar("logins_invalidos")
+            erro = '<div id="richValidationBox7">Usuário ou senha inválidos</div>'
+            return self._responder(PAGINA_LOGIN.format(login=CAMINHO_LOGIN, erro=erro))
+        self.portal.contar("logins")
+        token = self.portal.criar_sessao(cpf)
+        self._redirecionar(CAMINHO_AREA, {"Set-Cookie": f"{COOKIE_SESSAO}={token}; Path=/"})
+
+    def _periodo(self, dados):
+        """Retorna (ini, fim, alerta) validando as datas como o portal."""
+        for campo, nome in (("cmpDataInicial", "inicial"), ("cmpDataFinal", "final")):
+            valor = dados.get(campo, "").strip()
+            if not valor:
+                return None, None, f"A data {nome} é obrigatória"
+            try:
+                _data(valor)
+            except ValueError:
+                return None, None, f"A data {nome} é inválida"
+        return _data(dados["cmpDataInicial"]), _data(dados["cmpDataFinal"]), None
+
+    def _pesquisar(self, cpf, dados):
+        portal = self.portal
+        portal.contar("pesquisas")
+        ini, fim, alerta = self._periodo(dados)
+        if alerta:
+            return self._responder(f'<div class="alert alert-danger">{alerta}</div>')
+        if portal.sortear("permissao_negada"):
+            return self._responder("<label>Você não tem permissão para acessar esta página</label>")
+        total = portal.total_notas(cpf, dados.get("cmpTipoNota"), ini, fim)
+        if total == 0 or portal.sortear("sem_resultados"):
+            return self._responder('<div class="alert alert-danger">Sem Resultados!</div>')
+        ultima = max(1, -(-total // NOTAS_POR_PAGINA))
+        paginas = "".join(f'<li data="{p}">{p}</li>' for p in sorted({1, 2, 3, ultima}) if p <= ultima)
+        self._responder(
+            '<div class="table-legend">'
+            f'<div class="table-legend-right-container"><div>{total}</div></div>'
+            '</div>'
+            '<button class="btn btn-primary btn-download-all" type="button">Baixar todos os arquivos</button>'
+            f'<div id="pagination-container"><div><ul>{paginas}</ul></div></div>'
+        )
+
+    def _baixar(self, cpf, dados):
+        portal = self.portal
+        ini, fim, alerta = self._periodo(dados)
+        if alerta:
+            return self._responder(f'<div class="alert alert-danger">{alerta}</div>')
+        oper = dados.get("cmpTipoNota")
+        inicio, quantidade = 0, None
+        if dados.get("campoSelectTipodwnload") == "4":
+            pagina_ini = int(dados.get("cmpPagIni") or 1)
+            pagina_fim = int(dados.get("cmpPagFin") or pagina_ini)
+            inicio = (pagina_ini - 1) * NOTAS_POR_PAGINA
+            quantidade = (pagina_fim - pagina_ini + 1) * NOTAS_POR_PAGINA
+        elif portal.total_notas(cpf, oper, ini, fim) > LIMITE_DOWNLOAD_UNICO:
+            return self._responder('<div class="alert alert-danger">Ocorreu um erro interno ao realizar o download.</div>')
+        if portal.sortear("erro_interno"):
+            portal.contar("erros_internos")
+            return self._responder('<div class="alert alert-danger">Ocorreu um erro interno ao realizar o download.</div>')
+
+        conteudo, total = portal.gerar_zip(cpf, oper, ini, fim, inicio, quantidade)
+        time.sleep(total * portal.latencia_por_nota)
+        portal.contar("downloads")
+        portal.contar("notas_baixadas", total)
+        nome = f"NFe_{cpf}_{ini.strftime('%Y%m%d')}_{fim.strftime('%Y%m%d')}_{uuid.uuid4().hex[:6]}.zip"
+        self._responder(conteudo, tipo="application/zip",
+                        cabecalhos={"Content-Disposition": f'attachment; filename="{nome}"'})
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--porta", type=int, default=8088)
+    parser.add_argument("--latencia", type=float, default=0.05)
+    parser.add_argument("--latencia-por-nota", type=float, default=0.0005)
+    parser.add_argument("--notas-por-dia", type=int, default=50)
+    parser.add_argument("--erro-interno", type=float, default=0.0)
+    parser.add_argument("--sem-resultados", type=float, default=0.0)
+    parser.add_argument("--permissao-negada", type=float, default=0.0)
+    args = parser.parse_args()
+
+    portal = PortalFalso(
+        args.host, args.porta, args.latencia, args.latencia_por_nota, args.notas_por_dia,
+        erros={"erro_interno": args.erro_interno, "sem_resultados": args.sem_resultados,
+               "permissao_negada": args.permissao_negada}
+    ).iniciar()
+    print(f"Portal falso em {portal.url}{CAMINHO_LOGIN} (Ctrl+C para sair)")
+    try:
+        while True:
+            time.sleep(1)
+    except KeyboardInterrupt:
+        portal.encerrar()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,133 @@
+"""
+Simulador do planejamento de janelas: quantas idas ao portal o plano adaptativo
+(utils.planejamento) economiza em relação às janelas fixas de 30 dias.
+
+Para cada perfil de IE, gera um volume diário de notas, grava as buscas de um
+período anterior como checkpoints (como um job antigo de janelas fixas faria) e
+planeja o período seguinte das duas formas. Cada janela custa uma pesquisa, mais
+um download se tiver notas, ou um download por bloco de 500 páginas se passar de
+10.000 notas (o caminho paginado de baixar_periodo). Janelas viram tarefas que
+rodam em paralelo, mas os blocos de uma janela grande são baixados em sequência:
+"maior" é a cadeia de idas da janela mais pesada.
+
+Uso:
+    python -m benchmarks.simular_planejamento
+    python -m benchmarks.simular_planejamento --inicio 2024-01-01 --dias 365 --historico-dias 90 --limite 8000
+"""
+import os
+import math
+import random
+import argparse
+import tempfile
+from datetime import date, datetime, timedelta
+
+LIMITE_DOWNLOAD_UNICO = 10000
+NOTAS_POR_PAGINA = 20
+PAGINAS_POR_BLOCO = 500
+
+# notas/dia médias e multiplicador por mês (sazonalidade)
+PERFIS = {
+    "sem movimento": (0.2, {}),
+    "pequena": (4, {}),
+    "média": (60, {}),
+    "grande": (400, {}),
+    "sazonal": (120, {11: 3.0, 12: 5.0, 1: 0.4, 2: 0.4}),
+    "varejo": (1500, {12: 2.0}),
+}
+
+
+def notas_no_dia(perfil, dia, semente):
+    base, sazonal = PERFIS[perfil]
+    rng = random.Random(f"{semente}:{perfil}:{dia.isoformat()}")
+    media = base * sazonal.get(dia.month, 1.0) * (0.3 if dia.weekday() >= 5 else 1.0)
+    return int(rng.expovariate(1 / media)) if media else 0
+
+
+def total(perfil, ini, fim, semente):
+    return sum(notas_no_dia(perfil, ini + timedelta(days=i), semente) for i in range((fim - ini).days + 1))
+
+
+def custo(total_notas):
+    """Idas ao portal de uma janela: (pesquisas, downloads)."""
+    if total_notas == 0:
+        return 1, 0
+    if total_notas <= LIMITE_DOWNLOAD_UNICO:
+        return 1, 1
+    paginas = math.ceil(total_notas / NOTAS_POR_PAGINA)
+    return 1, math.ceil(paginas / PAGINAS_POR_BLOCO)
+
+
+def avaliar(perfil, periodos, semente):
+    pesquisas = downloads = acima = maior = 0
+    for ini, fim in periodos:
+        n = total(perfil, ini, fim, semente)
+        p, d = custo(n)
+        pesquisas += p
+        downloads += d
+        acima += n > LIMITE_DOWNLOAD_UNICO
+        maior = max(maior, p + d)
+    return {"janelas": len(periodos), "pesquisas": pesquisas, "downloads": downloads,
+            "idas": pesquisas + downloads, "acima_limite": acima,
+            "maior": maior}
+
+
+def _datas(periodos):
+    return [(datetime.strptime(i, "%d/%m/%Y").date(), datetime.strptime(f, "%d/%m/%Y").date()) for i, f in periodos]
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--inicio", type=date.fromisoformat, default=date(2024, 1, 1), help="início do período planejado")
+    parser.add_argument("--dias", type=int, default=365, help="tamanho do período planejado")
+    parser.add_argument("--historico-dias", type=int, default=90, help="dias de buscas anteriores já registradas")
+    parser.add_argument("--limite", type=int, default=8000, help="notas estimadas por janela")
+    parser.add_argument("--dias-max", type=int, default=366)
+    parser.add_argument("--semente", type=int, default=42)
+    args = parser.parse_args()
+
+    from utils.checkpoints import CheckpointStore
+    from utils.planejamento import PerfilVolume, dividir_periodo_adaptativo
+
+    fim = args.inicio + timedelta(days=args.dias - 1)
+    inicio_historico = args.inicio - timedelta(days=args.historico_dias)
+    pasta = tempfile.mkdtemp(prefix="simular-planejamento-")
+    store = CheckpointStore(os.path.join(pasta, "checkpoints.sqlite3"))
+
+    print(f"Plano de {args.inicio} a {fim} | histórico de {args.historico_dias} dias | limite {args.limite} notas/janela")
+    print(f"{'perfil':<14} {'notas':>8} | {'fixo: jan':>9} {'idas':>6} {'>10k':>5} {'maior':>5} | {'adapt.: jan':>11} {'idas':>6} {'>10k':>5} {'maior':>5} | {'economia':>8}")
+    soma_fixo = soma_adaptativo = 0
+    try:
+        for perfil in PERFIS:
+            ie = f"IE-{perfil}"
+            fixos = [(ini, min(ini + timedelta(days=29), fim)) for ini in
+                     (args.inicio + timedelta(days=d) for d in range(0, args.dias, 30))]
+            cursor = inicio_historico
+            while cursor < args.inicio:
+                sub_fim = min(cursor + timedelta(days=29), args.inicio - timedelta(days=1))
+                n = total(perfil, cursor, sub_fim, args.semente)
+                store.registrar("historico", "00000000000", ie, "1", cursor, sub_fim,
+                                "OK" if n else "SEM_RESULTADO", n)
+                cursor = sub_fim + timedelta(days=1)
+
+            volume = PerfilVolume.carregar(store, "00000000000", ie, "1")
+            adaptativos = _datas(dividir_periodo_adaptativo(args.inicio, fim, volume, args.limite, 30, args.dias_max))
+
+            f = avaliar(perfil, fixos, args.semente)
+            a = avaliar(perfil, adaptativos, args.semente)
+            soma_fixo += f["idas"]
+            soma_adaptativo += a["idas"]
+            economia = 1 - a["idas"] / f["idas"] if f["idas"] else 0
+            print(f"{perfil:<14} {total(perfil, args.inicio, fim, args.semente):>8} | "
+                  f"{f['janelas']:>9} {f['idas']:>6} {f['acima_limite']:>5} {f['maior']:>5} | "
+                  f"{a['janelas']:>11} {a['idas']:>6} {a['acima_limite']:>5} {a['maior']:>5} | {economia:>7.0%}")
+        print(f"{'total':<14} {'':>8} | {'':>9} {soma_fixo:>6} {'':>11} | {'':>11} {soma_adaptativo:>6} {'':>11} | "
+              f"{1 - soma_adaptativo / soma_fixo:>7.0%}")
+    finally:
+        store.fechar()
+        for nome in os.listdir(pasta):
+            os.remove(os.path.join(pasta, nome))
+        os.rmdir(pasta)
+
+
+if __name__ == "__main__":
+    main()
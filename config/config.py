@@ -4,11 +4,71 @@ from pathlib import Path
 
 RABBITMQ_QUEUE_IN = 'consulta-xml'
 RABBITMQ_QUEUE_OUT = 'retorno-consulta-xml'
+RABBITMQ_QUEUE_TAREFAS = 'consulta-xml.tarefas'        # Modo distribuído: uma mensagem por (IE, operação, período)
+RABBITMQ_QUEUE_RESULTADOS = 'consulta-xml.resultados'  # Modo distribuído: planos e resultados das tarefas, para o agregador
+FILAS_ATRASO_ATIVAS = True          # Consultas com falha/adiadas voltam por filas com TTL + dead-letter em vez de sleeps
+FILAS_ATRASO = [60, 300, 1200, 3600]  # Esperas (s) das reentregas sucessivas; depois da última, vai para '<fila>.estacionadas'
 MAX_CPU_USAGE = 80
 MAX_RAM_USAGE = 80
 MAX_CHROME_INSTANCES = 10
+CHROME_HEADLESS = os.environ.get("CHROME_HEADLESS", "0") == "1"  # Chrome sem janela (servidores/benchmarks)
+MONITOR_INTERVALO = 5               # Intervalo (s) entre leituras de CPU/RAM/Chrome
+MONITOR_INTERVALO_LOG = 60          # Intervalo (s) entre registros da leitura no log de monitoramento
+ADMISSAO_MARGEM_RAM = 5             # Reduz a concorrência quando a RAM passa de MAX_RAM_USAGE - margem
+ADMISSAO_LIMITE_INICIAL = 1         # Concorrência inicial do consumidor (sobe +1 por leitura livre)
+DRIVER_POOL_AQUECIDOS = 2           # Quantos Chrome manter abertos e prontos no pool
+DRIVER_POOL_MAX_USOS = 20           # Recicla o Chrome após esse número de tarefas
+DRIVER_POOL_TIMEOUT = 600           # Tempo máximo (s) esperando um Chrome livre no pool
+DRIVER_POOL_SESSAO_TTL = 20 * 60    # Após esse tempo (s) o login na SEFAZ é refeito
+# Com ack manual, o consumer_timeout do RabbitMQ precisa ser maior que a duração de um job
+CONSUMER_WORKERS = 4                # Mensagens de consulta-xml processadas em paralelo (prefetch do RabbitMQ)
+TAREFAS_PARALELAS_POR_JOB = 3       # Tarefas (IE, operação, período) de uma mesma mensagem rodando em paralelo
+MAX_SESSOES_POR_CONTADOR = 2        # Máximo de sessões simultâneas no portal com o mesmo CPF de contador (ver CONCESSOES_BACKEND)
+PAGINAS_POR_BLOCO = 500             # Páginas por download (cmpPagIni/cmpPagFin) nos períodos com mais de 10.000 notas
+BLOCOS_SESSOES_PARALELAS = 3        # Sessões baixando blocos de um mesmo período em paralelo (respeita MAX_SESSOES_POR_CONTADOR)
+BLOCOS_RETENTATIVAS_ORCAMENTO = {   # Retentativas de cada bloco (PASSO, SESSAO) antes de a tarefa inteira ser tentada de novo
+    "PASSO": 3,
+    "SESSAO": 1,
+}
+BLOCOS_AGUARDAR_SESSAO = 60         # Tempo máximo (s) que uma sessão auxiliar espera um Chrome livre no pool
+PUBLISHER_CONEXOES = 2              # Conexões persistentes usadas para publicar status/retornos
+PUBLISHER_CONFIRMACAO = True        # Aguarda confirmação do broker (publisher confirms)
+PUBLISHER_TENTATIVAS = 3            # Tentativas (com reconexão) antes de desistir de publicar
+SUPERVISOR_WORKERS = 2              # Processos consumidores (cada um com seu pool de Chrome)
+SUPERVISOR_INTERVALO = 5            # Intervalo (s) entre verificações dos processos filhos
+SUPERVISOR_VIDA_MINIMA = 30         # Processo que cai antes disso conta como falha seguida
+SUPERVISOR_ESPERA_MAXIMA = 60       # Espera máxima (s) antes de reiniciar um worker que cai em loop
+SUPERVISOR_DRENAGEM_TIMEOUT = 600   # Tempo (s) para os workers terminarem o que estão fazendo no SIGTERM
+# Modo distribuído: o planejador quebra cada consulta em tarefas na fila RABBITMQ_QUEUE_TAREFAS, que os workers
+# de qualquer máquina consomem; o agregador junta os resultados e publica o progresso e o retorno final.
+# XMLS_DIRECTORY precisa ser compartilhado entre as máquinas (o caminhoXmls do retorno aponta para ele).
+MODO_DISTRIBUIDO = False
+TAREFAS_WORKERS = 5                 # Tarefas processadas em paralelo por processo consumidor no modo distribuído
+PLANEJADOR_WORKERS = 2              # Consultas planejadas em paralelo pelo processo planejador
+AGREGADOR_ATIVO = True              # Esta máquina roda o agregador (deixar ativo em uma única máquina)
+# Portal da SEFAZ-GO. SEFAZ_URL_BASE pode apontar para um portal falso/local em testes.
+SEFAZ_URL_BASE = os.environ.get("SEFAZ_URL_BASE", "https://www.sefaz.go.gov.br").rstrip("/")
+SEFAZ_URL_LOGIN = SEFAZ_URL_BASE + "/netaccess/000System/acessoRestrito/login/"
+PAGINA_TIMEOUT = 30                 # Espera máxima (s) por uma transição de tela no portal
+PAGINA_POLL = 0.1                   # Intervalo (s) entre as checagens das condições de espera
+# Motor HTTP (opcional): depois do login no Chrome, pesquisa e download vão direto por HTTP com os
+# cookies da sessão. Confira os caminhos no DevTools (aba Network) do portal antes de ativar;
+# se o motor falhar a tarefa segue pela interface.
+SEFAZ_HTTP_ATIVO = os.environ.get("SEFAZ_HTTP_ATIVO", "0") == "1"
+SEFAZ_HTTP_PESQUISA = os.environ.get("SEFAZ_HTTP_PESQUISA", "/nfeweb/sites/nfe/baixar-xml/pesquisar")
+SEFAZ_HTTP_DOWNLOAD = os.environ.get("SEFAZ_HTTP_DOWNLOAD", "/nfeweb/sites/nfe/baixar-xml/download")
+SEFAZ_HTTP_TIMEOUT = 60             # Timeout (s) de conexão/resposta de cada requisição
+SEFAZ_HTTP_DOWNLOAD_TIMEOUT = 600   # Tempo máximo (s) esperando o portal começar a enviar o ZIP
 DOWNLOAD_DIRECTORY = r"C:\SAAM-AUTOMACAO-GO\downloads_temp"  # Onde o Chrome salva temporário
 XMLS_DIRECTORY = r"C:\SAAM-AUTOMACAO-GO\XMLS"               # Onde ficam os XMLs organizados
+# Cada Chrome/tarefa baixa em uma subpasta própria daqui. Pode apontar para um tmpfs/RAM disk
+# (ex.: "/dev/shm/automacao-go" no Linux) via variável de ambiente DOWNLOAD_STAGING_DIRECTORY.
+DOWNLOAD_STAGING_DIRECTORY = os.environ.get("DOWNLOAD_STAGING_DIRECTORY", DOWNLOAD_DIRECTORY)
+
+LOG_MAX_ARQUIVOS_ABERTOS = 64       # Limite de arquivos de log abertos ao mesmo tempo (LRU)
+LOG_LOTE = 500                      # Máximo de linhas gravadas por lote
+LOG_INTERVALO_FLUSH = 0.5           # Segundos de espera da fila de logs antes de checar arquivos ociosos
+LOG_ARQUIVO_OCIOSO = 60             # Fecha logs sem escrita há esse tempo (s), liberando o arquivo no Windows
 
 
 SAFE_MODE = True
@@ -24,3 +84,74 @@ LOG_SCREENSHOTS = BASE_DIR / "logsScreenshot"
 # Criar todas as pastas necessárias no início
 for path in [LOG_ERRO, LOG_OK, LOG_MONITORAMENTO, LOG_CONTROLE, LOG_SCREENSHOTS]:
     path.mkdir(parents=True, exist_ok=True)
+
+# Checkpoints por (execução, contador, IE, operação, período), usados para retomar jobs reentregues
+CHECKPOINT_DB = LOG_CONTROLE / "checkpoints.sqlite3"
+CHECKPOINT_RETENCAO_DIAS = 90       # Checkpoints sem atualização há mais tempo que isso são apagados
+# Concessões de login por CPF: limitam as sessões simultâneas do contador e passam a sessão logada à próxima tarefa
+CONCESSOES_BACKEND = "sqlite"       # "sqlite" (processos da máquina), "memoria" (só o processo) ou "modulo:fabrica" compartilhado
+CONCESSOES_DB = LOG_CONTROLE / "concessoes.sqlite3"
+CONCESSOES_TTL = 60                 # Prazo (s) de uma vaga sem renovação; a de um worker que caiu vence sozinha
+CONCESSOES_OCIOSA_MAX = 120         # Tempo (s) que a vaga de uma sessão logada parada no pool fica reservada ao processo
+# Agregador do modo distribuído: plano e resultados das tarefas de cada consulta
+AGREGADOR_DB = LOG_CONTROLE / "agregador.sqlite3"
+AGREGADOR_RETENCAO_DIAS = 30        # Consultas agregadas sem atualização há mais tempo que isso são apagadas
+# Cobertura: intervalos já baixados por completo (entre jobs) são reaproveitados dos arquivos em XMLS_DIRECTORY
+COBERTURA_ATIVA = True
+COBERTURA_FRESCOR_DIAS = 5          # Dias antes da busca em que ainda podem chegar notas (são consultados de novo)
+COBERTURA_TTL = 6 * 3600            # Até esse tempo (s) após a busca, nem os dias recentes são consultados de novo
+COBERTURA_RETENCAO_DIAS = 365       # Registros de cobertura mais antigos que isso são apagados
+# Janelas de busca dimensionadas pelo volume de notas já observado por IE (legenda de resultados dos checkpoints)
+PLANO_ADAPTATIVO = True
+PLANO_LIMITE_NOTAS = 8000           # Janelas de IEs fracas crescem além de PLANO_DIAS_PADRAO até este total estimado (abaixo do download único de 10.000)
+PLANO_DIAS_PADRAO = 30              # Tamanho da janela para IEs sem histórico
+PLANO_DIAS_MAX = 366                # Maior janela numa única pesquisa (reduzir se o portal passar a limitar o intervalo)
+# Limite de requisições ao portal: balde de fichas por processo e por máquina (SQLite compartilhado pelos workers)
+LIMITADOR_ATIVO = True
+LIMITADOR_DB = LOG_CONTROLE / "limitador.sqlite3"
+LIMITES_PORTAL_MAQUINA = {          # tipo: (requisições por minuto, rajada) somando todos os processos da máquina
+    "login": (12, 3),
+    "pesquisa": (40, 6),
+    "download": (30, 4),
+}
+LIMITES_PORTAL_PROCESSO = {         # tipo: (requisições por minuto, rajada) de um processo worker
+    "login": (6, 2),
+    "pesquisa": (20, 4),
+    "download": (15, 3),
+}
+LIMITADOR_PAUSA_BASE = 10           # Pausa (s) após um sinal de limitação do portal; dobra a cada sinal seguido
+LIMITADOR_PAUSA_MAXIMA = 300
+LIMITADOR_RECUPERACAO = 600         # Tempo (s) para a taxa reduzida voltar ao normal sem novos sinais
+# Disjuntor de queda do portal: com a SEFAZ fora do ar, os consumidores da máquina param de pegar mensagens
+DISJUNTOR_ATIVO = True
+DISJUNTOR_DB = LOG_CONTROLE / "disjuntor.sqlite3"
+DISJUNTOR_FALHAS = 5               # Falhas de queda (timeout, conexão recusada, stacktrace) que abrem o disjuntor...
+DISJUNTOR_JANELA = 120             # ...dentro desta janela (s)
+DISJUNTOR_ESPERA_BASE = 60         # Espera (s) até a primeira sonda; dobra a cada sonda sem resposta
+DISJUNTOR_ESPERA_MAXIMA = 900
+DISJUNTOR_TIMEOUT_SONDA = 15       # Timeout (s) da requisição à tela de login usada como sonda
+DISJUNTOR_ESPERA_TAREFA = 1800     # Quanto uma tarefa em andamento espera o portal voltar antes de desistir
+# Retentativas por nível: PASSO (re-clique/nova pesquisa no mesmo Chrome), SESSAO (novo login), TAREFA (Chrome novo)
+RETENTATIVAS_ORCAMENTO = {          # Tentativas extras por nível; esgotado um nível, a falha sobe para o seguinte
+    "PASSO": 3,
+    "SESSAO": 2,
+    "TAREFA": 2,
+}
+RETENTATIVAS_ESPERA_BASE = {        # Primeira espera (s) de cada nível; dobra a cada uso, com jitter
+    "PASSO": 2,
+    "SESSAO": 5,
+    "TAREFA": 10,
+}
+RETENTATIVAS_ESPERA_MAXIMA = 120
+RETENTATIVAS_ESPERA_EM_THREAD = 15  # Esperas maiores que isso (s) adiam a tarefa para a fila de atraso (FILAS_ATRASO_ATIVAS)
+# Conferência dos ZIPs baixados: diretório central (sem extrair) contra o total de notas do portal
+VERIFICAR_CRC_COMPLETO = False      # Também descompacta e confere o CRC de cada XML (bem mais lento)
+# Ingestão: os ZIPs baixados são extraídos num pool de processos e as NF-e indexadas (SQLite na pasta da consulta)
+INGESTAO_ATIVA = True
+INGESTAO_PROCESSOS = 2              # Processos extraindo/lendo ZIPs em paralelo (por processo worker)
+INGESTAO_INDICE = "indice_nfe.sqlite3"
+# Armazém: cada XML é guardado uma única vez (hash do conteúdo) e as pastas das consultas recebem hard links.
+# Depende da ingestão (INGESTAO_ATIVA) e precisa estar no mesmo volume de XMLS_DIRECTORY.
+ARMAZEM_ATIVO = True
+ARMAZEM_DIRECTORY = os.path.join(XMLS_DIRECTORY, "_armazem")
+ARMAZEM_MANTER_ZIPS = False         # Apaga o ZIP baixado depois de guardado (python -m utils.armazem zip ... reconstrói)
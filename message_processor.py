@@ -1,31 +1,70 @@
 import os
 import json
+import math
 import time
+import queue
 import shutil
-import pika
-import time
+import threading
 from pathlib import Path
-import psutil
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from datetime import datetime, timedelta
 from selenium.webdriver.common.by import By
-from selenium.webdriver.support.ui import WebDriverWait
-from selenium.webdriver.support import expected_conditions as EC
-from selenium.common.exceptions import NoSuchElementException
+from selenium.common.exceptions import TimeoutException
 from config import secrets
-from selenium.webdriver.support.ui import Select
-from config.config import LOG_OK, LOG_ERRO, LOG_CONTROLE, LOG_SCREENSHOTS, DOWNLOAD_DIRECTORY, XMLS_DIRECTORY
+from config.config import LOG_OK, LOG_ERRO, LOG_SCREENSHOTS, DOWNLOAD_DIRECTORY, XMLS_DIRECTORY, RABBITMQ_QUEUE_OUT
+from config.config import RABBITMQ_QUEUE_TAREFAS, RABBITMQ_QUEUE_RESULTADOS
+from config.config import TAREFAS_PARALELAS_POR_JOB, MAX_SESSOES_POR_CONTADOR, SEFAZ_HTTP_ATIVO, COBERTURA_ATIVA
+from config.config import PLANO_ADAPTATIVO, PLANO_LIMITE_NOTAS, PLANO_DIAS_PADRAO, PLANO_DIAS_MAX
+from config.config import PAGINAS_POR_BLOCO, BLOCOS_SESSOES_PARALELAS, BLOCOS_RETENTATIVAS_ORCAMENTO, BLOCOS_AGUARDAR_SESSAO
+from config.config import RETENTATIVAS_ORCAMENTO, RETENTATIVAS_ESPERA_BASE, RETENTATIVAS_ESPERA_MAXIMA, RETENTATIVAS_ESPERA_EM_THREAD
+from config.config import FILAS_ATRASO_ATIVAS
+from config.config import INGESTAO_ATIVA, INGESTAO_INDICE, ARMAZEM_ATIVO, ARMAZEM_MANTER_ZIPS, VERIFICAR_CRC_COMPLETO
+from config.config import DISJUNTOR_ESPERA_TAREFA
+from api.rabbitmq_publisher import publicar
+from api.filas_atraso import ReagendarConsulta, pode_reagendar
+from automation.driver_pool import get_pool, PoolEsgotado
+from automation.download_tracker import DownloadTracker
+from utils.checkpoints import get_checkpoints, data_iso, sem_arquivos
+from utils.agregador import get_agregador, chave_tarefa
+from utils.cobertura import get_cobertura, materializar
+from utils.planejamento import PerfilVolume, dividir_periodo_adaptativo, subtrair_intervalos
+from utils.ingestao import IngestaoJob
+from utils.armazem import get_armazem
+from utils.integridade_zip import verificar_zip
+from utils.limitador import get_limitador
+from utils.disjuntor import get_disjuntor
+from utils.concessoes import get_concessoes, SemVaga
+from utils.retentativas import PoliticaRetentativas, ErroFatal, SESSAO, TAREFA
+from automation.http_engine import MotorHttp, SessaoHttpExpirada
+from automation.sefaz_pages import (
+    PaginaLogin, AreaRestrita, FormularioBusca, TabelaResultados, ModalDownload, ESTATISTICAS,
+    RESULTADOS, SEM_RESULTADOS, PERMISSAO_NEGADA, CONCLUIDO, ERRO_INTERNO
+)
 from utils.logger import (
-    setup_logger, gerar_nome_log, salvar_controle_ie,
-    log_funcionamento_execucao, log_erro_execucao,
+    setup_logger, gerar_nome_log,
+    log_funcionamento_execucao, log_erro_execucao, log_monitoramento,
     tirar_screenshot, enviar_discord_mensagem
 )
 
-MAX_RAM_PERCENT = 85
+# Esperas da própria automação (Chrome livre no pool, vaga de login do contador): o portal não
+# tem culpa, então a mensagem não é traduzida e nem o limitador nem o disjuntor as observam
+ERROS_LOCAIS = (PoolEsgotado, SemVaga)
 
-def ram_livre():
-    return psutil.virtual_memory().percent < MAX_RAM_PERCENT
 
 def mapear_erro_legivel(erro_raw):
+    """
+    Mensagem legível do erro. Sinais de limitação do portal também reduzem o ritmo das
+    requisições, e sinais de portal fora do ar alimentam o disjuntor.
+    """
+    if isinstance(erro_raw, ERROS_LOCAIS):
+        legivel = str(erro_raw)
+    else:
+        legivel = _traduzir_erro(erro_raw)
+        get_limitador().observar(f"{erro_raw} {legivel}")
+        get_disjuntor().observar(legivel)
+    return legivel
+
+def _traduzir_erro(erro_raw):
     erro_str = str(erro_raw).strip().lower()
     if "no such element" in erro_str:
         return "Elemento esperado não foi encontrado no site. O layout pode ter mudado."
@@ -75,35 +114,35 @@ def enviar_retorno(id_automacao, token, status="OK", obs="OK", caminho_xmls=""):
     }
     print(f"RabbitMQ retorno: {retorno}")
     try:
-        connection = pika.BlockingConnection(
-            pika.ConnectionParameters(
-                host=secrets.RABBITMQ_HOST,
-                port=secrets.RABBITMQ_PORT,
-                blocked_connection_timeout=300,
-                credentials=pika.PlainCredentials(secrets.RABBITMQ_USER, secrets.RABBITMQ_PASSWORD)
-            )
-        )
-
-        channel = connection.channel()
-        channel.queue_declare(queue='retorno-consulta-xml', durable=True)
-        props = pika.BasicProperties(headers={"token": token})
-        channel.basic_publish(exchange='', routing_key='retorno-consulta-xml', body=json.dumps(retorno), properties=props)
-        connection.close()
+        publicar(RABBITMQ_QUEUE_OUT, retorno, headers={"token": token})
     except Exception as ex:
         print("Falha ao enviar RabbitMQ:", ex)
 
-def mover_arquivos_para_xml(destino, total_notas, id_automacao, empresa_id, cpf, dt_ini, dt_fim, empresa_ie):
+def caminho_livre(destino, nome, sufixo=None):
+    """
+    Caminho de `nome` em `destino`. Cada sessão baixa na sua pasta, então o Chrome não põe mais
+    o "(1)" no nome: se já existe um arquivo igual (outro período/bloco), entra o `sufixo`.
+    """
+    if sufixo and os.path.exists(os.path.join(destino, nome)):
+        raiz, ext = os.path.splitext(nome)
+        nome = f"{raiz}_{sufixo}{ext}"
+    return os.path.join(destino, nome)
+
+def mover_arquivos_para_xml(destino, total_notas, id_automacao, empresa_id, cpf, dt_ini, dt_fim, empresa_ie, pasta_download=DOWNLOAD_DIRECTORY, arquivos=None, sufixo=None):
     os.makedirs(destino, exist_ok=True)
-    for nome_arquivo in os.listdir(DOWNLOAD_DIRECTORY):
-        origem = os.path.join(DOWNLOAD_DIRECTORY, nome_arquivo)
-        destino_arquivo = os.path.join(destino, nome_arquivo)
+    movidos = []
+    for nome_arquivo in (arquivos if arquivos is not None else os.listdir(pasta_download)):
+        origem = os.path.join(pasta_download, nome_arquivo)
+        destino_arquivo = caminho_livre(destino, nome_arquivo, sufixo)
         shutil.move(origem, destino_arquivo)
+        movidos.append(destino_arquivo)
     log_funcionamento_execucao(id_automacao, empresa_id, cpf, dt_ini, dt_fim, empresa_ie,
         f"IE {empresa_ie}: Baixou {total_notas} XMLs. Arquivos salvos em {destino}")
+    return movidos
 
-def iniciar_driver():
+def iniciar_driver(pasta_download=DOWNLOAD_DIRECTORY):
     from automation.browser_driver import get_driver
-    driver = get_driver(DOWNLOAD_DIRECTORY)
+    driver = get_driver(pasta_download)
     driver.maximize_window()
     return driver
 
@@ -114,7 +153,9 @@ def checar_alerta(driver, xpath):
     except Exception:
         return False
 
-def dividir_periodo(data_inicial, data_final, dias=30):
+def dividir_periodo(data_inicial, data_final, dias=30, perfil=None):
+    if perfil is not None and not perfil.vazio:
+        return dividir_periodo_adaptativo(data_inicial, data_final, perfil, PLANO_LIMITE_NOTAS, dias, PLANO_DIAS_MAX)
     inicio = datetime.strptime(data_inicial, "%Y-%m-%d")
     fim = datetime.strptime(data_final, "%Y-%m-%d")
     periodos = []
@@ -125,145 +166,495 @@ def dividir_periodo(data_inicial, data_final, dias=30):
     return periodos
 
 def esperar_download_concluir(pasta, timeout=120):
-    fim = time.time() + timeout
-    while time.time() < fim:
-        arquivos = os.listdir(pasta)
-        if any(a.endswith(".zip") for a in arquivos) and not any(a.endswith(".crdownload") or a.endswith(".tmp") for a in arquivos):
-            return True
-        time.sleep(1)
-    return False
+    with DownloadTracker(pasta, ignorar_existentes=False) as rastreador:
+        return rastreador.aguardar(timeout=timeout) is not None
 
 def fazer_login(driver, cpf, senha):
-    from selenium.common.exceptions import TimeoutException
-
-    driver.set_page_load_timeout(90)
-    driver.get("https://www.sefaz.go.gov.br/netaccess/000System/acessoRestrito/login/")
+    PaginaLogin(driver).autenticar(cpf, senha)
 
-    driver.find_element(By.ID, "NetAccess.Login").send_keys(cpf)
-    driver.find_element(By.ID, "NetAccess.Password").send_keys(senha)
-    driver.find_element(By.ID, "btnAuthenticate").click()
-
-    # Espera até 8 segundos para: login com sucesso OU alerta de erro aparecer
-    try:
-        WebDriverWait(driver, 8).until(
-            lambda d: (
-                "acessoRestrito/login" not in d.current_url or
-                checar_alerta(d, "//*[@id='richValidationBox7']")  # elemento do alerta
-            )
-        )
-    except TimeoutException:
-        pass  # nada visível ainda, vamos verificar abaixo
-
-    # Checagem final: se ainda está na página de login e alerta apareceu, login falhou
-    if "acessoRestrito/login" in driver.current_url:
-        try:
-            erro_login = driver.find_element(By.XPATH, "//*[@id='richValidationBox7']")
-            if "usuário ou senha inválidos" in erro_login.text.lower():
-                raise Exception("INVALID_LOGIN")
-        except Exception:
-            raise Exception("INVALID_LOGIN")
-
-def carregar_ies_processadas(arquivo_controle):
-    try:
-        with open(arquivo_controle, "r") as f:
-            return set([linha.strip() for linha in f if linha.strip()])
-    except FileNotFoundError:
-        return set()
+def garantir_login(sessao, cpf, senha):
+    """
+    Garante que a sessão do pool esteja logada na SEFAZ com o CPF informado.
+    Reaproveita o login anterior quando ainda é válido; caso contrário refaz o login.
+    Retorna True se o login foi reaproveitado.
+    """
+    driver = sessao.driver
+    if sessao.autenticada_para(cpf):
+        driver.switch_to.default_content()
+        driver.get(sessao.url_logado)
+        if "acessoRestrito/login" not in driver.current_url:
+            return True
+    if sessao.cpf is not None:
+        # Sessão de outro contador (ou expirada): limpa os cookies antes de logar
+        driver.delete_all_cookies()
+    sessao.esquecer_login()
+    fazer_login(driver, cpf, senha)
+    sessao.marcar_login(cpf)
+    return False
 
 def preencher_periodo_robusto(driver, ini, fim, empresa_ie, max_tentativas=3):
     """
     Preenche datas de início e fim, clica em pesquisar e, se detectar erro de data (obrigatória/inválida),
     repreenche ambos os campos até 3 vezes antes de lançar erro real.
     """
-    for tentativa in range(1, max_tentativas + 1):
-        campo_ini = driver.find_element(By.ID, "cmpDataInicial")
-        campo_ini.clear()
-        time.sleep(0.3)
-        campo_ini.send_keys(ini)
-        campo_fim = driver.find_element(By.ID, "cmpDataFinal")
-        campo_fim.clear()
-        time.sleep(0.3)
-        campo_fim.send_keys(fim)
-        btn_pesquisar = driver.find_element(By.ID, "btnPesquisar")
-        btn_pesquisar.click()
-        time.sleep(2)
-
-        # Checa TODOS os alertas conhecidos
-        for alerta_msg in [
-            "A data inicial é obrigatória",
-            "A data final é obrigatória",
-            "A data inicial é inválida",
-            "A data final é inválida"
-        ]:
-            if checar_alerta(driver, f"//div[contains(@class,'alert-danger') and contains(.,'{alerta_msg}')]"):
-                log_funcionamento_execucao(
-                    None, None, None, ini, fim, empresa_ie,
-                    f"Alerta detectado ao preencher datas na tentativa {tentativa}: {alerta_msg} — Repreenchendo campos."
-                )
-                break  # Tenta novamente
-        else:
-            # Nenhum alerta: sucesso!
-            return True
+    def alerta(tentativa, alerta_msg):
+        log_funcionamento_execucao(
+            None, None, None, ini, fim, empresa_ie,
+            f"Alerta detectado ao preencher datas na tentativa {tentativa}: {alerta_msg} — Repreenchendo campos."
+        )
 
-    # Se chegou aqui, não conseguiu preencher certo após max_tentativas
-    raise Exception(f"Erro ao preencher datas {ini} a {fim}: não conseguiu validar após {max_tentativas} tentativas.")
+    FormularioBusca(driver).buscar(ini, fim, max_tentativas=max_tentativas, ao_alerta=alerta)
+    return True
 
 
 def preencher_periodo(driver, ini, fim, empresa_ie):
-    time.sleep(2)
-    campo_ini = driver.find_element(By.ID, "cmpDataInicial")
-    campo_ini.clear()
-    time.sleep(2)
-    campo_ini.send_keys(ini)
-    campo_fim = driver.find_element(By.ID, "cmpDataFinal")
-    campo_fim.clear()
-    time.sleep(2)
-    campo_fim.send_keys(fim)
-    campo_ie = driver.find_element(By.ID, "cmpNumIeDest")
-    campo_ie.clear()
-    time.sleep(2)
-    campo_ie.send_keys(empresa_ie)
-    radio_entrada = driver.find_element(By.XPATH, "//input[@id='cmpTipoNota' and @value='0']")
-    radio_entrada.click()
-    select_modelo = driver.find_element(By.ID, "cmpModelo")
-    from selenium.webdriver.support.ui import Select
-    Select(select_modelo).select_by_value("-")
+    formulario = FormularioBusca(driver)
+    formulario.preencher_periodo(ini, fim)
+    formulario.preencher_ie(empresa_ie)
+    formulario.selecionar_operacao("1")
+    formulario.selecionar_modelo("-")
 
 def atualizar_status_parcial(id_automacao, token, empresa_ie, atual, total, empresa_id, cpf, dt_ini, dt_fim, caminho_xmls):
         try:
-            connection = pika.BlockingConnection(
-                pika.ConnectionParameters(
-                    host=secrets.RABBITMQ_HOST,
-                    port=secrets.RABBITMQ_PORT,
-                    virtual_host='/',
-                    credentials=pika.PlainCredentials(secrets.RABBITMQ_USER, secrets.RABBITMQ_PASSWORD)
-                )
-            )
-            channel = connection.channel()
-            channel.queue_declare(queue='retorno-consulta-xml', durable=True)
-            props = pika.BasicProperties(headers={"token": token})
             payload = {
                 "id": id_automacao,
                 "status": "PROCESSING",
                 "obs": f"Processando {atual}/{total} - IE {empresa_ie}",
                 "caminhoXmls": caminho_xmls
             }
-            channel.basic_publish(
-                exchange='',
-                routing_key='retorno-consulta-xml',
-                body=json.dumps(payload),
-                properties=props
-            )
-            connection.close()
+            publicar(RABBITMQ_QUEUE_OUT, payload, headers={"token": token})
             log_funcionamento_execucao(id_automacao, empresa_id, cpf, dt_ini, dt_fim, empresa_ie, f"📤 Atualização enviada: {payload}")
         except Exception as e:
             log_funcionamento_execucao(id_automacao, empresa_id, cpf, dt_ini, dt_fim, empresa_ie, f"❌ Erro ao enviar status parcial RabbitMQ: {e}")
 
-def process_message(message, properties=None):
-    caminho_xmls = []
-    driver = None
-    total_geral_notas = 0
-    empresas_original = message["empresas"]
+def dividir_blocos(ultima_pagina, paginas=PAGINAS_POR_BLOCO):
+    return [(p, min(p + paginas - 1, ultima_pagina)) for p in range(1, ultima_pagina + 1, paginas)]
+
+
+def conferir_zip(caminho, esperado, descricao):
+    """
+    Confere o ZIP baixado pelo diretório central (sem extrair) contra as notas que o portal
+    informou. ZIP truncado/corrompido ou com menos arquivos é apagado e vira exceção, para o
+    período ou bloco ser baixado de novo. Retorna quantos arquivos o ZIP tem.
+    """
+    verificacao = verificar_zip(caminho, VERIFICAR_CRC_COMPLETO)
+    if not verificacao["ok"]:
+        os.remove(caminho)
+        raise Exception(f"ZIP {descricao} inválido: {verificacao['erro']}")
+    if verificacao["entradas"] < esperado:
+        os.remove(caminho)
+        raise Exception(f"ZIP {descricao} veio com {verificacao['entradas']} XMLs, esperado {esperado}.")
+    return verificacao["entradas"]
+
+
+def contar_xmls(caminho):
+    """Arquivos de um ZIP já gravado; 0 se ele não passar na verificação."""
+    verificacao = verificar_zip(caminho)
+    return verificacao["entradas"] if verificacao["ok"] else 0
+
+
+class DownloadEmBlocos:
+    """
+    Download de um período com mais de 10.000 notas em blocos de páginas (cmpPagIni/cmpPagFin),
+    repartidos entre a sessão da tarefa e sessões auxiliares do pool, cada uma com sua pasta de
+    download. Cada bloco tem tentativas e checkpoint próprios: uma falha refaz só aquele bloco.
+    No fim, os XMLs dos blocos são conferidos contra o total de notas do portal.
+    """
+
+    def __init__(self, ctx, tarefa, total_notas, ultima_pagina, pool=None, via_http=False):
+        self.ctx = ctx
+        self.tarefa = tarefa
+        self.total_notas = total_notas
+        self.ultima_pagina = ultima_pagina
+        self.pool = pool
+        self.via_http = via_http
+        self.notas_por_pagina = math.ceil(total_notas / ultima_pagina)
+        self.blocos = dividir_blocos(ultima_pagina)
+        self.fila = queue.Queue()
+        self.arquivos = {}
+        self.falhas = {}
+        self.lock = threading.Lock()
+
+    def _log(self, mensagem):
+        ctx = self.ctx
+        log_funcionamento_execucao(ctx.id_automacao, ctx.empresa_id, ctx.cpf, ctx.dt_ini, ctx.dt_fim, self.tarefa.ie, mensagem)
+
+    def esperado(self, bloco):
+        """Quantas notas o bloco deve ter: páginas cheias, menos o que falta na última."""
+        pagina_ini, pagina_fim = bloco
+        return min(self.total_notas, pagina_fim * self.notas_por_pagina) - (pagina_ini - 1) * self.notas_por_pagina
+
+    def executar(self, sessao, estado):
+        """
+        Baixa todos os blocos e retorna os arquivos no destino. `sessao` já está com a pesquisa
+        feita (estado["pronto"]); as auxiliares fazem login e pesquisa por conta própria.
+        """
+        ctx, tarefa = self.ctx, self.tarefa
+        feitos = get_checkpoints().blocos_concluidos(ctx.id_automacao, ctx.cpf, tarefa.ie, tarefa.oper,
+                                                     tarefa.ini, tarefa.fim, self.total_notas)
+        for bloco in self.blocos:
+            arquivos = feitos.get(bloco)
+            if arquivos and all(os.path.exists(a) for a in arquivos) and \
+                    sum(contar_xmls(a) for a in arquivos) >= self.esperado(bloco):
+                self.arquivos[bloco] = arquivos
+            else:
+                self.fila.put(bloco)
+        pendentes = self.fila.qsize()
+        self._log(f"Mais de 10.000 notas ({self.total_notas}): {len(self.blocos)} blocos de páginas, "
+                  f"{pendentes} a baixar ({len(self.arquivos)} já baixados em tentativa anterior).")
+
+        ajudantes = []
+        if self.pool is not None:
+            for i in range(min(BLOCOS_SESSOES_PARALELAS, pendentes) - 1):
+                ajudante = threading.Thread(target=self._ajudante, daemon=True,
+                                            name=f"{threading.current_thread().name}-blocos-{i + 1}")
+                ajudante.start()
+                ajudantes.append(ajudante)
+        self._trabalhar(sessao, estado)
+        for ajudante in ajudantes:
+            ajudante.join()
+
+        if self.falhas:
+            raise Exception(f"{len(self.falhas)} de {len(self.blocos)} blocos falharam: " +
+                            "; ".join(f"{ini}-{fim}: {erro}" for (ini, fim), erro in sorted(self.falhas.items())))
+        return self.consolidar()
+
+    def consolidar(self):
+        arquivos = [a for bloco in sorted(self.arquivos) for a in self.arquivos[bloco]]
+        baixadas = sum(contar_xmls(a) for a in arquivos)
+        if baixadas < self.total_notas:
+            raise Exception(f"Os blocos somam {baixadas} XMLs, mas o portal informou {self.total_notas} notas.")
+        self._log(f"IE {self.tarefa.ie}: {len(self.blocos)} blocos conferidos, {baixadas} XMLs em {len(arquivos)} arquivo(s).")
+        return arquivos
+
+    def _ajudante(self):
+        """Sessão auxiliar: entra assim que houver vaga para o contador e sai quando a fila acabar."""
+        semaforo = semaforo_contador(self.ctx.cpf)
+        while not self.fila.empty():
+            if semaforo.acquire(timeout=1):
+                break
+        else:
+            return
+        sessao = None
+        estado = {}
+        try:
+            if self.fila.empty():
+                return
+            sessao = self.pool.adquirir(self.ctx.cpf, timeout=BLOCOS_AGUARDAR_SESSAO)
+            self._log(f"Chrome {sessao.id} ajudando no download em blocos.")
+            self._trabalhar(sessao, estado)
+        except Exception as e:
+            self._log(f"Sessão auxiliar indisponível para o download em blocos: {mapear_erro_legivel(e)}")
+        finally:
+            if estado.get("motor"):
+                estado["motor"].fechar()
+            semaforo.manter = sessao is not None and not estado.get("falhou", False)
+            if sessao is not None:
+                self.pool.devolver(sessao, descartar=estado.get("falhou", False))
+            semaforo.release()
+
+    def _trabalhar(self, sessao, estado):
+        while not self.ctx.login_invalido.is_set():
+            try:
+                bloco = self.fila.get_nowait()
+            except queue.Empty:
+                return
+            self._processar(sessao, estado, bloco)
+
+    def _processar(self, sessao, estado, bloco):
+        """
+        Baixa um bloco com retentativas por nível: PASSO repete só o download (por HTTP) ou a
+        pesquisa (pela interface) na mesma sessão; SESSAO refaz o login. Falhas de Chrome não
+        se resolvem aqui: o bloco fica como falho e a tarefa inteira é repetida.
+        """
+        ctx, tarefa = self.ctx, self.tarefa
+        politica = politica_tarefa(ctx, tarefa, BLOCOS_RETENTATIVAS_ORCAMENTO, bloco, sessao)
+        erro = ""
+        while True:
+            inicio = time.monotonic()
+            try:
+                if not estado.get("pronto"):
+                    self._preparar(sessao, estado)
+                arquivos = self._baixar(sessao, estado, bloco)
+                politica.sucesso(time.monotonic() - inicio)
+                estado["falhou"] = False
+                with self.lock:
+                    self.arquivos[bloco] = arquivos
+                get_checkpoints().registrar_bloco(ctx.id_automacao, ctx.cpf, tarefa.ie, tarefa.oper, tarefa.ini, tarefa.fim,
+                                                  bloco[0], bloco[1], self.total_notas, "OK", arquivos=arquivos)
+                return
+            except Exception as e:
+                estado["falhou"] = True
+                erro = mapear_erro_legivel(e)
+                decisao = politica.falhou(e, time.monotonic() - inicio, erro)
+                if decisao is None:
+                    self._log(f"Bloco {bloco[0]}-{bloco[1]} (Chrome {sessao.id}): {erro} — desistindo após {politica.resumo()}.")
+                    break
+                if decisao.nivel == SESSAO:
+                    sessao.esquecer_login()
+                if decisao.nivel == SESSAO or not self.via_http:
+                    estado["pronto"] = False
+                self._log(f"Bloco {bloco[0]}-{bloco[1]} (Chrome {sessao.id}): falha de {decisao.classe}: {erro} — "
+                          f"nova tentativa ({decisao.nivel}) em {decisao.espera:.1f}s.")
+                time.sleep(decisao.espera)
+        with self.lock:
+            self.falhas[bloco] = erro
+        get_checkpoints().registrar_bloco(ctx.id_automacao, ctx.cpf, tarefa.ie, tarefa.oper, tarefa.ini, tarefa.fim,
+                                          bloco[0], bloco[1], self.total_notas, "ERROR", erro=erro)
+
+    def _preparar(self, sessao, estado):
+        """Login (reaproveitado se ainda válido) e a mesma pesquisa do período nesta sessão."""
+        ctx, tarefa = self.ctx, self.tarefa
+        garantir_login(sessao, ctx.cpf, ctx.senha)
+        if self.via_http:
+            if estado.get("motor"):
+                estado["motor"].fechar()
+            estado["motor"] = MotorHttp(sessao.driver)
+            pesquisa = estado["motor"].pesquisar(tarefa.ini, tarefa.fim, tarefa.oper)
+            resultado, total_notas = pesquisa["resultado"], pesquisa["total_notas"]
+        else:
+            area = AreaRestrita(sessao.driver)
+            area.entrar_iframe()
+            resultado, _ = area.abrir_baixar_xml().buscar(tarefa.ini, tarefa.fim, tarefa.oper)
+            total_notas = TabelaResultados(sessao.driver).total_notas() if resultado == RESULTADOS else 0
+        if resultado != RESULTADOS:
+            raise Exception(f"Pesquisa refeita para o download em blocos não trouxe resultados ({resultado}).")
+        if total_notas != self.total_notas:
+            raise Exception(f"Total de notas mudou durante o download em blocos ({self.total_notas} -> {total_notas}).")
+        estado["pronto"] = True
+
+    def _baixar(self, sessao, estado, bloco):
+        tarefa = self.tarefa
+        pagina_ini, pagina_fim = bloco
+        if self.via_http:
+            situacao, download = estado["motor"].baixar(tarefa.ini, tarefa.fim, tarefa.oper, sessao.pasta_download,
+                                                        pagina_ini, pagina_fim)
+            if situacao != CONCLUIDO:
+                raise Exception(f"Erro interno do portal ao baixar o bloco {pagina_ini}-{pagina_fim}.")
+        else:
+            modal = ModalDownload(sessao.driver)
+            modal.abrir_paginas(pagina_ini, pagina_fim)
+            rastreador = DownloadTracker(sessao.pasta_download)
+            modal.confirmar()
+            try:
+                situacao = modal.aguardar_conclusao(timeout=20)
+            except TimeoutException:
+                rastreador.fechar()
+                raise Exception("Erro inesperado ao tentar baixar XML em blocos.")
+            if situacao != CONCLUIDO:
+                rastreador.fechar()
+                raise Exception(f"Erro interno do portal ao baixar o bloco {pagina_ini}-{pagina_fim}.")
+            with rastreador:
+                download = rastreador.aguardar(timeout=120)
+            if download is None:
+                raise Exception(f"Nenhum arquivo ZIP identificado após o download do bloco {pagina_ini}-{pagina_fim}.")
+            modal.fechar()
+
+        notas = conferir_zip(download.caminho, self.esperado(bloco), f"do bloco {pagina_ini}-{pagina_fim}")
+        if notas > self.esperado(bloco):
+            self._log(f"Bloco {pagina_ini}-{pagina_fim} veio com {notas} XMLs, {notas - self.esperado(bloco)} a mais que o esperado.")
+        os.makedirs(tarefa.destino, exist_ok=True)
+        caminho = caminho_livre(tarefa.destino, download.nome, f"{tarefa.sufixo}_p{pagina_ini}-{pagina_fim}")
+        shutil.move(download.caminho, caminho)
+        self._log(f"Bloco {pagina_ini}-{pagina_fim} baixado pelo Chrome {sessao.id} ({os.path.basename(caminho)}, {notas} XMLs, "
+                  f"{download.bytes} bytes em {download.duracao:.1f}s).")
+        return [caminho]
+
+
+def baixar_periodo_http(ctx, sessao, tarefa, pool=None):
+    """
+    Mesma busca/download de `baixar_periodo`, mas por HTTP direto com os cookies do Chrome logado.
+    Acima de 10.000 notas os blocos de páginas vão para o DownloadEmBlocos.
+    """
+    id_automacao, empresa_id, cpf, dt_ini, dt_fim = ctx.id_automacao, ctx.empresa_id, ctx.cpf, ctx.dt_ini, ctx.dt_fim
+    empresa_ie, ini, fim, tipo_oper, destino = tarefa.ie, tarefa.ini, tarefa.fim, tarefa.oper, tarefa.destino
+    motor = MotorHttp(sessao.driver)
+    baixados = []
+    try:
+        pesquisa = motor.pesquisar(ini, fim, tipo_oper)
+        if pesquisa["resultado"] == PERMISSAO_NEGADA:
+            erro_ie = "Permissão negada (verifique a data final)."
+            log_funcionamento_execucao(id_automacao, empresa_id, cpf, dt_ini, dt_fim, empresa_ie, erro_ie)
+            return {"status": "PERMISSAO_NEGADA", "erro": erro_ie, "total_notas": 0}
+        if pesquisa["resultado"] == SEM_RESULTADOS:
+            erro_ie = "Nenhum resultado encontrado para o período/IE informado."
+            log_funcionamento_execucao(id_automacao, empresa_id, cpf, dt_ini, dt_fim, empresa_ie, erro_ie)
+            return {"status": "SEM_RESULTADO", "erro": erro_ie, "total_notas": 0}
+        if pesquisa["resultado"] != RESULTADOS:
+            raise Exception(f"Pesquisa HTTP retornou {pesquisa['resultado']}: {pesquisa['detalhe']}")
+
+        total_notas = pesquisa["total_notas"]
+        if total_notas > 10000:
+            blocos = DownloadEmBlocos(ctx, tarefa, total_notas, pesquisa["ultima_pagina"], pool, via_http=True)
+            arquivos = blocos.executar(sessao, {"pronto": True, "motor": motor})
+            return {"status": "OK", "erro": "", "total_notas": total_notas, "arquivos": arquivos}
+
+        for tentativa in range(1, 6):
+            situacao, download = motor.baixar(ini, fim, tipo_oper, sessao.pasta_download)
+            if situacao == CONCLUIDO:
+                break
+            log_funcionamento_execucao(id_automacao, empresa_id, cpf, dt_ini, dt_fim, empresa_ie,
+                f"Tentativa {tentativa}: erro interno do portal no download HTTP. Repetindo.")
+        else:
+            raise Exception("Erro interno do portal persistiu no download HTTP.")
+        baixados.append(download)
+        notas = conferir_zip(download.caminho, total_notas, download.nome)
+        log_funcionamento_execucao(id_automacao, empresa_id, cpf, dt_ini, dt_fim, empresa_ie,
+            f"Download HTTP {download.nome}: {download.bytes} bytes em {download.duracao:.1f}s, {notas} XMLs conferidos.")
+
+        arquivos = mover_arquivos_para_xml(destino, total_notas, id_automacao, empresa_id, cpf, dt_ini, dt_fim, empresa_ie,
+            pasta_download=sessao.pasta_download, arquivos=[d.nome for d in baixados], sufixo=tarefa.sufixo)
+        return {"status": "OK", "erro": "", "total_notas": total_notas, "arquivos": arquivos}
+    except Exception:
+        for download in baixados:
+            if os.path.exists(download.caminho):
+                os.remove(download.caminho)
+        raise
+    finally:
+        motor.fechar()
+
+
+def baixar_periodo(ctx, sessao, tarefa, pool=None):
+    """
+    Executa no portal a busca e o download de uma tarefa (IE, operação, período)
+    com uma sessão já logada. Levanta exceção em caso de falha (a tarefa é tentada de novo).
+    Com `pool`, períodos acima de 10.000 notas também usam sessões auxiliares nos blocos.
+    """
+    driver = sessao.driver
+    id_automacao, empresa_id, cpf, dt_ini, dt_fim = ctx.id_automacao, ctx.empresa_id, ctx.cpf, ctx.dt_ini, ctx.dt_fim
+    empresa_ie, ini, fim, tipo_oper, destino = tarefa.ie, tarefa.ini, tarefa.fim, tarefa.oper, tarefa.destino
+
+    if SEFAZ_HTTP_ATIVO:
+        try:
+            return baixar_periodo_http(ctx, sessao, tarefa, pool)
+        except SessaoHttpExpirada:
+            sessao.esquecer_login()
+            raise
+        except Exception as e:
+            log_erro_execucao(id_automacao, empresa_id, cpf, dt_ini, dt_fim, empresa_ie,
+                f"Download via HTTP falhou ({e}). Seguindo pela interface do portal.")
+
+    def alerta_data(tentativa, alerta_msg):
+        log_funcionamento_execucao(id_automacao, empresa_id, cpf, dt_ini, dt_fim, empresa_ie,
+            f"Alerta detectado ao preencher datas na tentativa {tentativa}: {alerta_msg} — Repreenchendo campos.")
+
+    area = AreaRestrita(driver)
+    area.entrar_iframe()
+    log_funcionamento_execucao(id_automacao, empresa_id, cpf, dt_ini, dt_fim, empresa_ie, "Entrou no iframe 'iNetaccess'.")
+    formulario = area.abrir_baixar_xml()
+    log_funcionamento_execucao(id_automacao, empresa_id, cpf, dt_ini, dt_fim, empresa_ie, "Clicou em 'Baixar XML NFE'. Campo 'Pesquisar' disponível.")
+
+    # Operação e datas são preenchidas antes de uma única pesquisa
+    resultado, _ = formulario.buscar(ini, fim, tipo_oper, ao_alerta=alerta_data)
+    log_funcionamento_execucao(id_automacao, empresa_id, cpf, dt_ini, dt_fim, empresa_ie, f"Preencheu período: {ini} a {fim} e clicou em 'Pesquisar'.")
+
+    # Checa erro de permissão/erro por causa de data errada
+    if resultado == PERMISSAO_NEGADA:
+        erro_ie = "Permissão negada (verifique a data final)."
+        tirar_screenshot(f"{id_automacao}_{empresa_ie}_{ini}_{fim}".replace("/", "-"), LOG_SCREENSHOTS)
+        log_funcionamento_execucao(id_automacao, empresa_id, cpf, dt_ini, dt_fim, empresa_ie, erro_ie)
+        return {"status": "PERMISSAO_NEGADA", "erro": erro_ie, "total_notas": 0}
+
+    # Checa sem resultados
+    if resultado == SEM_RESULTADOS:
+        erro_ie = "Nenhum resultado encontrado para o período/IE informado."
+        log_funcionamento_execucao(id_automacao, empresa_id, cpf, dt_ini, dt_fim, empresa_ie, erro_ie)
+        return {"status": "SEM_RESULTADO", "erro": erro_ie, "total_notas": 0}
+
+    # Download XMLs
+    tabela = TabelaResultados(driver)
+    total_notas = tabela.total_notas()
+    modal = ModalDownload(driver)
+    if total_notas > 10000:
+        blocos = DownloadEmBlocos(ctx, tarefa, total_notas, tabela.ultima_pagina(), pool)
+        arquivos = blocos.executar(sessao, {"pronto": True})
+        return {"status": "OK", "erro": "", "total_notas": total_notas, "arquivos": arquivos}
+
+    modal.abrir_tudo()
+    log_funcionamento_execucao(id_automacao, empresa_id, cpf, dt_ini, dt_fim, empresa_ie, "Clicou em 'Baixar todos os arquivos'.")
+    rastreador = DownloadTracker(sessao.pasta_download)
+    modal.confirmar()
+    log_funcionamento_execucao(id_automacao, empresa_id, cpf, dt_ini, dt_fim, empresa_ie, "Clicou em 'Baixar' no modal.")
+    with rastreador:
+        if modal.aguardar_conclusao(timeout=600) == ERRO_INTERNO:
+            raise Exception("Erro interno do portal ao gerar o download.")
+        log_funcionamento_execucao(id_automacao, empresa_id, cpf, dt_ini, dt_fim, empresa_ie, "Download concluído (tela de concluído apareceu).")
+        download = rastreador.aguardar(timeout=120)
+
+    if download is None:
+        erro_ie = "Nenhum arquivo ZIP identificado após a conclusão de download."
+        tirar_screenshot(f"{id_automacao}_{empresa_ie}_{dt_ini}_{dt_fim}".replace("/", "-"), LOG_SCREENSHOTS)
+        raise Exception(erro_ie)
+    notas = conferir_zip(download.caminho, total_notas, download.nome)
+    if notas > total_notas:
+        log_funcionamento_execucao(id_automacao, empresa_id, cpf, dt_ini, dt_fim, empresa_ie,
+            f"{download.nome} tem {notas} XMLs, mais que as {total_notas} notas informadas pelo portal.")
+
+    # Move arquivos para XMLS_DIRECTORY (com CPF!)
+    os.makedirs(destino, exist_ok=True)
+    arquivos = []
+    try:
+        caminho = caminho_livre(destino, download.nome, tarefa.sufixo)
+        shutil.move(download.caminho, caminho)
+        arquivos.append(caminho)
+    except Exception as e:
+        erro_ie = f"Erro ao mover arquivo: {e}"
+        log_erro_execucao(id_automacao, empresa_id, cpf, dt_ini, dt_fim, empresa_ie, erro_ie)
+        raise Exception(erro_ie)
+    log_funcionamento_execucao(id_automacao, empresa_id, cpf, dt_ini, dt_fim, empresa_ie,
+        f"IE {empresa_ie}: Baixou {total_notas} XMLs para o período {ini} a {fim} "
+        f"({download.nome}, {download.bytes} bytes em {download.duracao:.1f}s). Arquivos salvos em {destino}")
+    return {"status": "OK", "erro": "", "total_notas": total_notas, "arquivos": arquivos}
+
+
+class Tarefa:
+    """Unidade de trabalho de um job: uma IE, uma operação (entrada/saída) e um período."""
+
+    def __init__(self, indice_empresa, ie, oper, ini, fim, destino):
+        self.indice_empresa = indice_empresa
+        self.ie = ie
+        self.oper = oper
+        self.ini = ini
+        self.fim = fim
+        self.destino = destino
+
+    @property
+    def sufixo(self):
+        """Sufixo dos arquivos do período quando o nome do ZIP já existe no destino ('p20240101-20240131')."""
+        return f"p{data_iso(self.ini).replace('-', '')}-{data_iso(self.fim).replace('-', '')}"
+
+    def __repr__(self):
+        return f"Tarefa(IE {self.ie}, oper {self.oper}, {self.ini} a {self.fim})"
+
+
+class ContextoJob:
+    """Dados de uma mensagem consulta-xml compartilhados pelas tarefas que rodam em paralelo."""
+
+    def __init__(self, message, properties):
+        self.data_inicial = message["dataInicial"][:10]
+        self.data_final = message["dataFinal"][:10]
+        self.cpf = message["contador"]["cpf"]
+        self.senha = message["contador"]["senha"]
+        self.id_automacao = message["id"]
+
+        headers = getattr(properties, 'headers', None) or message.get('_headers', {})
+        self.empresa_id = headers.get("identificador", "")
+        self.token = headers.get("token", "")
+
+        self.dt_ini = datetime.strptime(self.data_inicial, "%Y-%m-%d").strftime("%d%m%Y")
+        self.dt_fim = datetime.strptime(self.data_final, "%Y-%m-%d").strftime("%d%m%Y")
+        self.periodo_str = f"{self.dt_ini}_{self.dt_fim}"
+        self.destino_base = os.path.join(XMLS_DIRECTORY, str(self.empresa_id), str(self.cpf), self.periodo_str)
+
+        # Com as filas de atraso, tarefas que teriam de esperar muito voltam numa reentrega da mensagem
+        self.pode_adiar = FILAS_ATRASO_ATIVAS and pode_reagendar(properties)
+
+        self.login_verificado = False
+        self.login_invalido = threading.Event()
+        self.lock = threading.Lock()
+
+
+def expandir_empresas(empresas_original):
     empresas = []
     for e in empresas_original:
         oper = str(e.get("oper", "Todos")).strip()
@@ -272,325 +663,255 @@ def process_message(message, properties=None):
             empresas.append({**e, "oper": "0"})  # Saída
         else:
             empresas.append(e)
+    return empresas
 
-    data_inicial = message["dataInicial"][:10]
-    data_final = message["dataFinal"][:10]
-    cpf = message["contador"]["cpf"]
-    senha = message["contador"]["senha"]
-    id_automacao = message["id"]
 
-    headers = getattr(properties, 'headers', None) or message.get('_headers', {})
-    empresa_id = headers.get("identificador", "")
-    token = headers.get("token", "")
+def semaforo_contador(cpf):
+    """
+    Vaga de login do contador (utils.concessoes): limita as sessões simultâneas no portal com o
+    mesmo CPF entre os processos. Quem a segura marca `manter` se a sessão voltou logada ao pool.
+    """
+    return get_concessoes().vaga(cpf)
 
-    dt_ini = datetime.strptime(data_inicial, "%Y-%m-%d").strftime("%d%m%Y")
-    dt_fim = datetime.strptime(data_final, "%Y-%m-%d").strftime("%d%m%Y")
-    periodos = dividir_periodo(data_inicial, data_final, dias=30)
-    total_ies = len(empresas)
-    resultado_final = []
-    login_verificado = False
 
-    enviar_retorno(id_automacao, token, status="PROCESSING", obs=f"Iniciando processamento de {total_ies} IEs.")
-    arquivo_controle = os.path.join(LOG_CONTROLE, f"{empresa_id}_{cpf}_{periodo_str}.txt")
-    ies_ja_processadas = set()
-    try:
-        with open(arquivo_controle, "r") as f:
-            ies_ja_processadas = set([linha.strip() for linha in f if linha.strip()])
-    except FileNotFoundError:
-        ies_ja_processadas = set()
+def politica_tarefa(ctx, tarefa, orcamentos=RETENTATIVAS_ORCAMENTO, bloco=None, sessao=None):
+    """PoliticaRetentativas que grava o custo de cada tentativa nos checkpoints e no log da IE."""
+    def registrar(registro):
+        pagina_ini, pagina_fim = bloco or (0, 0)
+        get_checkpoints().registrar_tentativa(ctx.id_automacao, ctx.cpf, tarefa.ie, tarefa.oper, tarefa.ini, tarefa.fim,
+                                              registro, pagina_ini, pagina_fim, sessao.id if sessao else "")
+    return PoliticaRetentativas(orcamentos, RETENTATIVAS_ESPERA_BASE, RETENTATIVAS_ESPERA_MAXIMA, ao_registrar=registrar)
 
-    for idx, empresa in enumerate(empresas, 1):
-        empresa_ie = empresa["ie"]
-        if empresa_ie in ies_ja_processadas:
-            log_funcionamento_execucao(id_automacao, empresa_id, cpf, dt_ini, dt_fim, empresa_ie,
-            f"IE {empresa_ie} já processada anteriormente — pulando.")
-            continue
-        periodo_str = f"{dt_ini}_{dt_fim}"
-        destino_base = os.path.join(XMLS_DIRECTORY, str(empresa_id), str(cpf), periodo_str)
-        destino = os.path.join(destino_base, empresa_ie)
-        if not caminho_xmls:
-            caminho_xmls.append(destino_base)
-        atualizar_status_parcial(id_automacao, token, empresa_ie, idx, len(empresas), empresa_id, cpf, dt_ini, dt_fim, caminho_xmls=";".join(caminho_xmls))
-        tentativas = 0
-        max_tentativas = 5
-        status_ie = "OK"
-        erro_ie = ""
-        total_notas = 0
-        log_funcionamento_execucao(id_automacao, empresa_id, cpf, dt_ini, dt_fim, empresa_ie,
-            f"------ Iniciando execução para IE {empresa_ie} (tentativas máximas: {max_tentativas}) ------"
-        )
 
-        while tentativas < max_tentativas:
-            tentativas += 1
-            log_funcionamento_execucao(id_automacao, empresa_id, cpf, dt_ini, dt_fim, empresa_ie,
-                f"Tentativa {tentativas} de {max_tentativas} para IE {empresa_ie}"
-            )
-            if not ram_livre():
-                log_funcionamento_execucao(id_automacao, empresa_id, cpf, dt_ini, dt_fim, empresa_ie, "RAM acima do limite, aguardando para nova tentativa...")
-                time.sleep(30)
-                continue
-            try:
-                driver = iniciar_driver()
-                driver.execute_script(f"document.title = 'AUTOMACAO_{id_automacao}_{empresa_ie}'")
-                log_funcionamento_execucao(id_automacao, empresa_id, cpf, dt_ini, dt_fim, empresa_ie, "Chrome aberto e maximizado.")
+def executar_tarefa(ctx, tarefa, pool):
+    """
+    Roda uma tarefa repetindo cada falha no nível mais barato (utils.retentativas): PASSO refaz
+    a pesquisa no mesmo Chrome logado, SESSAO refaz o login e TAREFA pega um Chrome novo do pool.
+    """
+    id_automacao, empresa_id, cpf, dt_ini, dt_fim = ctx.id_automacao, ctx.empresa_id, ctx.cpf, ctx.dt_ini, ctx.dt_fim
+    empresa_ie, ini, fim = tarefa.ie, tarefa.ini, tarefa.fim
+    resultado = {"status": "ERROR", "erro": "", "total_notas": 0}
+    get_checkpoints().iniciar(id_automacao, cpf, empresa_ie, tarefa.oper, ini, fim)
+    politica = politica_tarefa(ctx, tarefa)
+    sessao = None
+    sessao_ok = False
 
+    vaga = semaforo_contador(cpf)
+    with vaga:
+        try:
+            while True:
+                if ctx.login_invalido.is_set():
+                    return {"status": "INVALID_LOGIN", "erro": "Usuário ou senha inválidos.", "total_notas": 0}
+                if get_disjuntor().aberto():
+                    # Portal fora do ar: adia para a fila de atraso, ou espera ele voltar em vez de abrir Chrome
+                    if ctx.pode_adiar:
+                        log_funcionamento_execucao(id_automacao, empresa_id, cpf, dt_ini, dt_fim, empresa_ie,
+                            f"Portal da SEFAZ fora do ar (disjuntor aberto). Período {ini} a {fim} adiado.")
+                        resultado = {"status": "ADIADO", "erro": "Portal da SEFAZ fora do ar.", "total_notas": 0}
+                        break
+                    log_funcionamento_execucao(id_automacao, empresa_id, cpf, dt_ini, dt_fim, empresa_ie,
+                        "Portal da SEFAZ fora do ar (disjuntor aberto). Aguardando ele voltar.")
+                    if not get_disjuntor().aguardar_fechado(DISJUNTOR_ESPERA_TAREFA):
+                        resultado = {"status": "ERROR", "erro": "Portal da SEFAZ fora do ar. Tente novamente mais tarde.", "total_notas": 0}
+                        break
+                log_funcionamento_execucao(id_automacao, empresa_id, cpf, dt_ini, dt_fim, empresa_ie,
+                    f"Tentativa {politica.numero} ({politica.nivel}) para IE {empresa_ie} (oper {tarefa.oper}), período {ini} a {fim}"
+                )
+                inicio = time.monotonic()
+                driver = None
                 try:
-                    fazer_login(driver, cpf, senha)
-                    log_funcionamento_execucao(id_automacao, empresa_id, cpf, dt_ini, dt_fim, empresa_ie, "Login realizado com sucesso.")
-                    login_verificado = True
-                except Exception as e:
-                    erro_ie = mapear_erro_legivel(e)
-                    url_atual = driver.current_url.lower()
-                    if  not login_verificado and "acessorestrito/login" in url_atual and "usuário ou senha inválidos" in erro_ie.lower():
-                        status_ie = "INVALID_LOGIN"
-                        erro_ie = "Usuário ou senha inválidos."
-                        tirar_screenshot(driver, f"{id_automacao}_{empresa_ie}_{dt_ini}_{dt_fim}".replace("/", "-"), LOG_SCREENSHOTS)
-                        log_erro_execucao(id_automacao, empresa_id, cpf, dt_ini, dt_fim, empresa_ie, erro_ie)
-
-                        resultado_final.append({
-                            "ie": empresa_ie,
-                            "status": status_ie,
-                            "erro": erro_ie
-                        })
-
-                        # Parar execução imediatamente
-                        mensagem = (
-                            "----- RELATÓRIO FINAL -----\n\n"
-                            f"Empresa: {empresa_id}\n"
-                            f"Período: {data_inicial} até {data_final}\n\n"
-                            f"🔒 ERRO CRÍTICO: Usuário ou senha inválidos. Execução abortada.\n"
-                        )
-                        enviar_discord_mensagem(f"```\n{mensagem}\n```", secrets.DISCORD_WEBHOOK)
-                        enviar_retorno(id_automacao, token, status="INVALID", obs=erro_ie)
-                        return  # Finaliza a função process_message imediatamente
-
-                    raise e  
-
-                for ini, fim in periodos:
+                    if sessao is None:
+                        sessao = pool.adquirir(cpf)
+                        sessao_ok = False
+                        sessao.driver.execute_script(f"document.title = 'AUTOMACAO_{id_automacao}_{empresa_ie}'")
+                        log_funcionamento_execucao(id_automacao, empresa_id, cpf, dt_ini, dt_fim, empresa_ie,
+                            f"Chrome {sessao.id} obtido do pool (uso {sessao.usos}).")
+                    elif politica.nivel == SESSAO:
+                        sessao.esquecer_login()
+                    driver = sessao.driver
+
                     try:
-                        executou_download_paginado = False
-                        WebDriverWait(driver, 30).until(EC.frame_to_be_available_and_switch_to_it((By.ID, "iNetaccess")))
-                        log_funcionamento_execucao(id_automacao, empresa_id, cpf, dt_ini, dt_fim, empresa_ie, "Entrou no iframe 'iNetaccess'.")
-
-                        time.sleep(2)
-                        driver.find_element(By.XPATH, "//a[contains(text(),'Baixar XML NFE')]").click()
-                        log_funcionamento_execucao(id_automacao, empresa_id, cpf, dt_ini, dt_fim, empresa_ie, "Clicou em 'Baixar XML NFE'.")
-                        time.sleep(3)
-
-                        WebDriverWait(driver, 15).until(EC.presence_of_element_located((By.ID, "btnPesquisar")))
-                        log_funcionamento_execucao(id_automacao, empresa_id, cpf, dt_ini, dt_fim, empresa_ie, "Campo 'Pesquisar' disponível.")
-
-                        # Preenche campos
-                        preencher_periodo_robusto(driver, ini, fim, empresa_ie)
-                        # Marcar tipo da nota: entrada (0) ou saída (1)
-                        tipo_oper = str(empresa.get("oper", "0")).strip()
-                        if tipo_oper == "1":
-                            driver.find_element(By.XPATH, "//input[@id='cmpTipoNota' and @value='0']").click()
+                        if garantir_login(sessao, cpf, ctx.senha):
+                            log_funcionamento_execucao(id_automacao, empresa_id, cpf, dt_ini, dt_fim, empresa_ie, "Login reaproveitado da sessão do pool.")
                         else:
-                            driver.find_element(By.XPATH, "//input[@id='cmpTipoNota' and @value='1']").click()
-
-                        log_funcionamento_execucao(id_automacao, empresa_id, cpf, dt_ini, dt_fim, empresa_ie, f"Preencheu período: {ini} a {fim}.")
-
-                        btn_pesquisar = driver.find_element(By.ID, "btnPesquisar")
-                        btn_pesquisar.click()
-                        log_funcionamento_execucao(id_automacao, empresa_id, cpf, dt_ini, dt_fim, empresa_ie, "Clicou em 'Pesquisar'.")
-                        time.sleep(2)
-
-                        # Tentar corrigir datas se erro
-                        for tent_corrige_data in range(3):
-                            if checar_alerta(driver, "//div[contains(@class,'alert-danger') and contains(.,'A data final é obrigatória')]"):
-                                campo_fim = driver.find_element(By.ID, "cmpDataFinal")
-                                campo_fim.clear()
-                                campo_fim.send_keys(fim)
-                                btn_pesquisar.click()
-                                log_funcionamento_execucao(id_automacao, empresa_id, cpf, dt_ini, dt_fim, empresa_ie, "Corrigiu data final obrigatória e clicou em 'Pesquisar'.")
-                                time.sleep(2)
-                                continue
-                            if checar_alerta(driver, "//div[contains(@class,'alert-danger') and contains(.,'A data inicial é obrigatória')]"):
-                                campo_ini = driver.find_element(By.ID, "cmpDataInicial")
-                                campo_ini.clear()
-                                campo_ini.send_keys(ini)
-                                btn_pesquisar.click()
-                                log_funcionamento_execucao(id_automacao, empresa_id, cpf, dt_ini, dt_fim, empresa_ie, "Corrigiu data inicial obrigatória e clicou em 'Pesquisar'.")
-                                time.sleep(2)
-                                continue
-
-                        # Checa erro de permissão/erro por causa de data errada
-                        if checar_alerta(driver, "//label[contains(.,'Você não tem permissão para acessar esta página')]"):
-                            erro_ie = "Permissão negada (verifique a data final)."
-                            status_ie = "PERMISSAO_NEGADA"
-                            tirar_screenshot(driver, f"{id_automacao}_{empresa_ie}_{ini}_{fim}".replace("/", "-"), LOG_SCREENSHOTS)
-                            log_funcionamento_execucao(id_automacao, empresa_id, cpf, dt_ini, dt_fim, empresa_ie, erro_ie)
-                            tentativas = max_tentativas
-                            break
-
-                        # Checa sem resultados
-                        if checar_alerta(driver, "//div[contains(@class,'alert-danger') and contains(.,'Sem Resultados!')]"):
-                            erro_ie = "Nenhum resultado encontrado para o período/IE informado."
-                            status_ie = "OK"
-                            log_funcionamento_execucao(id_automacao, empresa_id, cpf, dt_ini, dt_fim, empresa_ie, erro_ie)
-                            tentativas = 4
-                            break
-                        # Download XMLs
-                        WebDriverWait(driver, 20).until(
-                            EC.presence_of_element_located((By.XPATH, "//button[contains(@class, 'btn-download-all')]"))
-                        )
-                        total_notas = int(driver.find_element(
-                            By.XPATH, "//div[contains(@class, 'table-legend-right-container')]/div"
-                        ).text)
-                        total_geral_notas += total_notas
-                        if total_notas > 10000:
-                            log_funcionamento_execucao(id_automacao, empresa_id, cpf, dt_ini, dt_fim, empresa_ie, f"Mais de 10.000 notas ({total_notas}). Iniciando download em blocos.")
-                            ultima_pagina = int(driver.find_element(By.XPATH, "//*[@id='pagination-container']/div/ul/li[last()]").get_attribute("data"))
-                            pagina_ini = 1
-                            pagina_fim = 500
-                            while pagina_ini <= ultima_pagina:
-                                driver.find_element(By.XPATH, "//button[contains(@class, 'btn-download-all')]").click()
-                                WebDriverWait(driver, 15).until(EC.presence_of_element_located((By.ID, "campoSelectTipodwnload")))
-                                Select(driver.find_element(By.ID, "campoSelectTipodwnload")).select_by_value("4")
-
-                                campo_ini = driver.find_element(By.ID, "cmpPagIni")
-                                campo_fim = driver.find_element(By.ID, "cmpPagFin")
-                                campo_ini.clear()
-                                campo_fim.clear()
-                                campo_ini.send_keys(str(pagina_ini))
-                                campo_fim.send_keys(str(min(pagina_fim, ultima_pagina)))
-
-                                btn_modal_baixar = driver.find_element(By.ID, "dnwld-all-btn-ok")
-                                btn_modal_baixar.click()
-
-                                tentativas_download = 0
-                                while tentativas_download < 5:
-                                    tentativas_download += 1
-                                    try:
-                                        WebDriverWait(driver, 20).until(
-                                            EC.visibility_of_element_located((By.XPATH, "//div[contains(@class, 'modal-content')]//h4[contains(.,'Concluído')]"))
-                                        )
-                                        break  # sucesso
-                                    except:
-                                        if checar_alerta(driver, "//div[contains(@class,'alert-danger') and contains(.,'erro interno ao realizar o download')]"):
-                                            log_funcionamento_execucao(id_automacao, empresa_id, cpf, dt_ini, dt_fim, empresa_ie,
-                                                f"Tentativa {tentativas_download}: erro interno detectado ao baixar. Recarregando a página.")
-                                            driver.refresh()
-                                            WebDriverWait(driver, 30).until(EC.frame_to_be_available_and_switch_to_it((By.ID, "iNetaccess")))
-                                            driver.find_element(By.XPATH, "//a[contains(text(),'Baixar XML NFE')]").click()
-                                            time.sleep(2)
-                                            preencher_periodo_robusto(driver, ini, fim, empresa_ie)
-                                            if tipo_oper == "1":
-                                                driver.find_element(By.XPATH, "//input[@id='cmpTipoNota' and @value='0']").click()
-                                            else:
-                                                driver.find_element(By.XPATH, "//input[@id='cmpTipoNota' and @value='1']").click()
-                                            driver.find_element(By.ID, "btnPesquisar").click()
-                                            WebDriverWait(driver, 20).until(
-                                                EC.presence_of_element_located((By.XPATH, "//button[contains(@class, 'btn-download-all')]"))
-                                            )
-                                            driver.find_element(By.XPATH, "//button[contains(@class, 'btn-download-all')]").click()
-                                            WebDriverWait(driver, 15).until(
-                                                EC.presence_of_element_located((By.ID, "campoSelectTipodwnload"))
-                                            )
-                                            Select(driver.find_element(By.ID, "campoSelectTipodwnload")).select_by_value("4")
-                                            campo_ini = driver.find_element(By.ID, "cmpPagIni")
-                                            campo_fim = driver.find_element(By.ID, "cmpPagFin")
-                                            campo_ini.clear()
-                                            campo_fim.clear()
-                                            campo_ini.send_keys(str(pagina_ini))
-                                            campo_fim.send_keys(str(min(pagina_fim, ultima_pagina)))
-                                            btn_modal_baixar = driver.find_element(By.ID, "dnwld-all-btn-ok")
-                                            btn_modal_baixar.click()
-                                            time.sleep(2)
-                                        else:
-                                            raise Exception("Erro inesperado ao tentar baixar XML em blocos.")
-
-                                log_funcionamento_execucao(id_automacao, empresa_id, cpf, dt_ini, dt_fim, empresa_ie,
-                                f"Bloco {pagina_ini}-{pagina_fim} baixado com sucesso.")
-                                mover_arquivos_para_xml(destino, total_notas, id_automacao, empresa_id, cpf, dt_ini, dt_fim, empresa_ie)
-                                driver.find_element(By.XPATH, "/html/body/div[5]/div/div/div[3]/button[2]").click()
-                                pagina_ini += 500
-                                pagina_fim += 500
-                                time.sleep(2)
-                                executou_download_paginado = True
-                                continue
-
-
-                        if  not executou_download_paginado:
-                            btn_baixar_tudo = driver.find_element(By.XPATH, "//button[contains(@class, 'btn-download-all')]")
-                            btn_baixar_tudo.click()
-                            log_funcionamento_execucao(id_automacao, empresa_id, cpf, dt_ini, dt_fim, empresa_ie, "Clicou em 'Baixar todos os arquivos'.")
-                            WebDriverWait(driver, 20).until(
-                                EC.visibility_of_element_located((By.XPATH, "//button[contains(@class, 'btn-info') and contains(.,'Baixar')]"))
-                            )
-                            btn_modal_baixar = driver.find_element(By.XPATH, "//button[contains(@class,'btn-info') and contains(.,'Baixar')]")
-                            btn_modal_baixar.click()
-                            log_funcionamento_execucao(id_automacao, empresa_id, cpf, dt_ini, dt_fim, empresa_ie, "Clicou em 'Baixar' no modal.")
-                            WebDriverWait(driver, 600).until(
-                                EC.visibility_of_element_located((By.XPATH, "//div[contains(@class, 'modal-content')]//h4[contains(.,'Concluído')]"))
-                            )
-                            log_funcionamento_execucao(id_automacao, empresa_id, cpf, dt_ini, dt_fim, empresa_ie, "Download concluído (tela de concluído apareceu).")
-
-                            if not esperar_download_concluir(DOWNLOAD_DIRECTORY, timeout=120):
-                                erro_ie = "Nenhum arquivo ZIP identificado após a conclusão de download."
-                                status_ie = "ERROR"
-                                tirar_screenshot(driver, f"{id_automacao}_{empresa_ie}_{dt_ini}_{dt_fim}".replace("/", "-"), LOG_SCREENSHOTS)
-                                log_erro_execucao(id_automacao, empresa_id, cpf, dt_ini, dt_fim, empresa_ie, erro_ie)
-                                continue
-
-                            # Move arquivos para XMLS_DIRECTORY (com CPF!)
-                            data_execucao = datetime.now().strftime("%Y-%m-%d")
-                            # Data no formato ddmmyyyy_ddmmyyyy
-                            periodo_str = f"{dt_ini}_{dt_fim}"  
-                            destino_base = os.path.join(XMLS_DIRECTORY, str(empresa_id), str(cpf), periodo_str)
-                            destino = os.path.join(destino_base, empresa_ie)
-                            os.makedirs(destino, exist_ok=True)
-                            for nome_arquivo in os.listdir(DOWNLOAD_DIRECTORY):
-                                if not nome_arquivo.endswith(".zip"):
-                                    continue
-                                try:
-                                    origem = os.path.join(DOWNLOAD_DIRECTORY, nome_arquivo)
-                                    destino_arquivo = os.path.join(destino, nome_arquivo)
-                                    shutil.move(origem, destino_arquivo)
-                                except Exception as e:
-                                    erro_ie = f"Erro ao mover arquivo: {e}"
-                                    log_erro_execucao(id_automacao, empresa_id, cpf, dt_ini, dt_fim, empresa_ie, erro_ie)
-                            log_funcionamento_execucao(id_automacao, empresa_id, cpf, dt_ini, dt_fim, empresa_ie,
-                                f"IE {empresa_ie}: Baixou {total_notas} XMLs para o período {ini} a {fim}. Arquivos salvos em {destino}")
-                        erro_ie = ""
-                        status_ie = "OK"
-                        break  # Sucesso
+                            log_funcionamento_execucao(id_automacao, empresa_id, cpf, dt_ini, dt_fim, empresa_ie, "Login realizado com sucesso.")
+                        ctx.login_verificado = True
                     except Exception as e:
-                        erro_ie = mapear_erro_legivel(e)
-                        status_ie = "ERROR"
-                        if tentativas == max_tentativas:
-                            tirar_screenshot(driver, f"{id_automacao}_{empresa_ie}_{ini}_{fim}".replace("/", "-"), LOG_SCREENSHOTS)
-                            log_erro_execucao(id_automacao, empresa_id, cpf, dt_ini, dt_fim, empresa_ie, f"Erro no período {ini} a {fim}: {erro_ie}")
-                        continue
-
-                
-                if status_ie == "OK":
-                    salvar_controle_ie(id_automacao, empresa_id, cpf, dt_ini, dt_fim, empresa_ie, LOG_CONTROLE)
-                    break  # Não precisa tentar de novo se chegou aqui!
-            except Exception as e:
-                erro_ie = mapear_erro_legivel(e)
-                status_ie = "ERROR"
-                tirar_screenshot(driver, f"{id_automacao}_{empresa_ie}_{dt_ini}_{dt_fim}".replace("/", "-"), LOG_SCREENSHOTS)
-                log_erro_execucao(id_automacao, empresa_id, cpf, dt_ini, dt_fim, empresa_ie, f"Erro geral: {erro_ie}")
-            finally:
-                if driver:
-                    try:
-                        driver.quit()
-                    except Exception:
-                        pass
-                    driver = None
-                time.sleep(2)
+                        erro = mapear_erro_legivel(e)
+                        url_atual = driver.current_url.lower()
+                        if not ctx.login_verificado and "acessorestrito/login" in url_atual and "usuário ou senha inválidos" in erro.lower():
+                            erro = "Usuário ou senha inválidos."
+                            tirar_screenshot(f"{id_automacao}_{empresa_ie}_{dt_ini}_{dt_fim}".replace("/", "-"), LOG_SCREENSHOTS)
+                            log_erro_execucao(id_automacao, empresa_id, cpf, dt_ini, dt_fim, empresa_ie, erro)
+                            ctx.login_invalido.set()
+                            sessao_ok = True
+                            politica.falhou(ErroFatal(erro), time.monotonic() - inicio)
+                            return {"status": "INVALID_LOGIN", "erro": erro, "total_notas": 0}
+                        raise e
+
+                    sessao_ok = True
+                    resultado = baixar_periodo(ctx, sessao, tarefa, pool)
+                    politica.sucesso(time.monotonic() - inicio)
+                    get_disjuntor().registrar_sucesso()
+                    return resultado
+                except Exception as e:
+                    resultado = {"status": "ERROR", "erro": mapear_erro_legivel(e), "total_notas": 0}
+                    decisao = politica.falhou(e, time.monotonic() - inicio, resultado["erro"])
+                    if decisao is None or decisao.nivel == TAREFA:
+                        if driver is not None and not get_disjuntor().aberto():
+                            tirar_screenshot(f"{id_automacao}_{empresa_ie}_{ini}_{fim}".replace("/", "-"), LOG_SCREENSHOTS)
+                        if sessao is not None:
+                            # Chrome que quebrou (ou não chegou a logar) é descartado; o de uma falha do portal volta ao pool
+                            pool.devolver(sessao, descartar=decisao is not None or not sessao_ok)
+                            sessao = None
+                    if decisao is None:
+                        log_erro_execucao(id_automacao, empresa_id, cpf, dt_ini, dt_fim, empresa_ie,
+                            f"Erro no período {ini} a {fim}: {resultado['erro']} — desistindo após {politica.resumo()}.")
+                        break
+                    if ctx.pode_adiar and decisao.espera > RETENTATIVAS_ESPERA_EM_THREAD:
+                        # Espera longa não prende a thread: a tarefa volta na reentrega pela fila de atraso
+                        log_funcionamento_execucao(id_automacao, empresa_id, cpf, dt_ini, dt_fim, empresa_ie,
+                            f"Falha de {decisao.classe} no período {ini} a {fim}: {resultado['erro']} — "
+                            f"próxima tentativa em {decisao.espera:.0f}s, adiada para a fila de atraso.")
+                        resultado["status"] = "ADIADO"
+                        break
+                    log_funcionamento_execucao(id_automacao, empresa_id, cpf, dt_ini, dt_fim, empresa_ie,
+                        f"Falha de {decisao.classe} no período {ini} a {fim}: {resultado['erro']} — "
+                        f"nova tentativa ({decisao.nivel}) em {decisao.espera:.1f}s.")
+                    time.sleep(decisao.espera)
+        finally:
+            # Sessão que volta logada ao pool leva a vaga junto: a próxima tarefa do contador reaproveita o login
+            vaga.manter = sessao is not None and sessao_ok
+            if sessao is not None:
+                pool.devolver(sessao, descartar=not sessao_ok)
+    return resultado
+
+
+def consolidar_empresa(resultados):
+    """Junta os resultados dos períodos de uma IE/operação no formato do relatório final."""
+    for status in ("INVALID_LOGIN", "ERROR", "ADIADO", "PERMISSAO_NEGADA"):
+        for r in resultados:
+            if r["status"] == status:
+                # Adiada que não pôde mais voltar pela fila de atraso conta como erro
+                return ("ERROR" if status == "ADIADO" else status), r["erro"]
+    if resultados and all(r["status"] == "SEM_RESULTADO" for r in resultados):
+        return "OK", resultados[0]["erro"]
+    return "OK", ""
+
+
+def novo_ingestao(ctx, armazem=None):
+    """IngestaoJob na pasta da consulta: os ZIPs vão sendo extraídos e indexados enquanto as outras tarefas baixam."""
+    return IngestaoJob(ctx.destino_base, INGESTAO_INDICE, id_automacao=ctx.id_automacao,
+                       armazem=armazem, manter_zips=ARMAZEM_MANTER_ZIPS)
+
+
+def aguardar_ingestao(ctx, ingestao):
+    resumo = ingestao.aguardar()
+    ingestao.fechar()
+    log_monitoramento(f"Ingestão {ctx.id_automacao}: {resumo['arquivos']} ZIP(s), {resumo['notas']} NF-e indexadas "
+                      f"em {os.path.join(ctx.destino_base, INGESTAO_INDICE)} ({resumo['erros']} XML(s) ilegíveis)")
+    for ie, falha in resumo["falhas"]:
+        log_erro_execucao(ctx.id_automacao, ctx.empresa_id, ctx.cpf, ctx.dt_ini, ctx.dt_fim, ie, f"Falha na ingestão do ZIP {falha}")
+
+
+def planejar_tarefas(ctx, empresas, cobertura=None, armazem=None, ingestao=None):
+    """
+    Quebra a consulta em tarefas (IE, operação, período). Intervalos já baixados por outro job
+    ou encerrados numa entrega anterior viram resultados prontos, sem tarefa. Retorna
+    (tarefas, resultados_empresa, pendentes_empresa), pelo índice da IE em `empresas`.
+    """
+    id_automacao, empresa_id, cpf, dt_ini, dt_fim = ctx.id_automacao, ctx.empresa_id, ctx.cpf, ctx.dt_ini, ctx.dt_fim
+    # Períodos já encerrados numa entrega anterior desta mesma mensagem não são baixados de novo
+    checkpoints = get_checkpoints()
+    concluidos = checkpoints.concluidos(id_automacao, cpf)
+    tarefas = []
+    resultados_empresa = {}
+    pendentes_empresa = {}
+    for idx, empresa in enumerate(empresas):
+        empresa_ie = empresa["ie"]
+        resultados_empresa[idx] = []
+        pendentes_empresa[idx] = 0
+        oper = str(empresa.get("oper", "0")).strip()
+        destino = os.path.join(ctx.destino_base, empresa_ie)
+
+        # Intervalos já baixados (por este ou outro job) saem dos arquivos existentes
+        lacunas = [(ctx.data_inicial, ctx.data_final)]
+        if cobertura is not None:
+            lacunas, reaproveitados = cobertura.planejar(cpf, empresa_ie, oper, ctx.data_inicial, ctx.data_final)
+            for coberto in reaproveitados:
+                resultados_empresa[idx].append({
+                    "status": coberto["status"], "erro": coberto["erro"], "total_notas": coberto["total_notas"],
+                    "arquivos": materializar(coberto["arquivos"], destino, armazem)
+                })
+                if ingestao is not None:
+                    ingestao.adicionar(resultados_empresa[idx][-1]["arquivos"], empresa_ie, oper)
+            if reaproveitados:
+                log_funcionamento_execucao(id_automacao, empresa_id, cpf, dt_ini, dt_fim, empresa_ie,
+                    f"{len(reaproveitados)} intervalo(s) já baixado(s) reaproveitado(s): " +
+                    ", ".join(f"{c['ini']} a {c['fim']}" for c in reaproveitados))
 
+        # Períodos encerrados numa entrega anterior saem das lacunas, mesmo que o plano de janelas tenha mudado
+        encerrados = [(p_ini, p_fim) for (ie, op, p_ini, p_fim) in concluidos if ie == empresa_ie and op == oper]
+        lacunas, usados = subtrair_intervalos(lacunas, encerrados)
+        for p_ini, p_fim in usados:
+            resultados_empresa[idx].append(concluidos[(empresa_ie, oper, p_ini, p_fim)])
+            if ingestao is not None:
+                ingestao.adicionar(concluidos[(empresa_ie, oper, p_ini, p_fim)]["arquivos"], empresa_ie, oper)
+
+        perfil = PerfilVolume.carregar(checkpoints, cpf, empresa_ie, oper) if PLANO_ADAPTATIVO else None
+        periodos = [p for ini, fim in lacunas for p in dividir_periodo(ini, fim, PLANO_DIAS_PADRAO, perfil)]
+        for ini, fim in periodos:
+            tarefas.append(Tarefa(idx, empresa_ie, oper, ini, fim, destino))
+            pendentes_empresa[idx] += 1
+        estimativa = f", ~{perfil.media:.0f} notas/dia pelo histórico" if perfil is not None and not perfil.vazio else ""
+        log_funcionamento_execucao(id_automacao, empresa_id, cpf, dt_ini, dt_fim, empresa_ie,
+            f"------ IE {empresa_ie} (oper {oper}): {len(periodos)} períodos agendados{estimativa} "
+            f"({len(usados)} já concluídos em entrega anterior) ------"
+        )
+    return tarefas, resultados_empresa, pendentes_empresa
+
+
+def registrar_tarefa(ctx, tarefa, resultado, cobertura=None):
+    """Grava o resultado da tarefa nos checkpoints (retomada) e na cobertura (reaproveitamento entre jobs)."""
+    if sem_arquivos(resultado["status"], resultado.get("total_notas"), resultado.get("arquivos")):
+        # Sem os arquivos não há o que retomar nem reaproveitar: o período fica para ser baixado de novo
+        resultado = {**resultado, "status": "ERROR", "erro": "Período com notas, mas nenhum arquivo foi salvo."}
+    if resultado["status"] != "INVALID_LOGIN":
+        get_checkpoints().registrar(ctx.id_automacao, ctx.cpf, tarefa.ie, tarefa.oper, tarefa.ini, tarefa.fim, resultado["status"],
+                                    resultado.get("total_notas", 0), resultado.get("erro", ""), resultado.get("arquivos"))
+    if cobertura is not None:
+        cobertura.registrar(ctx.cpf, tarefa.ie, tarefa.oper, tarefa.ini, tarefa.fim, resultado["status"],
+                            resultado.get("total_notas", 0), resultado.get("erro", ""), resultado.get("arquivos"))
+
+
+def finalizar_consulta(ctx, empresas, resultados_empresa, caminho_xmls):
+    """Relatório final (Discord) e retorno da consulta. Retorna o status enviado."""
+    id_automacao, empresa_id, token = ctx.id_automacao, ctx.empresa_id, ctx.token
+    data_inicial, data_final = ctx.data_inicial, ctx.data_final
+
+    if ctx.login_invalido.is_set():
+        # Parar execução imediatamente
+        mensagem = (
+            "----- RELATÓRIO FINAL -----\n\n"
+            f"Empresa: {empresa_id}\n"
+            f"Período: {data_inicial} até {data_final}\n\n"
+            f"🔒 ERRO CRÍTICO: Usuário ou senha inválidos. Execução abortada.\n"
+        )
+        enviar_discord_mensagem(f"```\n{mensagem}\n```", secrets.DISCORD_WEBHOOK)
+        enviar_retorno(id_automacao, token, status="INVALID", obs="Usuário ou senha inválidos.")
+        return "INVALID"
+
+    resultado_final = []
+    total_geral_notas = 0
+    for idx in sorted(resultados_empresa):
+        empresa_ie = empresas[idx]["ie"]
+        status_ie, erro_ie = consolidar_empresa(resultados_empresa[idx])
+        total_geral_notas += sum(r["total_notas"] for r in resultados_empresa[idx])
         resultado_final.append({
             "ie": empresa_ie,
             "status": status_ie,
             "erro": erro_ie
         })
-        if status_ie in ("OK", "PERMISSAO_NEGADA", "SEM_RESULTADO"):
-            salvar_controle_ie(id_automacao, empresa_id, cpf, dt_ini, dt_fim, empresa_ie, LOG_CONTROLE)
-
-    
 
     # Relatório único
     ies_sucesso = []
@@ -628,5 +949,180 @@ def process_message(message, properties=None):
     if any(r["status"] == "ERROR" for r in resultado_final):
         status_final = "ERROR"
     enviar_retorno(id_automacao, token, status=status_final, obs="", caminho_xmls=";".join(caminho_xmls))
+    return status_final
+
+
+def process_message(message, properties=None):
+    pool = get_pool(fabrica=iniciar_driver)
+    ctx = ContextoJob(message, properties)
+    id_automacao, empresa_id, cpf, token = ctx.id_automacao, ctx.empresa_id, ctx.cpf, ctx.token
+    dt_ini, dt_fim = ctx.dt_ini, ctx.dt_fim
+    empresas = expandir_empresas(message["empresas"])
+    total_ies = len(empresas)
+    caminho_xmls = [ctx.destino_base]
+
+    enviar_retorno(id_automacao, token, status="PROCESSING", obs=f"Iniciando processamento de {total_ies} IEs.")
+    cobertura = get_cobertura() if COBERTURA_ATIVA else None
+    armazem = get_armazem() if INGESTAO_ATIVA and ARMAZEM_ATIVO else None
+    ingestao = novo_ingestao(ctx, armazem) if INGESTAO_ATIVA else None
+
+    # Quebra a mensagem em tarefas (IE, operação, período) que rodam em paralelo
+    tarefas, resultados_empresa, pendentes_empresa = planejar_tarefas(ctx, empresas, cobertura, armazem, ingestao)
+
+    paralelas = max(1, min(TAREFAS_PARALELAS_POR_JOB, MAX_SESSOES_POR_CONTADOR, pool.tamanho_max))
+    empresas_concluidas = 0
+    for idx in resultados_empresa:
+        if pendentes_empresa[idx] == 0:
+            empresas_concluidas += 1
+            atualizar_status_parcial(id_automacao, token, empresas[idx]["ie"], empresas_concluidas, len(resultados_empresa),
+                                     empresa_id, cpf, dt_ini, dt_fim, caminho_xmls=";".join(caminho_xmls))
+    with ThreadPoolExecutor(max_workers=paralelas, thread_name_prefix=f"job-{id_automacao}") as executor:
+        futuros = {executor.submit(executar_tarefa, ctx, tarefa, pool): tarefa for tarefa in tarefas}
+        for futuro in as_completed(futuros):
+            tarefa = futuros[futuro]
+            try:
+                resultado = futuro.result()
+            except Exception as e:
+                resultado = {"status": "ERROR", "erro": mapear_erro_legivel(e), "total_notas": 0}
+            registrar_tarefa(ctx, tarefa, resultado, cobertura)
+            resultados_empresa[tarefa.indice_empresa].append(resultado)
+            if ingestao is not None and resultado["status"] == "OK":
+                ingestao.adicionar(resultado.get("arquivos"), tarefa.ie, tarefa.oper)
+            pendentes_empresa[tarefa.indice_empresa] -= 1
+            if pendentes_empresa[tarefa.indice_empresa] == 0:
+                empresas_concluidas += 1
+                atualizar_status_parcial(id_automacao, token, tarefa.ie, empresas_concluidas, len(resultados_empresa),
+                                         empresa_id, cpf, dt_ini, dt_fim, caminho_xmls=";".join(caminho_xmls))
+
+    if ingestao is not None:
+        aguardar_ingestao(ctx, ingestao)
+
+    repetir = [r for rs in resultados_empresa.values() for r in rs if r["status"] in ("ERROR", "ADIADO")]
+    if repetir and ctx.pode_adiar and not ctx.login_invalido.is_set():
+        # Os períodos encerrados ficam nos checkpoints: a reentrega só refaz os que falharam ou foram adiados
+        adiados = sum(r["status"] == "ADIADO" for r in repetir)
+        motivo = f"{len(repetir)} período(s) a refazer ({adiados} adiado(s)): {repetir[0]['erro']}"
+        enviar_retorno(id_automacao, token, status="PROCESSING", obs=f"{motivo}. Consulta reagendada.")
+        raise ReagendarConsulta(motivo)
+
+    if finalizar_consulta(ctx, empresas, resultados_empresa, caminho_xmls) != "INVALID":
+        log_monitoramento(f"Tempos das telas SEFAZ (acumulado do processo): {ESTATISTICAS.resumo()}")
+
+
+def _cabecalhos(ctx):
+    return {"identificador": ctx.empresa_id, "token": ctx.token}
+
+
+def planejar_consulta(message, properties=None):
+    """
+    Modo distribuído: planeja a consulta e publica uma mensagem por tarefa (IE, operação, período)
+    em RABBITMQ_QUEUE_TAREFAS, consumida pelos workers de qualquer máquina. O plano vai antes para
+    o agregador, que publica o progresso e o retorno final quando todas as tarefas terminarem.
+    """
+    ctx = ContextoJob(message, properties)
+    empresas = expandir_empresas(message["empresas"])
+    enviar_retorno(ctx.id_automacao, ctx.token, status="PROCESSING", obs=f"Iniciando processamento de {len(empresas)} IEs.")
+    cobertura = get_cobertura() if COBERTURA_ATIVA else None
+    armazem = get_armazem() if INGESTAO_ATIVA and ARMAZEM_ATIVO else None
+    ingestao = novo_ingestao(ctx, armazem) if INGESTAO_ATIVA else None
+    tarefas, resultados_empresa, _ = planejar_tarefas(ctx, empresas, cobertura, armazem, ingestao)
+    if ingestao is not None:
+        aguardar_ingestao(ctx, ingestao)
+
+    consulta = {k: v for k, v in message.items() if k not in ("empresas", "contador", "_headers")}
+    cabecalhos = _cabecalhos(ctx)
+    # O agregador não precisa (nem guarda) a senha do contador
+    plano = {
+        "tipo": "plano",
+        "id": ctx.id_automacao,
+        "consulta": {**consulta, "contador": {"cpf": ctx.cpf, "senha": ""}, "_headers": cabecalhos},
+        "empresas": [{"ie": e["ie"], "oper": str(e.get("oper", "0")).strip()} for e in empresas],
+        "tarefas": [[t.indice_empresa, t.ini, t.fim] for t in tarefas],
+        "resolvidos": {str(idx): resultados for idx, resultados in resultados_empresa.items() if resultados},
+    }
+    # Publicado (e confirmado) antes das tarefas: o agregador só finaliza conhecendo todas elas
+    publicar(RABBITMQ_QUEUE_RESULTADOS, plano, headers=cabecalhos, persistente=True)
+    for tarefa in tarefas:
+        publicar(RABBITMQ_QUEUE_TAREFAS, {
+            **consulta,
+            "contador": message["contador"],
+            "tarefa": {"indice": tarefa.indice_empresa, "ie": tarefa.ie, "oper": tarefa.oper,
+                       "ini": tarefa.ini, "fim": tarefa.fim},
+        }, headers=cabecalhos, persistente=True)
+    log_monitoramento(f"Planejador: consulta {ctx.id_automacao} com {len(empresas)} IE(s) quebrada em {len(tarefas)} "
+                      f"tarefa(s) ({sum(map(len, resultados_empresa.values()))} período(s) já prontos).")
+
+
+def processar_tarefa(message, properties=None):
+    """
+    Modo distribuído: roda uma tarefa publicada pelo planejador e manda o resultado ao agregador.
+    Falha ou adiamento com reentregas sobrando volta pela fila de atraso das tarefas.
+    """
+    pool = get_pool(fabrica=iniciar_driver)
+    ctx = ContextoJob(message, properties)
+    dados = message["tarefa"]
+    tarefa = Tarefa(dados["indice"], dados["ie"], dados["oper"], dados["ini"], dados["fim"],
+                    os.path.join(ctx.destino_base, dados["ie"]))
+    # Reentrega de uma tarefa que já terminou: só repete o resultado para o agregador
+    resultado = get_checkpoints().concluidos(ctx.id_automacao, ctx.cpf).get(
+        (tarefa.ie, tarefa.oper, data_iso(tarefa.ini), data_iso(tarefa.fim)))
+    if resultado is None:
+        try:
+            resultado = executar_tarefa(ctx, tarefa, pool)
+        except Exception as e:
+            resultado = {"status": "ERROR", "erro": mapear_erro_legivel(e), "total_notas": 0}
+        registrar_tarefa(ctx, tarefa, resultado, get_cobertura() if COBERTURA_ATIVA else None)
+        if INGESTAO_ATIVA and resultado["status"] == "OK":
+            ingestao = novo_ingestao(ctx, get_armazem() if ARMAZEM_ATIVO else None)
+            ingestao.adicionar(resultado.get("arquivos"), tarefa.ie, tarefa.oper)
+            aguardar_ingestao(ctx, ingestao)
+
+    if resultado["status"] in ("ERROR", "ADIADO") and ctx.pode_adiar:
+        raise ReagendarConsulta(f"{tarefa}: {resultado['erro']}")
+    publicar(RABBITMQ_QUEUE_RESULTADOS, {"tipo": "resultado", "id": ctx.id_automacao, "tarefa": dados, "resultado": resultado},
+             headers=_cabecalhos(ctx), persistente=True)
+
+
+def agregar_resultado(message, properties=None):
+    """
+    Modo distribuído: junta o plano e os resultados das tarefas de cada consulta (utils.agregador).
+    Publica o progresso de cada IE concluída e, com todas as tarefas encerradas (ou login
+    inválido), o relatório e o retorno final, uma única vez.
+    """
+    agregador = get_agregador()
+    id_automacao = message["id"]
+    if message["tipo"] == "plano":
+        if not agregador.registrar_plano(id_automacao, message):
+            log_monitoramento(f"Agregador: plano da consulta {id_automacao} ignorado, ela já foi finalizada.")
+            return
+    else:
+        dados = message["tarefa"]
+        agregador.registrar_resultado(id_automacao, dados["indice"], dados["ini"], dados["fim"], message["resultado"])
+
+    plano, finalizada = agregador.consulta(id_automacao)
+    if plano is None or finalizada:
+        return
+    ctx = ContextoJob(plano["consulta"], None)
+    empresas = plano["empresas"]
+    caminho_xmls = [ctx.destino_base]
+    resultados = agregador.resultados(id_automacao)
+    resultados_empresa = {idx: list(plano["resolvidos"].get(str(idx), [])) for idx in range(len(empresas))}
+    pendentes_empresa = {idx: 0 for idx in range(len(empresas))}
+    for indice, ini, fim in plano["tarefas"]:
+        resultado = resultados.get(chave_tarefa(indice, ini, fim))
+        if resultado is None:
+            pendentes_empresa[indice] += 1
+            continue
+        resultados_empresa[indice].append(resultado)
+        if resultado["status"] == "INVALID_LOGIN":
+            ctx.login_invalido.set()
 
-    
+    for idx, pendentes in pendentes_empresa.items():
+        if pendentes == 0:
+            atual = agregador.marcar_empresa(id_automacao, idx)
+            if atual:
+                atualizar_status_parcial(id_automacao, ctx.token, empresas[idx]["ie"], atual, len(empresas),
+                                         ctx.empresa_id, ctx.cpf, ctx.dt_ini, ctx.dt_fim, caminho_xmls=";".join(caminho_xmls))
+    if (ctx.login_invalido.is_set() or not any(pendentes_empresa.values())) and agregador.finalizar(id_automacao):
+        status = finalizar_consulta(ctx, empresas, resultados_empresa, caminho_xmls)
+        log_monitoramento(f"Agregador: consulta {id_automacao} finalizada ({status}) com {len(plano['tarefas'])} tarefa(s).")
@@ -2,7 +2,7 @@ import pika
 import json
 import threading
 from config import config, secrets
-from automation.message_processor import process_message
+from message_processor import process_message
 from config.config import LOG_OK
 from utils.logger import log_monitoramento
 
@@ -0,0 +1,156 @@
+import time
+import signal
+import multiprocessing as mp
+from config import config
+from utils.logger import log_monitoramento
+from utils.capacidade import SinalCapacidade
+
+
+def _ignorar_sinais():
+    # Ctrl+C/SIGTERM chegam a todo o grupo de processos; quem decide o encerramento
+    # (e avisa pelo evento `parar`) é o supervisor
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    signal.signal(signal.SIGTERM, signal.SIG_IGN)
+
+
+def executar_consumidor(parar, sinal, limite_chrome):
+    _ignorar_sinais()
+    from automation.driver_pool import definir_limite_processo
+    from api.rabbitmq_consumer import consume_messages
+    definir_limite_processo(limite_chrome)
+    if config.MODO_DISTRIBUIDO:
+        from message_processor import processar_tarefa
+        consume_messages(max_workers=config.TAREFAS_WORKERS, parar=parar, sinal=sinal,
+                         fila=config.RABBITMQ_QUEUE_TAREFAS, processar=processar_tarefa)
+    else:
+        consume_messages(parar=parar, sinal=sinal)
+
+
+def executar_planejador(parar):
+    _ignorar_sinais()
+    from api.rabbitmq_consumer import consume_messages
+    from message_processor import planejar_consulta
+    consume_messages(max_workers=config.PLANEJADOR_WORKERS, parar=parar, processar=planejar_consulta,
+                     usar_disjuntor=False)
+
+
+def executar_agregador(parar):
+    _ignorar_sinais()
+    from api.rabbitmq_consumer import consume_messages
+    from message_processor import agregar_resultado
+    # Um worker só: os resultados de uma consulta são agregados em ordem
+    consume_messages(max_workers=1, parar=parar, fila=config.RABBITMQ_QUEUE_RESULTADOS,
+                     processar=agregar_resultado, usar_disjuntor=False)
+
+
+def executar_monitor(parar, sinal):
+    _ignorar_sinais()
+    from utils.resource_monitor import monitor_resources
+    monitor_resources(parar=parar, sinal=sinal)
+
+
+class Supervisor:
+    """
+    Mantém N processos consumidores e o monitor de recursos rodando.
+
+    - O monitor publica a capacidade da máquina em um SinalCapacidade compartilhado,
+      que os consumidores usam para ajustar a concorrência.
+    - Processo que morre é reiniciado, com espera crescente se cair logo após subir.
+    - No modo distribuído os consumidores atendem a fila de tarefas; o planejador (consultas)
+      e, se AGREGADOR_ATIVO, o agregador (resultados) rodam em processos próprios, sem Chrome.
+    - SIGTERM/SIGINT sinalizam `parar`: os consumidores param de receber mensagens,
+      terminam o que está em andamento e saem; quem passar do tempo de drenagem é terminado.
+    """
+
+    def __init__(self, workers=config.SUPERVISOR_WORKERS):
+        self.workers = workers
+        self.parar = mp.Event()
+        self.sinal = SinalCapacidade()
+        self.processos = {}
+        self._sinal_recebido = None
+
+    def _especificacoes(self):
+        limite_chrome = max(1, config.MAX_CHROME_INSTANCES // self.workers)
+        specs = {"monitor": (executar_monitor, (self.parar, self.sinal))}
+        for i in range(1, self.workers + 1):
+            specs[f"consumidor-{i}"] = (executar_consumidor, (self.parar, self.sinal, limite_chrome))
+        if config.MODO_DISTRIBUIDO:
+            specs["planejador"] = (executar_planejador, (self.parar,))
+            if config.AGREGADOR_ATIVO:
+                specs["agregador"] = (executar_agregador, (self.parar,))
+        return specs
+
+    def _iniciar(self, nome, alvo, args, falhas=0):
+        processo = mp.Process(target=alvo, args=args, name=nome)
+        processo.start()
+        self.processos[nome] = {
+            "processo": processo, "alvo": alvo, "args": args,
+            "inicio": time.time(), "falhas": falhas, "reiniciar_em": None,
+        }
+        log_monitoramento(f"Supervisor: {nome} iniciado (pid {processo.pid}).")
+
+    def _sinal(self, signum, frame):
+        # Só marca: mexer no Event (e nos locks dele) dentro do handler pode travar o processo
+        self._sinal_recebido = signum
+
+    def _verificar(self):
+        agora = time.time()
+        for nome, info in list(self.processos.items()):
+            processo = info["processo"]
+            if processo.is_alive():
+                continue
+            if info["reiniciar_em"] is None:
+                # Caiu pouco depois de subir: espera cada vez mais antes de tentar de novo
+                falhas = info["falhas"] + 1 if agora - info["inicio"] < config.SUPERVISOR_VIDA_MINIMA else 0
+                espera = min(2 ** falhas, config.SUPERVISOR_ESPERA_MAXIMA) if falhas else 0
+                info["falhas"] = falhas
+                info["reiniciar_em"] = agora + espera
+                log_monitoramento(
+                    f"Supervisor: {nome} (pid {processo.pid}) terminou com código {processo.exitcode}; "
+                    f"reiniciando em {espera}s."
+                )
+            if agora >= info["reiniciar_em"]:
+                self._iniciar(nome, info["alvo"], info["args"], info["falhas"])
+
+    def _drenar(self):
+        limite = time.time() + config.SUPERVISOR_DRENAGEM_TIMEOUT
+        for nome, info in self.processos.items():
+            processo = info["processo"]
+            processo.join(max(0, limite - time.time()))
+            if processo.is_alive():
+                log_monitoramento(f"Supervisor: {nome} não terminou a tempo, finalizando à força.")
+                processo.kill()
+                processo.join(10)
+
+    def _dormir(self, segundos, passo=0.5):
+        # O sinal não encurta o time.sleep (PEP 475: o sleep é retomado depois do handler),
+        # então dorme em passos curtos e confere a marca do handler entre eles
+        limite = time.monotonic() + segundos
+        while self._sinal_recebido is None:
+            restante = limite - time.monotonic()
+            if restante <= 0:
+                break
+            time.sleep(min(passo, restante))
+
+    def executar(self):
+        signal.signal(signal.SIGINT, self._sinal)
+        signal.signal(signal.SIGTERM, self._sinal)
+        if hasattr(signal, "SIGBREAK"):
+            signal.signal(signal.SIGBREAK, self._sinal)
+
+        for nome, (alvo, args) in self._especificacoes().items():
+            self._iniciar(nome, alvo, args)
+
+        # Dorme entre as verificações; depois de um sinal o laço termina em até meio segundo
+        while self._sinal_recebido is None:
+            self._verificar()
+            self._dormir(config.SUPERVISOR_INTERVALO)
+
+        log_monitoramento(f"Supervisor: sinal {self._sinal_recebido} recebido, encerrando workers.")
+        self.parar.set()
+        self._drenar()
+        log_monitoramento("Supervisor: todos os workers encerrados.")
+
+
+def executar_supervisor(workers=None):
+    Supervisor(workers or config.SUPERVISOR_WORKERS).executar()
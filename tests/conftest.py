@@ -0,0 +1,17 @@
+import os
+import sys
+import tempfile
+import importlib.machinery
+from pathlib import Path
+
+RAIZ = Path(__file__).resolve().parent.parent
+
+# O config.py legado na raiz esconde o pacote config/ (sem __init__) quando a raiz está no
+# sys.path. Registra config como namespace apontando para config/ antes de qualquer import.
+sys.path.insert(0, str(RAIZ))
+_spec = importlib.machinery.ModuleSpec("config", None, is_package=True)
+_spec.submodule_search_locations = [str(RAIZ / "config")]
+sys.modules["config"] = importlib.util.module_from_spec(_spec)
+
+# Os caminhos de config/config.py são relativos fora do Windows: cria os diretórios num temporário
+os.chdir(tempfile.mkdtemp(prefix="saam-testes-"))
@@ -0,0 +1,51 @@
+import pytest
+
+from utils.agregador import AgregadorConsultas, chave_tarefa
+
+
+@pytest.fixture
+def agregador(tmp_path):
+    agregador = AgregadorConsultas(tmp_path / "agregador.sqlite3")
+    yield agregador
+    agregador.fechar()
+
+
+def test_chave_tarefa_normaliza_datas():
+    assert chave_tarefa("1", "31/01/2024", "2024-02-29") == (1, "2024-01-31", "2024-02-29")
+
+
+def test_resultado_antes_do_plano_conta_quando_ele_chega(agregador):
+    assert agregador.consulta("9") == (None, False)
+    assert agregador.registrar_resultado("9", 0, "01/01/2024", "31/01/2024", {"status": "OK"})
+    assert agregador.registrar_plano("9", {"tarefas": [[0, "01/01/2024", "31/01/2024"]], "resolvidos": {}})
+    plano, finalizada = agregador.consulta("9")
+    assert plano["tarefas"] == [[0, "01/01/2024", "31/01/2024"]] and not finalizada
+    assert agregador.resultados("9") == {(0, "2024-01-01", "2024-01-31"): {"status": "OK"}}
+
+
+def test_reentrega_de_resultado(agregador):
+    assert agregador.registrar_resultado("9", 0, "01/01/2024", "31/01/2024", {"status": "ERROR"})
+    assert not agregador.registrar_resultado("9", 0, "01/01/2024", "31/01/2024", {"status": "OK"})
+    assert agregador.resultados("9")[(0, "2024-01-01", "2024-01-31")] == {"status": "OK"}
+
+
+def test_empresa_concluida_conta_uma_vez(agregador):
+    assert agregador.marcar_empresa("9", 0) == 1
+    assert agregador.marcar_empresa("9", 0) == 0
+    assert agregador.marcar_empresa("9", 1) == 2
+
+
+def test_finaliza_uma_vez_e_congela_o_plano(agregador):
+    agregador.registrar_plano("9", {"tarefas": []})
+    assert agregador.finalizar("9")
+    assert not agregador.finalizar("9")
+    assert not agregador.registrar_plano("9", {"tarefas": [[0, "01/01/2024", "31/01/2024"]]})
+    assert agregador.consulta("9") == ({"tarefas": []}, True)
+
+
+def test_remover_antigos(agregador):
+    agregador.registrar_plano("9", {"tarefas": []})
+    agregador.marcar_empresa("9", 0)
+    assert agregador.remover_antigos(dias=-1) == 1
+    assert agregador.consulta("9") == (None, False)
+    assert agregador.marcar_empresa("9", 0) == 1
@@ -0,0 +1,90 @@
+import os
+import time
+from datetime import datetime, timedelta
+
+import pytest
+
+from utils.checkpoints import CheckpointStore
+from utils.cobertura import IndiceCobertura, materializar
+
+
+@pytest.fixture
+def indice(tmp_path):
+    return IndiceCobertura(tmp_path / "checkpoints.sqlite3", frescor_dias=5, ttl=3600)
+
+
+def test_so_consulta_o_que_falta(indice, tmp_path):
+    zip_ = tmp_path / "a.zip"
+    zip_.write_bytes(b"x")
+    indice.registrar("111", "101", "1", "01/01/2024", "30/06/2024", "OK", 10, arquivos=[str(zip_)])
+    lacunas, reaproveitados = indice.planejar("111", "101", "1", "01/01/2024", "31/12/2024")
+    assert lacunas == [("2024-07-01", "2024-12-31")]
+    assert [(r["ini"].isoformat(), r["fim"].isoformat()) for r in reaproveitados] == [("2024-01-01", "2024-06-30")]
+
+
+def test_status_sem_garantia_nao_cobre(indice):
+    indice.registrar("111", "101", "1", "01/01/2024", "31/01/2024", "ERROR")
+    lacunas, reaproveitados = indice.planejar("111", "101", "1", "01/01/2024", "31/01/2024")
+    assert lacunas == [("2024-01-01", "2024-01-31")] and reaproveitados == []
+
+
+def test_cobertura_e_por_ie_e_operacao(indice):
+    indice.registrar("111", "101", "1", "01/01/2024", "31/01/2024", "SEM_RESULTADO")
+    assert indice.planejar("111", "101", "0", "01/01/2024", "31/01/2024")[0] == [("2024-01-01", "2024-01-31")]
+    assert indice.planejar("111", "202", "1", "01/01/2024", "31/01/2024")[0] == [("2024-01-01", "2024-01-31")]
+
+
+def test_arquivo_apagado_invalida_a_cobertura(indice, tmp_path):
+    zip_ = tmp_path / "a.zip"
+    zip_.write_bytes(b"x")
+    indice.registrar("111", "101", "1", "01/01/2024", "31/01/2024", "OK", 1, arquivos=[str(zip_)])
+    assert indice.planejar("111", "101", "1", "01/01/2024", "31/01/2024")[0] == []
+    zip_.unlink()
+    assert indice.planejar("111", "101", "1", "01/01/2024", "31/01/2024")[0] == [("2024-01-01", "2024-01-31")]
+
+
+def test_dias_recentes_vencem_depois_do_ttl(indice):
+    agora = time.time()
+    buscado_em = agora - 2 * 3600
+    fim = datetime.fromtimestamp(buscado_em).date()
+    assert indice.fim_efetivo(fim, agora - 60, agora) == fim
+    assert indice.fim_efetivo(fim, buscado_em, agora) == fim - timedelta(days=5)
+
+
+def test_materializar_liga_no_destino(tmp_path):
+    origem = tmp_path / "origem" / "a.zip"
+    origem.parent.mkdir()
+    origem.write_bytes(b"zip")
+    destino = tmp_path / "destino"
+    copiados = materializar([str(origem)], str(destino))
+    assert copiados == [os.path.join(str(destino), "a.zip")]
+    assert (destino / "a.zip").read_bytes() == b"zip"
+
+
+def test_ok_com_notas_e_sem_arquivos_nao_cobre(indice):
+    indice.registrar("111", "101", "1", "01/01/2024", "31/01/2024", "OK", 10, arquivos=[])
+    assert indice.planejar("111", "101", "1", "01/01/2024", "31/01/2024")[0] == [("2024-01-01", "2024-01-31")]
+
+
+def test_linha_antiga_sem_arquivos_e_ignorada(indice):
+    # Gravada antes de registrar passar a recusar esse caso
+    with indice._conexao() as conexao:
+        conexao.execute("INSERT INTO cobertura (cpf, ie, oper, ini, fim, status, total_notas, arquivos, buscado_em) "
+                        "VALUES ('111', '101', '1', '2024-01-01', '2024-01-31', 'OK', 10, '[]', ?)", (time.time(),))
+    assert indice.planejar("111", "101", "1", "01/01/2024", "31/01/2024")[0] == [("2024-01-01", "2024-01-31")]
+
+
+def test_checkpoint_ok_sem_arquivos_nao_e_retomado(tmp_path):
+    store = CheckpointStore(tmp_path / "checkpoints.sqlite3")
+    store.registrar("9", "111", "101", "1", "01/01/2024", "31/01/2024", "OK", 10, arquivos=[])
+    store.registrar("9", "111", "101", "1", "01/02/2024", "29/02/2024", "SEM_RESULTADO")
+    assert list(store.concluidos("9", "111")) == [("101", "1", "2024-02-01", "2024-02-29")]
+    store.fechar()
+
+
+def test_intervalo_maior_que_o_pedido_nao_e_reaproveitado(indice, tmp_path):
+    zip_ = tmp_path / "ano.zip"
+    zip_.write_bytes(b"x")
+    indice.registrar("111", "101", "1", "01/01/2024", "31/12/2024", "OK", 1200, arquivos=[str(zip_)])
+    lacunas, reaproveitados = indice.planejar("111", "101", "1", "01/03/2024", "30/04/2024")
+    assert lacunas == [("2024-03-01", "2024-04-30")] and reaproveitados == []
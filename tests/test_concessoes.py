@@ -0,0 +1,61 @@
+import sqlite3
+import time
+
+import pytest
+
+from utils.concessoes import ConcessoesLogin, ConcessoesMemoria, ConcessoesSqlite, SemVaga
+
+
+@pytest.fixture(params=["memoria", "sqlite"])
+def backend(request, tmp_path):
+    if request.param == "memoria":
+        yield ConcessoesMemoria()
+        return
+    backend = ConcessoesSqlite(tmp_path / "concessoes.sqlite3")
+    yield backend
+    backend.fechar()
+
+
+def test_limite_por_cpf_entre_processos(backend):
+    a = ConcessoesLogin(backend, limite=1, ttl=60, intervalo_espera=0.01, dono="a")
+    b = ConcessoesLogin(backend, limite=1, ttl=60, intervalo_espera=0.01, dono="b")
+    vaga = a.adquirir("111")
+    with pytest.raises(SemVaga):
+        b.adquirir("111", timeout=0.05)
+    assert b.adquirir("222", timeout=0.05) == 0
+    a.devolver("111", vaga)
+    assert b.adquirir("111", timeout=0.05) == 0
+
+
+def test_vaga_ociosa_fica_com_o_processo_ate_outro_pedir(backend):
+    a = ConcessoesLogin(backend, limite=1, ttl=60, intervalo_espera=0.01, dono="a")
+    b = ConcessoesLogin(backend, limite=1, ttl=60, intervalo_espera=0.01, dono="b")
+    a.devolver("111", a.adquirir("111"), manter=True)
+    assert a.adquirir("111", timeout=0.05) == 0
+    a.devolver("111", 0, manter=True)
+    with pytest.raises(SemVaga):
+        b.adquirir("111", timeout=0.05)
+    backend.tentar("111", "b", 1, 60)  # b volta a esperar pela vaga
+    a.renovar()
+    assert b.adquirir("111", timeout=0.05) == 0
+
+
+def test_vaga_de_dono_que_caiu_vence(backend):
+    assert backend.tentar("111", "morto", 1, 0.05) == 0
+    assert backend.tentar("111", "vivo", 1, 60) is None
+    time.sleep(0.1)
+    assert backend.tentar("111", "vivo", 1, 60) == 0
+
+
+def test_tentar_desfaz_a_transacao_em_erro(tmp_path):
+    backend = ConcessoesSqlite(tmp_path / "concessoes.sqlite3")
+    assert backend.tentar("111", "morto", 1, 0.01) == 0
+    time.sleep(0.05)
+    backend._conexao().execute("DROP TABLE esperas")
+    with pytest.raises(sqlite3.OperationalError):
+        backend.tentar("111", "vivo", 1, 60)
+    conexao = backend._conexao()
+    assert not conexao.in_transaction
+    # O DELETE da vaga vencida foi desfeito junto
+    assert conexao.execute("SELECT dono FROM concessoes").fetchone()["dono"] == "morto"
+    backend.fechar()
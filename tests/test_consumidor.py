@@ -0,0 +1,52 @@
+import threading
+import time
+
+from api import filas_atraso
+from api.rabbitmq_consumer import consume_messages
+from benchmarks.broker_falso import BrokerFalso, CanalFalso
+
+FILA = "consulta-teste"
+
+
+def _falhar(mensagem, properties):
+    raise filas_atraso.ReagendarConsulta("portal fora")
+
+
+def _consumir(broker, ate):
+    parar = threading.Event()
+    thread = threading.Thread(target=consume_messages, kwargs=dict(
+        max_workers=1, parar=parar, conexao_factory=broker.conectar, processar=_falhar,
+        fila=FILA, usar_disjuntor=False))
+    thread.start()
+    limite = time.time() + 5
+    while not ate() and time.time() < limite:
+        time.sleep(0.02)
+    parar.set()
+    thread.join(10)
+    assert not thread.is_alive()
+
+
+def test_reagendada_so_sai_da_fila_depois_de_publicada():
+    broker = BrokerFalso(latencia_conexao=0, latencia_publicacao=0)
+    broker.enfileirar(FILA, b'{"id": 1}')
+    atraso = filas_atraso.fila_atraso(filas_atraso.FILAS_ATRASO[0], FILA)
+    _consumir(broker, lambda: broker.confirmadas)
+    assert broker.confirmadas == 1
+    assert broker.total(atraso) == 1
+    assert broker.total(FILA) == 0
+
+
+def test_falha_ao_publicar_no_atraso_devolve_a_original(monkeypatch):
+    broker = BrokerFalso(latencia_conexao=0, latencia_publicacao=0)
+    broker.enfileirar(FILA, b'{"id": 1}')
+    publicar = CanalFalso.basic_publish
+
+    def recusar(self, exchange, routing_key, body, properties=None, mandatory=False):
+        if ".atraso." in routing_key:
+            raise Exception("NACK do broker")
+        return publicar(self, exchange, routing_key, body, properties, mandatory)
+
+    monkeypatch.setattr(CanalFalso, "basic_publish", recusar)
+    _consumir(broker, lambda: any(evento == "nack" for _, evento, _, _ in broker.historico))
+    assert broker.confirmadas == 0
+    assert broker.total(FILA) == 1
@@ -0,0 +1,71 @@
+import time
+
+import pytest
+
+from utils.disjuntor import DisjuntorPortal, e_queda
+
+QUEDA = "O site demorou demais para responder. Tente novamente mais tarde ou reduza o período de busca."
+
+
+@pytest.fixture
+def criar(tmp_path):
+    criados = []
+
+    def criar(sonda=lambda: True, **kwargs):
+        disjuntor = DisjuntorPortal(tmp_path / "disjuntor.sqlite3", sonda, **kwargs)
+        criados.append(disjuntor)
+        return disjuntor
+    yield criar
+    for disjuntor in criados:
+        disjuntor.fechar()
+
+
+def test_abre_com_falhas_seguidas(criar):
+    disjuntor = criar(limite=3, janela=60)
+    for _ in range(2):
+        assert disjuntor.observar(QUEDA)
+    assert not disjuntor.aberto()
+    disjuntor.observar(QUEDA)
+    assert disjuntor.aberto()
+
+
+def test_sucesso_zera_as_falhas(criar):
+    disjuntor = criar(limite=2, janela=60)
+    disjuntor.observar(QUEDA)
+    disjuntor.registrar_sucesso()
+    disjuntor.observar(QUEDA)
+    assert not disjuntor.aberto()
+
+
+def test_erro_que_nao_e_queda_nao_conta(criar):
+    disjuntor = criar(limite=1)
+    assert not disjuntor.observar("Elemento esperado não foi encontrado no site.")
+    assert not disjuntor.aberto()
+    assert e_queda("Falha na conexão com o navegador ou o site está fora do ar.")
+
+
+def test_estado_e_compartilhado_entre_processos(criar):
+    a, b = criar(limite=2), criar(limite=2)
+    a.observar(QUEDA)
+    b.observar(QUEDA)
+    assert a.aberto() and b.aberto()
+
+
+def test_uma_sonda_por_vez_e_reabre_dobrando_a_espera(criar):
+    disjuntor = criar(sonda=lambda: False, limite=1, espera_base=0.05, espera_maxima=10)
+    outro = criar(limite=1, espera_base=0.05)
+    disjuntor.observar(QUEDA)
+    assert not disjuntor.reservar_sonda()
+    time.sleep(0.06)
+    assert disjuntor.reservar_sonda()
+    assert not outro.reservar_sonda()
+    assert not disjuntor.sondar()
+    assert disjuntor.aberto()
+    assert disjuntor.situacao()["espera"] == pytest.approx(0.1)
+
+
+def test_sonda_com_resposta_fecha(criar):
+    disjuntor = criar(limite=1, espera_base=0)
+    disjuntor.observar(QUEDA)
+    assert disjuntor.reservar_sonda() and disjuntor.sondar()
+    assert not disjuntor.aberto()
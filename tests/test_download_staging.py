@@ -0,0 +1,57 @@
+import os
+import subprocess
+import sys
+
+import psutil
+
+from automation import download_staging
+
+
+def _pasta(base, pid, modificada_em=None):
+    pasta = os.path.join(base, f"{download_staging.PREFIXO}{pid}_abc")
+    os.makedirs(pasta)
+    if modificada_em is not None:
+        os.utime(pasta, (modificada_em, modificada_em))
+    return pasta
+
+
+def test_pasta_de_processo_vivo_fica_mesmo_antiga(tmp_path):
+    pai = psutil.Process(os.getppid())
+    pasta = _pasta(tmp_path, pai.pid, pai.create_time() + 1)
+    assert download_staging.remover_orfas(str(tmp_path)) == 0
+    assert os.path.isdir(pasta)
+
+
+def test_pasta_de_processo_morto_sai(tmp_path):
+    filho = subprocess.Popen([sys.executable, "-c", "pass"])
+    filho.wait()
+    pasta = _pasta(tmp_path, filho.pid)
+    assert download_staging.remover_orfas(str(tmp_path)) == 1
+    assert not os.path.exists(pasta)
+
+
+def test_pid_reaproveitado_sai(tmp_path):
+    # O pid existe, mas o processo começou depois da última modificação da pasta
+    pai = psutil.Process(os.getppid())
+    pasta = _pasta(tmp_path, pai.pid, pai.create_time() - 3600)
+    assert download_staging.remover_orfas(str(tmp_path)) == 1
+    assert not os.path.exists(pasta)
+
+
+def test_pasta_do_proprio_processo_e_de_outros_nomes_ficam(tmp_path):
+    propria = _pasta(tmp_path, os.getpid(), 0)
+    outra = tmp_path / "outra"
+    outra.mkdir()
+    assert download_staging.remover_orfas(str(tmp_path)) == 0
+    assert os.path.isdir(propria) and outra.is_dir()
+
+
+def test_zip_de_outro_periodo_com_o_mesmo_nome_nao_e_sobrescrito(tmp_path):
+    from message_processor import Tarefa, caminho_livre
+    janeiro = Tarefa(0, "101", "1", "01/01/2024", "31/01/2024", str(tmp_path))
+    fevereiro = Tarefa(0, "101", "1", "01/02/2024", "29/02/2024", str(tmp_path))
+    primeiro = caminho_livre(str(tmp_path), "NFe.zip", janeiro.sufixo)
+    open(primeiro, "wb").close()
+    segundo = caminho_livre(str(tmp_path), "NFe.zip", fevereiro.sufixo)
+    assert primeiro == os.path.join(str(tmp_path), "NFe.zip")
+    assert segundo == os.path.join(str(tmp_path), "NFe_p20240201-20240229.zip")
@@ -0,0 +1,54 @@
+import os
+import uuid
+
+import pytest
+
+from automation import browser_driver, download_staging
+from automation.driver_pool import DriverPool, PoolEsgotado
+
+
+class DriverFalso:
+    window_handles = ["1"]
+    current_url = "about:blank"
+
+    def __init__(self, pasta_download):
+        self.pasta_download = pasta_download
+
+    def quit(self):
+        pass
+
+
+@pytest.fixture
+def pool(tmp_path, monkeypatch):
+    def criar_pasta():
+        pasta = os.path.join(tmp_path, f"{download_staging.PREFIXO}{os.getpid()}_{uuid.uuid4().hex[:12]}")
+        os.makedirs(pasta)
+        return pasta
+    monkeypatch.setattr(download_staging, "criar_pasta", criar_pasta)
+    pool = DriverPool(fabrica=DriverFalso, tamanho_max=2, aquecidos=0)
+    yield pool
+    pool.encerrar()
+
+
+def test_fabrica_padrao_e_a_da_automacao():
+    assert DriverPool().fabrica is browser_driver.get_driver
+
+
+def test_chrome_recebe_a_pasta_da_sessao(pool):
+    sessao = pool.adquirir()
+    assert sessao.driver.pasta_download == sessao.pasta_download
+    assert os.path.isdir(sessao.pasta_download)
+
+
+def test_prefere_chrome_logado_com_o_mesmo_cpf(pool):
+    a, b = pool.adquirir(), pool.adquirir()
+    b.marcar_login("111")
+    pool.devolver(b)
+    pool.devolver(a)
+    assert pool.adquirir("111") is b
+
+
+def test_pool_cheio_levanta_pool_esgotado(pool):
+    pool.adquirir(), pool.adquirir()
+    with pytest.raises(PoolEsgotado):
+        pool.adquirir(timeout=0.05)
@@ -0,0 +1,37 @@
+from unittest import mock
+
+import pytest
+
+import message_processor
+from automation.driver_pool import PoolEsgotado
+from utils.concessoes import SemVaga
+from utils.limitador import e_limitacao
+from utils.disjuntor import e_queda
+from message_processor import mapear_erro_legivel
+
+
+@pytest.fixture
+def observadores(monkeypatch):
+    limitador, disjuntor = mock.Mock(), mock.Mock()
+    monkeypatch.setattr(message_processor, "get_limitador", lambda: limitador)
+    monkeypatch.setattr(message_processor, "get_disjuntor", lambda: disjuntor)
+    return limitador, disjuntor
+
+
+def test_timeout_do_portal_alimenta_limitador_e_disjuntor(observadores):
+    limitador, disjuntor = observadores
+    legivel = mapear_erro_legivel(Exception("Timeout ao carregar a pesquisa"))
+    assert legivel.startswith("O site demorou demais para responder")
+    assert e_limitacao(limitador.observar.call_args.args[0])
+    assert e_queda(disjuntor.observar.call_args.args[0])
+
+
+@pytest.mark.parametrize("erro", [
+    PoolEsgotado("Timeout aguardando Chrome livre no pool (4 em uso)."),
+    SemVaga("Sem vaga de login para o contador 000: 2 sessão(ões) em uso."),
+])
+def test_espera_local_nao_alimenta_limitador_nem_disjuntor(observadores, erro):
+    limitador, disjuntor = observadores
+    assert mapear_erro_legivel(erro) == str(erro)
+    limitador.observar.assert_not_called()
+    disjuntor.observar.assert_not_called()
@@ -0,0 +1,105 @@
+import threading
+from types import SimpleNamespace
+from unittest import mock
+
+import pytest
+
+import message_processor
+from utils import logger
+from message_processor import Tarefa, executar_tarefa
+
+
+class DriverFalso:
+    current_url = "https://portal.sefaz.go.gov.br/"
+
+    def execute_script(self, script):
+        pass
+
+
+class SessaoFalsa:
+    def __init__(self, numero):
+        self.id = numero
+        self.usos = 1
+        self.driver = DriverFalso()
+
+    def esquecer_login(self):
+        pass
+
+
+class PoolFalso:
+    def __init__(self):
+        self.entregues = []
+        self.devolvidas = []
+
+    def adquirir(self, cpf, timeout=None):
+        sessao = SessaoFalsa(len(self.entregues) + 1)
+        self.entregues.append(sessao)
+        return sessao
+
+    def devolver(self, sessao, descartar=False):
+        self.devolvidas.append((sessao.id, descartar))
+
+
+class VagaFalsa:
+    manter = False
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+@pytest.fixture
+def ambiente(monkeypatch):
+    disjuntor = mock.Mock(**{"aberto.return_value": False})
+    monkeypatch.setattr(message_processor, "get_disjuntor", lambda: disjuntor)
+    monkeypatch.setattr(message_processor, "get_limitador", lambda: mock.Mock())
+    monkeypatch.setattr(message_processor, "get_checkpoints", lambda: mock.Mock())
+    monkeypatch.setattr(message_processor, "semaforo_contador", lambda cpf: VagaFalsa())
+    monkeypatch.setattr(message_processor, "garantir_login", lambda sessao, cpf, senha: True)
+    monkeypatch.setattr(message_processor, "log_funcionamento_execucao", lambda *a, **k: None)
+    monkeypatch.setattr(message_processor, "log_erro_execucao", lambda *a, **k: None)
+    monkeypatch.setattr(message_processor, "RETENTATIVAS_ESPERA_BASE", {"PASSO": 0, "SESSAO": 0, "TAREFA": 0})
+    screenshot = mock.create_autospec(logger.tirar_screenshot)
+    monkeypatch.setattr(message_processor, "tirar_screenshot", screenshot)
+    ctx = SimpleNamespace(id_automacao="1", empresa_id="2", cpf="00000000000", senha="x", dt_ini="01012024",
+                          dt_fim="31012024", pode_adiar=False, login_verificado=False, login_invalido=threading.Event())
+    tarefa = Tarefa(0, "101", "1", "01/01/2024", "31/01/2024", "destino")
+    return ctx, tarefa, screenshot
+
+
+def test_chrome_quebrado_pega_outro_do_pool(ambiente, monkeypatch):
+    ctx, tarefa, screenshot = ambiente
+    falhas = [Exception("chrome not reachable")]
+
+    def baixar(ctx, sessao, tarefa, pool):
+        if falhas:
+            raise falhas.pop()
+        return {"status": "OK", "erro": "", "total_notas": 5}
+    monkeypatch.setattr(message_processor, "baixar_periodo", baixar)
+
+    pool = PoolFalso()
+    resultado = executar_tarefa(ctx, tarefa, pool)
+
+    assert resultado["status"] == "OK"
+    assert len(pool.entregues) == 2
+    assert pool.devolvidas == [(1, True), (2, False)]
+    screenshot.assert_called_once_with("1_101_01-01-2024_31-01-2024", message_processor.LOG_SCREENSHOTS)
+
+
+def test_falha_de_passo_persistente_sobe_para_tarefa(ambiente, monkeypatch):
+    ctx, tarefa, screenshot = ambiente
+
+    def baixar(ctx, sessao, tarefa, pool):
+        raise Exception("Erro interno do portal ao gerar o download.")
+    monkeypatch.setattr(message_processor, "baixar_periodo", baixar)
+
+    pool = PoolFalso()
+    resultado = executar_tarefa(ctx, tarefa, pool)
+
+    orcamento = message_processor.RETENTATIVAS_ORCAMENTO
+    assert resultado == {"status": "ERROR", "erro": "Erro interno do portal ao gerar o download.", "total_notas": 0}
+    assert len(pool.entregues) == 1 + orcamento["TAREFA"]
+    assert [descartar for _, descartar in pool.devolvidas] == [True] * orcamento["TAREFA"] + [False]
+    assert screenshot.call_count == len(pool.entregues)
@@ -0,0 +1,41 @@
+import importlib
+import pytest
+
+MODULOS = [
+    "config.config",
+    "api.rabbitmq_consumer",
+    "api.rabbitmq_publisher",
+    "api.filas_atraso",
+    "automation.driver_pool",
+    "automation.download_staging",
+    "automation.download_tracker",
+    "automation.http_engine",
+    "automation.sefaz_pages",
+    "message_processor",
+    "supervisor",
+    "main",
+    "utils.logger",
+    "utils.armazem",
+    "utils.capacidade",
+    "utils.checkpoints",
+    "utils.agregador",
+    "utils.cobertura",
+    "utils.concessoes",
+    "utils.disjuntor",
+    "utils.ingestao",
+    "utils.integridade_zip",
+    "utils.limitador",
+    "utils.planejamento",
+    "utils.retentativas",
+]
+
+
+@pytest.mark.parametrize("nome", MODULOS)
+def test_modulo_importa(nome):
+    importlib.import_module(nome)
+
+
+def test_consumidor_usa_processador_atual():
+    import message_processor
+    from api import rabbitmq_consumer
+    assert rabbitmq_consumer.process_message is message_processor.process_message
@@ -0,0 +1,89 @@
+import os
+import zipfile
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from utils.armazem import ArmazemXml
+from utils.ingestao import IngestaoJob, ler_nfe
+
+NS = "http://www.portalfiscal.inf.br/nfe"
+
+
+def _nfe(chave, emitente, destinatario, valor):
+    return (
+        f'<nfeProc xmlns="{NS}"><NFe><infNFe Id="NFe{chave}">'
+        f"<ide><dhEmi>2024-01-15T10:00:00-03:00</dhEmi></ide>"
+        f"<emit><CNPJ>{emitente}</CNPJ></emit><dest><CPF>{destinatario}</CPF></dest>"
+        f"<total><ICMSTot><vNF>{valor}</vNF></ICMSTot></total>"
+        f"</infNFe></NFe><protNFe><infProt><chNFe>{chave}</chNFe></infProt></protNFe></nfeProc>"
+    )
+
+
+@pytest.fixture
+def executor():
+    with ThreadPoolExecutor(2) as executor:
+        yield executor
+
+
+def _zip(caminho, notas):
+    os.makedirs(os.path.dirname(caminho), exist_ok=True)
+    with zipfile.ZipFile(caminho, "w") as arquivo_zip:
+        for nome, conteudo in notas.items():
+            arquivo_zip.writestr(nome, conteudo)
+    return str(caminho)
+
+
+def test_ler_nfe(tmp_path):
+    caminho = tmp_path / "a.xml"
+    caminho.write_text(_nfe("5224", "11222333000144", "12345678900", "150.25"), encoding="utf-8")
+    assert ler_nfe(str(caminho)) == {
+        "tipo": "nfeProc", "chave": "5224", "cnpj_emitente": "11222333000144",
+        "cnpj_destinatario": "12345678900", "dh_emissao": "2024-01-15T10:00:00-03:00", "valor": 150.25,
+    }
+
+
+def test_extrai_e_indexa(tmp_path, executor):
+    caminho = _zip(tmp_path / "101" / "a.zip", {
+        "a.xml": _nfe("1", "111", "999", "10"),
+        "b.xml": _nfe("2", "222", "999", "20"),
+        "quebrado.xml": "<nfeProc>",
+    })
+    job = IngestaoJob(str(tmp_path), executor=executor)
+    job.adicionar([caminho], "101", "1")
+    job.adicionar([caminho], "101", "1")  # Mesmo ZIP duas vezes: uma extração só
+    resumo = job.aguardar()
+    assert resumo == {"arquivos": 1, "notas": 2, "erros": 1, "falhas": []}
+    assert os.path.exists(tmp_path / "101" / "xml" / "a.xml")
+    assert [n["chave"] for n in job.indice.buscar(cnpj="999")] == ["1", "2"]
+    assert job.indice.ja_indexado(caminho)
+    job.fechar()
+
+
+def test_zip_ilegivel_vira_falha_da_ie(tmp_path, executor):
+    caminho = tmp_path / "ruim.zip"
+    caminho.write_bytes(b"nao e zip")
+    job = IngestaoJob(str(tmp_path), executor=executor)
+    job.adicionar([str(caminho)], "101", "1")
+    resumo = job.aguardar()
+    assert resumo["arquivos"] == 0 and resumo["falhas"][0][0] == "101"
+    job.fechar()
+
+
+def test_armazem_guarda_uma_vez_e_reaproveita(tmp_path, executor):
+    armazem = ArmazemXml(tmp_path / "armazem")
+    caminho = _zip(tmp_path / "job1" / "a.zip", {"a.xml": _nfe("1", "111", "999", "10")})
+
+    primeiro = IngestaoJob(str(tmp_path / "job1"), executor=executor, id_automacao="1", armazem=armazem, manter_zips=False)
+    primeiro.adicionar([caminho], "101", "1")
+    assert primeiro.aguardar()["notas"] == 1
+    assert not os.path.exists(caminho) and armazem.conhece_pacote(caminho)
+
+    segundo = IngestaoJob(str(tmp_path / "job2"), executor=executor, id_automacao="2", armazem=armazem)
+    segundo.adicionar([caminho], "101", "1")
+    assert segundo.aguardar()["notas"] == 1
+    assert os.path.exists(tmp_path / "job2" / "101" / "xml" / "a.xml")
+    assert armazem.uso()[0] == 1
+    primeiro.fechar()
+    segundo.fechar()
+    armazem.fechar()
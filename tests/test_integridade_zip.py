@@ -0,0 +1,43 @@
+import zipfile
+
+import pytest
+
+from utils.integridade_zip import verificar_zip
+
+
+@pytest.fixture
+def zip_notas(tmp_path):
+    caminho = tmp_path / "notas.zip"
+    with zipfile.ZipFile(caminho, "w", zipfile.ZIP_DEFLATED) as arquivo_zip:
+        for i in range(3):
+            arquivo_zip.writestr(f"nfe{i}.xml", f"<nfeProc><chave>{i}</chave></nfeProc>" * 50)
+        arquivo_zip.writestr("leiame.txt", "x")
+    return caminho
+
+
+def test_zip_inteiro(zip_notas):
+    assert verificar_zip(zip_notas) == {"ok": True, "entradas": 4, "xmls": 3, "erro": ""}
+    assert verificar_zip(zip_notas, crc_completo=True)["ok"]
+
+
+def test_download_truncado(zip_notas):
+    dados = zip_notas.read_bytes()
+    zip_notas.write_bytes(dados[:len(dados) // 2])
+    resultado = verificar_zip(zip_notas)
+    assert not resultado["ok"]
+    assert "truncado" in resultado["erro"]
+
+
+def test_arquivo_vazio(tmp_path):
+    caminho = tmp_path / "vazio.zip"
+    caminho.write_bytes(b"")
+    assert verificar_zip(caminho)["erro"] == "arquivo com 0 bytes"
+
+
+def test_dados_corrompidos_so_no_crc_completo(zip_notas):
+    dados = bytearray(zip_notas.read_bytes())
+    # Troca um byte dos dados compactados da primeira entrada (depois do cabeçalho local e do nome)
+    dados[30 + len("nfe0.xml") + 5] ^= 0xFF
+    zip_notas.write_bytes(bytes(dados))
+    assert verificar_zip(zip_notas)["ok"]
+    assert not verificar_zip(zip_notas, crc_completo=True)["ok"]
@@ -0,0 +1,55 @@
+import sqlite3
+
+import pytest
+
+from utils.limitador import LimitadorPortal, BaldeFichas, e_limitacao, DOWNLOAD, PESQUISA
+
+
+@pytest.fixture
+def limitador(tmp_path):
+    limitador = LimitadorPortal(tmp_path / "limitador.sqlite3", {PESQUISA: (60, 2)}, pausa_base=10, pausa_maxima=300,
+                                recuperacao=600, fator_minimo=0.1, intervalo_sinais=5)
+    yield limitador
+    limitador.fechar()
+
+
+def test_balde_em_memoria():
+    balde = BaldeFichas(por_minuto=60, rajada=2)
+    assert balde.tentar() == 0 and balde.tentar() == 0
+    assert 0 < balde.tentar() <= 1
+
+
+def test_rajada_da_maquina_e_compartilhada(tmp_path, limitador):
+    outro = LimitadorPortal(tmp_path / "limitador.sqlite3", {PESQUISA: (60, 2)})
+    assert limitador._tentar_maquina(PESQUISA) == 0
+    assert outro._tentar_maquina(PESQUISA) == 0
+    assert limitador._tentar_maquina(PESQUISA) > 0
+    outro.fechar()
+
+
+def test_tipo_sem_limite_passa_direto(limitador):
+    assert limitador.aguardar(DOWNLOAD, timeout=0) < 0.1
+
+
+def test_sinal_de_limitacao_corta_a_taxa_e_pausa(limitador):
+    assert limitador.observar("Erro interno do portal ao gerar o download.")
+    situacao = limitador.situacao()
+    assert situacao["fator"] == pytest.approx(0.5, abs=0.01)
+    assert 19 < situacao["pausa"] <= 20
+    assert limitador._tentar_maquina(PESQUISA) > 19
+    # O mesmo erro visto por outra thread logo em seguida conta uma vez só
+    assert limitador.sinalizar_limitacao() == 0
+
+
+def test_erro_comum_nao_e_limitacao(limitador):
+    assert not limitador.observar("Elemento esperado não foi encontrado no site.")
+    assert limitador.situacao()["pausa"] == 0
+    assert e_limitacao("429 Client Error: Too Many Requests")
+
+
+def test_erro_no_meio_desfaz_a_transacao(limitador):
+    conexao = limitador._conexao()
+    conexao.execute("DROP TABLE baldes")
+    with pytest.raises(sqlite3.OperationalError):
+        limitador._tentar_maquina(PESQUISA)
+    assert not conexao.in_transaction
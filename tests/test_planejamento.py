@@ -0,0 +1,44 @@
+from utils.planejamento import PerfilVolume, dividir_periodo_adaptativo, subtrair_intervalos
+
+
+def test_sem_historico_usa_janelas_fixas():
+    periodos = dividir_periodo_adaptativo("01/01/2024", "15/02/2024", PerfilVolume(), dias_padrao=30)
+    assert periodos == [("01/01/2024", "30/01/2024"), ("31/01/2024", "15/02/2024")]
+
+
+def test_janela_cresce_ate_o_limite_de_notas():
+    # 10 notas/dia: janelas de 10 dias já passam de 100, mas crescem até 300
+    perfil = PerfilVolume([("2024-01-01", "2024-03-31", 910)])
+    periodos = dividir_periodo_adaptativo("01/01/2024", "31/03/2024", perfil, limite_notas=300, dias_padrao=10)
+    assert periodos[0] == ("01/01/2024", "30/01/2024")
+    assert periodos[-1][1] == "31/03/2024"
+    assert len(periodos) == 4
+
+
+def test_mes_forte_nao_e_quebrado_abaixo_da_janela_fixa():
+    # 100 notas/dia passam do limite, mas a janela fixa fica inteira para o caminho paginado
+    perfil = PerfilVolume([("2024-01-01", "2024-01-31", 3100)])
+    periodos = dividir_periodo_adaptativo("01/01/2024", "15/02/2024", perfil, limite_notas=1000, dias_padrao=30)
+    assert periodos == [("01/01/2024", "30/01/2024"), ("31/01/2024", "15/02/2024")]
+
+
+def test_mes_fraco_vira_uma_busca_so():
+    perfil = PerfilVolume([("2024-01-01", "2024-03-31", 91)])
+    assert dividir_periodo_adaptativo("2024-01-01", "2024-03-31", perfil, limite_notas=1000) == [
+        ("01/01/2024", "31/03/2024")
+    ]
+
+
+def test_dias_sem_historico_usam_a_media():
+    perfil = PerfilVolume([("2024-01-01", "2024-01-10", 100), ("2024-01-11", "2024-01-20", 300)])
+    assert perfil.estimar_intervalo("2024-01-01", "2024-01-01") == 10
+    assert perfil.estimar_intervalo("2024-02-01", "2024-02-01") == 20
+
+
+def test_subtrair_intervalos_encerrados():
+    restantes, usados = subtrair_intervalos(
+        [("2024-01-01", "2024-01-31")],
+        [("10/01/2024", "19/01/2024"), ("2024-01-25", "2024-02-05")],
+    )
+    assert restantes == [("2024-01-01", "2024-01-09"), ("2024-01-20", "2024-01-31")]
+    assert usados == [("10/01/2024", "19/01/2024")]
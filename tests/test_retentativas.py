@@ -0,0 +1,48 @@
+import pytest
+
+from utils.retentativas import PoliticaRetentativas, ErroFatal, classificar, PASSO, SESSAO, TAREFA, FATAL
+
+
+class SessaoHttpExpirada(Exception):
+    pass
+
+
+@pytest.mark.parametrize("erro, legivel, nivel", [
+    (Exception("Erro interno do portal ao gerar o download."), "", PASSO),
+    (Exception("Message: chrome not reachable"), "", TAREFA),
+    (Exception("redirecionado para o login"), "", SESSAO),
+    (SessaoHttpExpirada("qualquer coisa"), "", SESSAO),
+    (Exception("INVALID_LOGIN"), "", FATAL),
+    (Exception("x"), "Usuário ou senha inválidos.", FATAL),
+    (ErroFatal("x"), "", FATAL),
+])
+def test_classificar(erro, legivel, nivel):
+    assert classificar(erro, legivel) == nivel
+
+
+def test_falha_sobe_de_nivel_quando_o_orcamento_acaba():
+    registros = []
+    politica = PoliticaRetentativas({PASSO: 1, SESSAO: 1, TAREFA: 1}, {PASSO: 1, SESSAO: 1, TAREFA: 1},
+                                    ao_registrar=registros.append, aleatorio=lambda: 1.0)
+    erro = Exception("Pesquisa sem resposta do portal.")
+    niveis = []
+    while True:
+        decisao = politica.falhou(erro, 1.0)
+        if decisao is None:
+            break
+        niveis.append(decisao.nivel)
+    assert niveis == [PASSO, SESSAO, TAREFA]
+    assert [r["nivel"] for r in registros] == [TAREFA, PASSO, SESSAO, TAREFA]
+    assert politica.resumo().startswith("4 tentativa(s) (PASSO 1, SESSAO 1, TAREFA 1)")
+
+
+def test_fatal_nao_repete():
+    politica = PoliticaRetentativas({PASSO: 5, SESSAO: 5, TAREFA: 5}, {})
+    assert politica.falhou(ErroFatal("captcha"), 0.5) is None
+    assert politica.tentativas[-1]["classe"] == FATAL
+
+
+def test_espera_dobra_ate_o_teto():
+    politica = PoliticaRetentativas({PASSO: 5}, {PASSO: 10}, espera_maxima=25, aleatorio=lambda: 1.0)
+    esperas = [politica.falhou(Exception("x"), 0).espera for _ in range(3)]
+    assert esperas == [10, 20, 25]
@@ -0,0 +1,22 @@
+import os
+import signal
+import threading
+import time
+
+import pytest
+
+from supervisor import Supervisor
+
+
+@pytest.mark.skipif(not hasattr(signal, "SIGALRM"), reason="precisa de SIGALRM")
+def test_sinal_encerra_a_espera_sem_esperar_o_intervalo():
+    supervisor = Supervisor(workers=1)
+    anterior = signal.signal(signal.SIGALRM, supervisor._sinal)
+    try:
+        threading.Timer(0.2, os.kill, (os.getpid(), signal.SIGALRM)).start()
+        inicio = time.monotonic()
+        supervisor._dormir(30)
+        assert time.monotonic() - inicio < 2
+        assert supervisor._sinal_recebido == signal.SIGALRM
+    finally:
+        signal.signal(signal.SIGALRM, anterior)
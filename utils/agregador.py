@@ -0,0 +1,156 @@
+"""
+Agregador das consultas distribuídas (MODO_DISTRIBUIDO), por id_automacao.
+
+O planejador quebra a consulta em tarefas (IE, operação, período) e manda para cá o plano:
+a lista de tarefas esperadas, os resultados que já saíram prontos (cobertura/checkpoints) e
+os dados do relatório. Cada worker, em qualquer máquina, manda o resultado da sua tarefa.
+Quando todas as tarefas de uma IE têm resultado, a consulta recebe um PROCESSING de
+progresso; quando todas as da consulta têm, ela é finalizada uma única vez.
+
+Resultados que chegam antes do plano (mensagens fora de ordem) ficam guardados e contam
+assim que ele chega. Um plano refeito (consulta reentregue) substitui o anterior enquanto a
+consulta não foi finalizada.
+"""
+import os
+import json
+import time
+import threading
+from utils.checkpoints import abrir_conexao, data_iso
+
+_ESQUEMA = """
+CREATE TABLE IF NOT EXISTS consultas (
+    id_automacao  TEXT PRIMARY KEY,
+    plano         TEXT NOT NULL,
+    finalizada_em REAL,
+    atualizado_em REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS resultados (
+    id_automacao  TEXT NOT NULL,
+    indice        INTEGER NOT NULL,
+    periodo_ini   TEXT NOT NULL,
+    periodo_fim   TEXT NOT NULL,
+    resultado     TEXT NOT NULL,
+    registrado_em REAL NOT NULL,
+    PRIMARY KEY (id_automacao, indice, periodo_ini, periodo_fim)
+);
+CREATE TABLE IF NOT EXISTS progresso (
+    id_automacao  TEXT NOT NULL,
+    indice        INTEGER NOT NULL,
+    PRIMARY KEY (id_automacao, indice)
+);
+"""
+
+
+def chave_tarefa(indice, ini, fim):
+    return int(indice), data_iso(ini), data_iso(fim)
+
+
+class AgregadorConsultas:
+    """
+    `plano` é um dict com "tarefas" ([[indice, ini, fim], ...]) e "resolvidos"
+    ({indice: [resultado, ...]}), além do que o relatório final precisar.
+    """
+
+    def __init__(self, caminho):
+        self.caminho = str(caminho)
+        self._local = threading.local()
+        os.makedirs(os.path.dirname(self.caminho) or ".", exist_ok=True)
+        with self._conexao() as conexao:
+            conexao.executescript(_ESQUEMA)
+
+    def _conexao(self):
+        conexao = getattr(self._local, "conexao", None)
+        if conexao is None:
+            conexao = abrir_conexao(self.caminho)
+            self._local.conexao = conexao
+        return conexao
+
+    def registrar_plano(self, id_automacao, plano):
+        """Grava (ou substitui) o plano. Retorna False se a consulta já foi finalizada."""
+        with self._conexao() as conexao:
+            cursor = conexao.execute(
+                "INSERT INTO consultas (id_automacao, plano, atualizado_em) VALUES (?, ?, ?) "
+                "ON CONFLICT (id_automacao) DO UPDATE SET plano = excluded.plano, atualizado_em = excluded.atualizado_em "
+                "WHERE consultas.finalizada_em IS NULL",
+                (str(id_automacao), json.dumps(plano), time.time())
+            )
+            return cursor.rowcount == 1
+
+    def registrar_resultado(self, id_automacao, indice, ini, fim, resultado):
+        """Grava o resultado de uma tarefa. Retorna True se é o primeiro dela (não uma reentrega)."""
+        chave = chave_tarefa(indice, ini, fim)
+        with self._conexao() as conexao:
+            existia = conexao.execute(
+                "SELECT 1 FROM resultados WHERE id_automacao = ? AND indice = ? AND periodo_ini = ? AND periodo_fim = ?",
+                (str(id_automacao), *chave)
+            ).fetchone()
+            conexao.execute(
+                "INSERT OR REPLACE INTO resultados (id_automacao, indice, periodo_ini, periodo_fim, resultado, registrado_em) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                (str(id_automacao), *chave, json.dumps(resultado), time.time())
+            )
+            return existia is None
+
+    def consulta(self, id_automacao):
+        """(plano, finalizada) da consulta, ou (None, False) se o plano ainda não chegou."""
+        linha = self._conexao().execute(
+            "SELECT plano, finalizada_em FROM consultas WHERE id_automacao = ?", (str(id_automacao),)
+        ).fetchone()
+        if linha is None:
+            return None, False
+        return json.loads(linha["plano"]), linha["finalizada_em"] is not None
+
+    def resultados(self, id_automacao):
+        """{(indice, periodo_ini, periodo_fim): resultado} das tarefas que já terminaram."""
+        linhas = self._conexao().execute(
+            "SELECT indice, periodo_ini, periodo_fim, resultado FROM resultados WHERE id_automacao = ?",
+            (str(id_automacao),)
+        ).fetchall()
+        return {(l["indice"], l["periodo_ini"], l["periodo_fim"]): json.loads(l["resultado"]) for l in linhas}
+
+    def marcar_empresa(self, id_automacao, indice):
+        """Marca a IE como concluída. Retorna quantas estão concluídas, ou 0 se esta já estava."""
+        with self._conexao() as conexao:
+            cursor = conexao.execute("INSERT OR IGNORE INTO progresso (id_automacao, indice) VALUES (?, ?)",
+                                     (str(id_automacao), int(indice)))
+            if cursor.rowcount != 1:
+                return 0
+            return conexao.execute("SELECT COUNT(*) FROM progresso WHERE id_automacao = ?",
+                                   (str(id_automacao),)).fetchone()[0]
+
+    def finalizar(self, id_automacao):
+        """Só um chamador finaliza a consulta: retorna True para ele."""
+        with self._conexao() as conexao:
+            cursor = conexao.execute(
+                "UPDATE consultas SET finalizada_em = ?, atualizado_em = ? WHERE id_automacao = ? AND finalizada_em IS NULL",
+                (time.time(), time.time(), str(id_automacao))
+            )
+            return cursor.rowcount == 1
+
+    def remover_antigos(self, dias):
+        with self._conexao() as conexao:
+            limite = time.time() - dias * 86400
+            conexao.execute("DELETE FROM resultados WHERE registrado_em < ?", (limite,))
+            removidas = conexao.execute("DELETE FROM consultas WHERE atualizado_em < ?", (limite,)).rowcount
+            conexao.execute("DELETE FROM progresso WHERE id_automacao NOT IN (SELECT id_automacao FROM consultas)")
+            return removidas
+
+    def fechar(self):
+        conexao = getattr(self._local, "conexao", None)
+        if conexao is not None:
+            conexao.close()
+            self._local.conexao = None
+
+
+_agregador = None
+_agregador_lock = threading.Lock()
+
+
+def get_agregador():
+    global _agregador
+    with _agregador_lock:
+        if _agregador is None:
+            from config.config import AGREGADOR_DB, AGREGADOR_RETENCAO_DIAS
+            _agregador = AgregadorConsultas(AGREGADOR_DB)
+            _agregador.remover_antigos(AGREGADOR_RETENCAO_DIAS)
+        return _agregador
@@ -0,0 +1,242 @@
+"""
+Armazém de XMLs endereçado por conteúdo.
+
+Cada XML é guardado uma única vez em objetos/<hash[:2]>/<hash[2:4]>/<hash>.xml (sha256 do
+conteúdo), não importa quantas consultas, operações ou períodos sobrepostos o baixem. O
+banco guarda, para cada ZIP baixado ("pacote"), quais XMLs ele tinha, e para cada consulta
+(manifesto) quais pacotes ela usou. As pastas das consultas recebem hard links para os
+objetos, então caminhoXmls continua apontando para XMLs de verdade sem ocupar espaço de
+novo. Um ZIP apagado depois de guardado pode ser reconstruído a qualquer momento.
+
+Uso:
+    python -m utils.armazem pasta <id_automacao> <destino>
+    python -m utils.armazem zip <id_automacao> <destino.zip>
+"""
+import os
+import sys
+import time
+import uuid
+import shutil
+import hashlib
+import zipfile
+import threading
+from utils.checkpoints import abrir_conexao
+
+BLOCO = 1024 * 1024
+
+_ESQUEMA = """
+CREATE TABLE IF NOT EXISTS objetos (
+    hash              TEXT PRIMARY KEY,
+    chave             TEXT NOT NULL DEFAULT '',
+    tipo              TEXT NOT NULL DEFAULT '',
+    cnpj_emitente     TEXT NOT NULL DEFAULT '',
+    cnpj_destinatario TEXT NOT NULL DEFAULT '',
+    dh_emissao        TEXT NOT NULL DEFAULT '',
+    valor             REAL,
+    tamanho           INTEGER NOT NULL,
+    criado_em         REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS objetos_chave ON objetos (chave);
+CREATE TABLE IF NOT EXISTS pacotes (
+    pacote TEXT NOT NULL,
+    nome   TEXT NOT NULL,
+    hash   TEXT NOT NULL,
+    PRIMARY KEY (pacote, nome)
+);
+CREATE TABLE IF NOT EXISTS manifestos (
+    id_automacao  TEXT NOT NULL,
+    ie            TEXT NOT NULL,
+    oper          TEXT NOT NULL,
+    pacote        TEXT NOT NULL,
+    registrado_em REAL NOT NULL,
+    PRIMARY KEY (id_automacao, ie, oper, pacote)
+);
+"""
+
+
+def caminho_objeto(raiz, hash_xml):
+    return os.path.join(raiz, "objetos", hash_xml[:2], hash_xml[2:4], hash_xml + ".xml")
+
+
+def guardar_objeto(raiz, origem):
+    """
+    Copia o fluxo `origem` para o armazém calculando o sha256 no caminho. Se o conteúdo já
+    existe, a cópia temporária é descartada. Retorna (hash, tamanho, caminho do objeto).
+    Não usa o banco: pode rodar nos processos da ingestão.
+    """
+    temporaria = os.path.join(raiz, "tmp", uuid.uuid4().hex)
+    os.makedirs(os.path.dirname(temporaria), exist_ok=True)
+    soma = hashlib.sha256()
+    tamanho = 0
+    with open(temporaria, "wb") as saida:
+        for bloco in iter(lambda: origem.read(BLOCO), b""):
+            soma.update(bloco)
+            saida.write(bloco)
+            tamanho += len(bloco)
+    hash_xml = soma.hexdigest()
+    destino = caminho_objeto(raiz, hash_xml)
+    if os.path.exists(destino):
+        os.remove(temporaria)
+    else:
+        os.makedirs(os.path.dirname(destino), exist_ok=True)
+        os.replace(temporaria, destino)
+    return hash_xml, tamanho, destino
+
+
+def vincular(origem, alvo):
+    """
+    Hard link de `origem` em `alvo` (cópia se o sistema de arquivos não permitir). Troca atômica:
+    entrada e saída da mesma IE ligam os mesmos XMLs na mesma pasta, em processos diferentes.
+    """
+    if os.path.exists(alvo) and os.path.samefile(origem, alvo):
+        return alvo
+    os.makedirs(os.path.dirname(alvo), exist_ok=True)
+    temporario = f"{alvo}.{uuid.uuid4().hex[:8]}.tmp"
+    try:
+        os.link(origem, temporario)
+    except OSError:
+        shutil.copy2(origem, temporario)
+    os.replace(temporario, alvo)
+    return alvo
+
+
+class ArmazemXml:
+
+    def __init__(self, raiz):
+        self.raiz = str(raiz)
+        self._local = threading.local()
+        os.makedirs(self.raiz, exist_ok=True)
+        with self._conexao() as conexao:
+            conexao.executescript(_ESQUEMA)
+
+    def _conexao(self):
+        conexao = getattr(self._local, "conexao", None)
+        if conexao is None:
+            conexao = abrir_conexao(os.path.join(self.raiz, "armazem.sqlite3"))
+            self._local.conexao = conexao
+        return conexao
+
+    def objeto(self, hash_xml):
+        return caminho_objeto(self.raiz, hash_xml)
+
+    def registrar_pacote(self, pacote, registros):
+        """Grava os objetos (com os campos do índice) e a lista de XMLs do ZIP `pacote`."""
+        agora = time.time()
+        with self._conexao() as conexao:
+            conexao.executemany(
+                "INSERT OR IGNORE INTO objetos (hash, chave, tipo, cnpj_emitente, cnpj_destinatario, dh_emissao, valor, "
+                "tamanho, criado_em) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                [(r["hash"], r.get("chave", ""), r.get("tipo", ""), r.get("cnpj_emitente", ""),
+                  r.get("cnpj_destinatario", ""), r.get("dh_emissao", ""), r.get("valor"), r["tamanho"], agora)
+                 for r in registros]
+            )
+            conexao.executemany(
+                "INSERT OR REPLACE INTO pacotes (pacote, nome, hash) VALUES (?, ?, ?)",
+                [(str(pacote), r["nome"], r["hash"]) for r in registros]
+            )
+
+    def conhece_pacote(self, pacote):
+        return self._conexao().execute(
+            "SELECT 1 FROM pacotes WHERE pacote = ? LIMIT 1", (str(pacote),)
+        ).fetchone() is not None
+
+    def registros_pacote(self, pacote):
+        """XMLs de um pacote com os campos do índice, como os devolvidos pela ingestão."""
+        linhas = self._conexao().execute(
+            "SELECT p.nome, o.* FROM pacotes p JOIN objetos o ON o.hash = p.hash WHERE p.pacote = ? ORDER BY p.nome",
+            (str(pacote),)
+        ).fetchall()
+        return [dict(l) for l in linhas]
+
+    def registrar_manifesto(self, id_automacao, ie, oper, pacote):
+        with self._conexao() as conexao:
+            conexao.execute(
+                "INSERT OR REPLACE INTO manifestos (id_automacao, ie, oper, pacote, registrado_em) VALUES (?, ?, ?, ?, ?)",
+                (str(id_automacao), str(ie), str(oper), str(pacote), time.time())
+            )
+
+    def manifesto(self, id_automacao):
+        """{ie: {nome: hash}} de todos os XMLs de uma consulta, sem repetir o mesmo arquivo na IE."""
+        linhas = self._conexao().execute(
+            "SELECT DISTINCT m.ie, p.nome, p.hash FROM manifestos m JOIN pacotes p ON p.pacote = m.pacote "
+            "WHERE m.id_automacao = ? ORDER BY m.ie, p.nome",
+            (str(id_automacao),)
+        ).fetchall()
+        por_ie = {}
+        for l in linhas:
+            por_ie.setdefault(l["ie"], {})[l["nome"]] = l["hash"]
+        return por_ie
+
+    def vincular_pacote(self, pacote, pasta):
+        """Hard links dos XMLs de `pacote` em `pasta`. Retorna os registros com "arquivo_xml"."""
+        registros = self.registros_pacote(pacote)
+        for r in registros:
+            r["arquivo_xml"] = vincular(self.objeto(r["hash"]), os.path.join(pasta, r["nome"]))
+        return registros
+
+    def restaurar_pacote(self, pacote, destino=None):
+        """Reconstrói o ZIP `pacote` (ou em `destino`) a partir dos objetos."""
+        destino = str(destino or pacote)
+        os.makedirs(os.path.dirname(destino) or ".", exist_ok=True)
+        with zipfile.ZipFile(destino + ".part", "w", zipfile.ZIP_DEFLATED) as arquivo_zip:
+            for r in self.registros_pacote(pacote):
+                arquivo_zip.write(self.objeto(r["hash"]), r["nome"])
+        os.replace(destino + ".part", destino)
+        return destino
+
+    def materializar_job(self, id_automacao, destino, formato="pasta"):
+        """
+        Monta os XMLs de uma consulta em `destino`: "pasta" cria <destino>/<ie>/<nome> com hard
+        links; "zip" grava um único ZIP em `destino` com uma pasta por IE.
+        """
+        manifesto = self.manifesto(id_automacao)
+        if formato == "zip":
+            os.makedirs(os.path.dirname(str(destino)) or ".", exist_ok=True)
+            with zipfile.ZipFile(str(destino) + ".part", "w", zipfile.ZIP_DEFLATED) as arquivo_zip:
+                for ie, itens in manifesto.items():
+                    for nome, hash_xml in itens.items():
+                        arquivo_zip.write(self.objeto(hash_xml), f"{ie}/{nome}")
+            os.replace(str(destino) + ".part", str(destino))
+            return str(destino)
+        for ie, itens in manifesto.items():
+            for nome, hash_xml in itens.items():
+                vincular(self.objeto(hash_xml), os.path.join(str(destino), ie, nome))
+        return str(destino)
+
+    def uso(self):
+        """(objetos, bytes guardados, referências em pacotes): quanto a deduplicação economiza."""
+        conexao = self._conexao()
+        objetos, guardados = conexao.execute("SELECT COUNT(*), COALESCE(SUM(tamanho), 0) FROM objetos").fetchone()
+        referencias = conexao.execute("SELECT COUNT(*) FROM pacotes").fetchone()[0]
+        return objetos, guardados, referencias
+
+    def fechar(self):
+        conexao = getattr(self._local, "conexao", None)
+        if conexao is not None:
+            conexao.close()
+            self._local.conexao = None
+
+
+_armazem = None
+_armazem_lock = threading.Lock()
+
+
+def get_armazem():
+    global _armazem
+    with _armazem_lock:
+        if _armazem is None:
+            from config.config import ARMAZEM_DIRECTORY
+            _armazem = ArmazemXml(ARMAZEM_DIRECTORY)
+        return _armazem
+
+
+def main():
+    if len(sys.argv) != 4 or sys.argv[1] not in ("pasta", "zip"):
+        print(__doc__)
+        sys.exit(1)
+    formato, id_automacao, destino = sys.argv[1:]
+    print(get_armazem().materializar_job(id_automacao, destino, formato))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,83 @@
+import time
+import multiprocessing as mp
+from config import config
+
+LIVRE = 0
+ALERTA = 1
+CRITICO = 2
+
+NOMES_NIVEL = {LIVRE: "livre", ALERTA: "alerta", CRITICO: "crítico"}
+
+
+def classificar(cpu, ram, chromes):
+    """Traduz a leitura do monitor em um nível de capacidade da máquina."""
+    if ram > config.MAX_RAM_USAGE or chromes > config.MAX_CHROME_INSTANCES:
+        return CRITICO
+    if cpu > config.MAX_CPU_USAGE or ram > config.MAX_RAM_USAGE - config.ADMISSAO_MARGEM_RAM:
+        return ALERTA
+    return LIVRE
+
+
+class SinalCapacidade:
+    """
+    Última leitura do monitor de recursos, em memória compartilhada.
+
+    O monitor (processo irmão) escreve; os consumidores leem. Criado pelo
+    supervisor e repassado aos filhos como argumento do Process.
+    """
+
+    def __init__(self):
+        # [timestamp, cpu, ram, chromes, nivel]
+        self._valores = mp.Array('d', [0.0, 0.0, 0.0, 0.0, float(LIVRE)])
+
+    def publicar(self, cpu, ram, chromes):
+        nivel = classificar(cpu, ram, chromes)
+        with self._valores.get_lock():
+            self._valores[:] = [time.time(), cpu, ram, chromes, float(nivel)]
+        return nivel
+
+    def ler(self):
+        with self._valores.get_lock():
+            timestamp, cpu, ram, chromes, nivel = self._valores[:]
+        return {"timestamp": timestamp, "cpu": cpu, "ram": ram, "chromes": int(chromes), "nivel": int(nivel)}
+
+
+class ControleAdmissao:
+    """
+    Controle AIMD da concorrência de um consumidor a partir do SinalCapacidade.
+
+    A cada leitura nova do monitor:
+    - livre: limite + 1 (até `maximo`);
+    - alerta: limite / 2 (mínimo 1);
+    - crítico: pausa o consumo até a máquina voltar a alerta/livre.
+    Leitura velha (monitor parado) não altera nada.
+    """
+
+    def __init__(self, maximo, sinal, inicial=None):
+        self.maximo = maximo
+        self.sinal = sinal
+        self.limite = max(1, min(inicial or config.ADMISSAO_LIMITE_INICIAL, maximo))
+        self.pausado = False
+        self._ultima_leitura = 0.0
+
+    def atualizar(self):
+        """Retorna True se o limite ou o estado de pausa mudou."""
+        leitura = self.sinal.ler()
+        if leitura["timestamp"] <= self._ultima_leitura:
+            return False
+        if time.time() - leitura["timestamp"] > 3 * config.MONITOR_INTERVALO:
+            return False
+        self._ultima_leitura = leitura["timestamp"]
+
+        antes = (self.limite, self.pausado)
+        nivel = leitura["nivel"]
+        if nivel == CRITICO:
+            self.limite = 1
+            self.pausado = True
+        elif nivel == ALERTA:
+            self.limite = max(1, self.limite // 2)
+            self.pausado = False
+        else:
+            self.limite = min(self.maximo, self.limite + 1)
+            self.pausado = False
+        return (self.limite, self.pausado) != antes
@@ -0,0 +1,233 @@
+import os
+import json
+import time
+import sqlite3
+import threading
+from datetime import datetime
+
+# Status que encerram um período: numa reentrega/retentativa ele não é baixado de novo
+STATUS_FINAIS = ("OK", "SEM_RESULTADO", "PERMISSAO_NEGADA")
+EM_ANDAMENTO = "EM_ANDAMENTO"
+
+_ESQUEMA = """
+CREATE TABLE IF NOT EXISTS checkpoints (
+    id_automacao  TEXT NOT NULL,
+    cpf           TEXT NOT NULL,
+    ie            TEXT NOT NULL,
+    oper          TEXT NOT NULL,
+    periodo_ini   TEXT NOT NULL,
+    periodo_fim   TEXT NOT NULL,
+    status        TEXT NOT NULL,
+    total_notas   INTEGER NOT NULL DEFAULT 0,
+    erro          TEXT NOT NULL DEFAULT '',
+    arquivos      TEXT NOT NULL DEFAULT '[]',
+    tentativas    INTEGER NOT NULL DEFAULT 0,
+    atualizado_em REAL NOT NULL,
+    PRIMARY KEY (id_automacao, cpf, ie, oper, periodo_ini, periodo_fim)
+);
+CREATE INDEX IF NOT EXISTS checkpoints_ie ON checkpoints (cpf, ie, oper);
+CREATE TABLE IF NOT EXISTS blocos (
+    id_automacao  TEXT NOT NULL,
+    cpf           TEXT NOT NULL,
+    ie            TEXT NOT NULL,
+    oper          TEXT NOT NULL,
+    periodo_ini   TEXT NOT NULL,
+    periodo_fim   TEXT NOT NULL,
+    pagina_ini    INTEGER NOT NULL,
+    pagina_fim    INTEGER NOT NULL,
+    total_notas   INTEGER NOT NULL,
+    status        TEXT NOT NULL,
+    erro          TEXT NOT NULL DEFAULT '',
+    arquivos      TEXT NOT NULL DEFAULT '[]',
+    tentativas    INTEGER NOT NULL DEFAULT 0,
+    atualizado_em REAL NOT NULL,
+    PRIMARY KEY (id_automacao, cpf, ie, oper, periodo_ini, periodo_fim, pagina_ini, pagina_fim)
+);
+CREATE TABLE IF NOT EXISTS tentativas (
+    id_automacao  TEXT NOT NULL,
+    cpf           TEXT NOT NULL,
+    ie            TEXT NOT NULL,
+    oper          TEXT NOT NULL,
+    periodo_ini   TEXT NOT NULL,
+    periodo_fim   TEXT NOT NULL,
+    pagina_ini    INTEGER NOT NULL DEFAULT 0,
+    pagina_fim    INTEGER NOT NULL DEFAULT 0,
+    numero        INTEGER NOT NULL,
+    nivel         TEXT NOT NULL,
+    classe        TEXT NOT NULL,
+    erro          TEXT NOT NULL DEFAULT '',
+    duracao       REAL NOT NULL,
+    espera        REAL NOT NULL,
+    chrome        TEXT NOT NULL DEFAULT '',
+    registrado_em REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS tentativas_execucao ON tentativas (id_automacao, cpf);
+"""
+
+
+def abrir_conexao(caminho):
+    conexao = sqlite3.connect(str(caminho), timeout=30)
+    conexao.execute("PRAGMA journal_mode=WAL")
+    conexao.execute("PRAGMA synchronous=NORMAL")
+    conexao.row_factory = sqlite3.Row
+    return conexao
+
+
+def data_iso(data):
+    """'31/01/2024' -> '2024-01-31' (datas ISO ordenam como texto no SQLite)."""
+    if hasattr(data, "isoformat"):
+        return data.isoformat()[:10]
+    if "/" in data:
+        return datetime.strptime(data, "%d/%m/%Y").strftime("%Y-%m-%d")
+    return data[:10]
+
+
+def sem_arquivos(status, total_notas, arquivos):
+    """OK com notas no portal mas nenhum arquivo salvo: não conta como encerrado nem como coberto."""
+    return status == "OK" and (total_notas or 0) > 0 and not arquivos
+
+
+class CheckpointStore:
+    """
+    Checkpoints por (id_automacao, cpf, ie, oper, período) em SQLite com WAL.
+
+    Cada período concluído é gravado numa transação assim que termina, com status,
+    total de notas e arquivos salvos. Uma mensagem reentregue (ou tentada de novo)
+    com o mesmo id retoma exatamente nos períodos que faltam. Vários processos
+    worker podem usar o mesmo arquivo: o WAL deixa leituras e a escrita em paralelo.
+    """
+
+    def __init__(self, caminho):
+        self.caminho = str(caminho)
+        self._local = threading.local()
+        os.makedirs(os.path.dirname(self.caminho) or ".", exist_ok=True)
+        with self._conexao() as conexao:
+            conexao.executescript(_ESQUEMA)
+
+    def _conexao(self):
+        # sqlite3 não compartilha conexão entre threads: uma por thread
+        conexao = getattr(self._local, "conexao", None)
+        if conexao is None:
+            conexao = abrir_conexao(self.caminho)
+            self._local.conexao = conexao
+        return conexao
+
+    def iniciar(self, id_automacao, cpf, ie, oper, ini, fim):
+        """Marca o período como em andamento sem apagar o resultado de uma tentativa anterior."""
+        with self._conexao() as conexao:
+            conexao.execute(
+                "INSERT INTO checkpoints (id_automacao, cpf, ie, oper, periodo_ini, periodo_fim, status, atualizado_em) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?) "
+                "ON CONFLICT (id_automacao, cpf, ie, oper, periodo_ini, periodo_fim) DO UPDATE SET status = excluded.status, atualizado_em = excluded.atualizado_em "
+                "WHERE checkpoints.status NOT IN ('OK', 'SEM_RESULTADO', 'PERMISSAO_NEGADA')",
+                (str(id_automacao), str(cpf), str(ie), str(oper), data_iso(ini), data_iso(fim), EM_ANDAMENTO, time.time())
+            )
+
+    def registrar(self, id_automacao, cpf, ie, oper, ini, fim, status, total_notas=0, erro="", arquivos=None):
+        with self._conexao() as conexao:
+            conexao.execute(
+                "INSERT INTO checkpoints (id_automacao, cpf, ie, oper, periodo_ini, periodo_fim, status, total_notas, "
+                "erro, arquivos, tentativas, atualizado_em) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, 1, ?) "
+                "ON CONFLICT (id_automacao, cpf, ie, oper, periodo_ini, periodo_fim) DO UPDATE SET status = excluded.status, total_notas = excluded.total_notas, "
+                "erro = excluded.erro, arquivos = excluded.arquivos, tentativas = checkpoints.tentativas + 1, "
+                "atualizado_em = excluded.atualizado_em",
+                (str(id_automacao), str(cpf), str(ie), str(oper), data_iso(ini), data_iso(fim), status,
+                 int(total_notas or 0), erro or "", json.dumps(list(arquivos or [])), time.time())
+            )
+
+    def concluidos(self, id_automacao, cpf):
+        """{(ie, oper, periodo_ini, periodo_fim): resultado} dos períodos já encerrados da execução."""
+        linhas = self._conexao().execute(
+            "SELECT * FROM checkpoints WHERE id_automacao = ? AND cpf = ? AND status IN (?, ?, ?)",
+            (str(id_automacao), str(cpf), *STATUS_FINAIS)
+        ).fetchall()
+        concluidos = {}
+        for l in linhas:
+            arquivos = json.loads(l["arquivos"])
+            if not sem_arquivos(l["status"], l["total_notas"], arquivos):
+                concluidos[(l["ie"], l["oper"], l["periodo_ini"], l["periodo_fim"])] = {
+                    "status": l["status"], "erro": l["erro"], "total_notas": l["total_notas"], "arquivos": arquivos
+                }
+        return concluidos
+
+    def registrar_bloco(self, id_automacao, cpf, ie, oper, ini, fim, pagina_ini, pagina_fim, total_notas, status,
+                        erro="", arquivos=None):
+        """Checkpoint de um bloco de páginas de um período com mais de 10.000 notas."""
+        with self._conexao() as conexao:
+            conexao.execute(
+                "INSERT INTO blocos (id_automacao, cpf, ie, oper, periodo_ini, periodo_fim, pagina_ini, pagina_fim, total_notas, "
+                "status, erro, arquivos, tentativas, atualizado_em) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, 1, ?) "
+                "ON CONFLICT (id_automacao, cpf, ie, oper, periodo_ini, periodo_fim, pagina_ini, pagina_fim) DO UPDATE SET "
+                "total_notas = excluded.total_notas, status = excluded.status, erro = excluded.erro, arquivos = excluded.arquivos, "
+                "tentativas = blocos.tentativas + 1, atualizado_em = excluded.atualizado_em",
+                (str(id_automacao), str(cpf), str(ie), str(oper), data_iso(ini), data_iso(fim), int(pagina_ini), int(pagina_fim),
+                 int(total_notas), status, erro or "", json.dumps(list(arquivos or [])), time.time())
+            )
+
+    def blocos_concluidos(self, id_automacao, cpf, ie, oper, ini, fim, total_notas):
+        """
+        {(pagina_ini, pagina_fim): arquivos} dos blocos já baixados do período. Só valem se o portal
+        ainda informa o mesmo total de notas; senão as páginas podem ter mudado de conteúdo.
+        """
+        linhas = self._conexao().execute(
+            "SELECT pagina_ini, pagina_fim, arquivos FROM blocos WHERE id_automacao = ? AND cpf = ? AND ie = ? AND oper = ? "
+            "AND periodo_ini = ? AND periodo_fim = ? AND total_notas = ? AND status = 'OK'",
+            (str(id_automacao), str(cpf), str(ie), str(oper), data_iso(ini), data_iso(fim), int(total_notas))
+        ).fetchall()
+        return {(l["pagina_ini"], l["pagina_fim"]): json.loads(l["arquivos"]) for l in linhas}
+
+    def registrar_tentativa(self, id_automacao, cpf, ie, oper, ini, fim, registro, pagina_ini=0, pagina_fim=0, chrome=""):
+        """Custo de uma tentativa (registro da PoliticaRetentativas) de um período ou bloco."""
+        with self._conexao() as conexao:
+            conexao.execute(
+                "INSERT INTO tentativas (id_automacao, cpf, ie, oper, periodo_ini, periodo_fim, pagina_ini, pagina_fim, numero, "
+                "nivel, classe, erro, duracao, espera, chrome, registrado_em) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (str(id_automacao), str(cpf), str(ie), str(oper), data_iso(ini), data_iso(fim), int(pagina_ini), int(pagina_fim),
+                 registro["numero"], registro["nivel"], registro["classe"], registro["erro"] or "", registro["duracao"],
+                 registro["espera"], str(chrome or ""), time.time())
+            )
+
+    def custo_tentativas(self, id_automacao, cpf):
+        """[(nivel, classe, tentativas, duracao, espera)] de uma execução, para o relatório de custo das retentativas."""
+        linhas = self._conexao().execute(
+            "SELECT nivel, classe, COUNT(*) AS tentativas, SUM(duracao) AS duracao, SUM(espera) AS espera FROM tentativas "
+            "WHERE id_automacao = ? AND cpf = ? GROUP BY nivel, classe ORDER BY nivel, classe",
+            (str(id_automacao), str(cpf))
+        ).fetchall()
+        return [tuple(l) for l in linhas]
+
+    def historico(self, cpf, ie, oper):
+        """(periodo_ini, periodo_fim, total_notas) das buscas concluídas da IE/operação em qualquer job, do mais antigo ao mais recente."""
+        linhas = self._conexao().execute(
+            "SELECT periodo_ini, periodo_fim, total_notas FROM checkpoints "
+            "WHERE cpf = ? AND ie = ? AND oper = ? AND status IN ('OK', 'SEM_RESULTADO') ORDER BY atualizado_em",
+            (str(cpf), str(ie), str(oper))
+        ).fetchall()
+        return [(l["periodo_ini"], l["periodo_fim"], l["total_notas"]) for l in linhas]
+
+    def remover_antigos(self, dias):
+        with self._conexao() as conexao:
+            limite = time.time() - dias * 86400
+            conexao.execute("DELETE FROM blocos WHERE atualizado_em < ?", (limite,))
+            conexao.execute("DELETE FROM tentativas WHERE registrado_em < ?", (limite,))
+            return conexao.execute("DELETE FROM checkpoints WHERE atualizado_em < ?", (limite,)).rowcount
+
+    def fechar(self):
+        conexao = getattr(self._local, "conexao", None)
+        if conexao is not None:
+            conexao.close()
+            self._local.conexao = None
+
+
+_checkpoints = None
+_checkpoints_lock = threading.Lock()
+
+
+def get_checkpoints():
+    global _checkpoints
+    with _checkpoints_lock:
+        if _checkpoints is None:
+            from config.config import CHECKPOINT_DB, CHECKPOINT_RETENCAO_DIAS
+            _checkpoints = CheckpointStore(CHECKPOINT_DB)
+            _checkpoints.remover_antigos(CHECKPOINT_RETENCAO_DIAS)
+        return _checkpoints
@@ -0,0 +1,175 @@
+import os
+import json
+import time
+import shutil
+import threading
+from datetime import datetime, timedelta
+from utils.checkpoints import abrir_conexao, data_iso, sem_arquivos
+
+# Status que garantem que o intervalo inteiro foi consultado no portal
+STATUS_COBERTOS = ("OK", "SEM_RESULTADO")
+
+_ESQUEMA = """
+CREATE TABLE IF NOT EXISTS cobertura (
+    cpf         TEXT NOT NULL,
+    ie          TEXT NOT NULL,
+    oper        TEXT NOT NULL,
+    ini         TEXT NOT NULL,
+    fim         TEXT NOT NULL,
+    status      TEXT NOT NULL,
+    total_notas INTEGER NOT NULL DEFAULT 0,
+    erro        TEXT NOT NULL DEFAULT '',
+    arquivos    TEXT NOT NULL DEFAULT '[]',
+    buscado_em  REAL NOT NULL,
+    PRIMARY KEY (cpf, ie, oper, ini, fim)
+);
+CREATE INDEX IF NOT EXISTS cobertura_busca ON cobertura (cpf, ie, oper, fim);
+"""
+
+
+def _data(valor):
+    return datetime.strptime(valor, "%Y-%m-%d").date()
+
+
+class IndiceCobertura:
+    """
+    Quais intervalos (cpf, IE, operação, datas) já foram baixados por completo, e quando,
+    inclusive os confirmados vazios. Vale entre jobs diferentes: um pedido Jan–Dez depois de
+    um Jan–Jun só consulta no portal Jul–Dez.
+
+    Frescor: notas dos últimos `frescor_dias` antes da busca ainda podem chegar ao portal,
+    então esses dias só contam como cobertos por `ttl` segundos depois da busca.
+
+    Com `armazem`, um ZIP apagado depois de guardado no armazém continua valendo.
+    """
+
+    def __init__(self, caminho, frescor_dias=5, ttl=6 * 3600, armazem=None):
+        self.caminho = str(caminho)
+        self.frescor_dias = frescor_dias
+        self.ttl = ttl
+        self.armazem = armazem
+        self._local = threading.local()
+        os.makedirs(os.path.dirname(self.caminho) or ".", exist_ok=True)
+        with self._conexao() as conexao:
+            conexao.executescript(_ESQUEMA)
+
+    def _conexao(self):
+        conexao = getattr(self._local, "conexao", None)
+        if conexao is None:
+            conexao = abrir_conexao(self.caminho)
+            self._local.conexao = conexao
+        return conexao
+
+    def registrar(self, cpf, ie, oper, ini, fim, status, total_notas=0, erro="", arquivos=None):
+        if status not in STATUS_COBERTOS or sem_arquivos(status, total_notas, arquivos):
+            return
+        with self._conexao() as conexao:
+            conexao.execute(
+                "INSERT OR REPLACE INTO cobertura (cpf, ie, oper, ini, fim, status, total_notas, erro, arquivos, buscado_em) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (str(cpf), str(ie), str(oper), data_iso(ini), data_iso(fim), status, int(total_notas or 0),
+                 erro or "", json.dumps(list(arquivos or [])), time.time())
+            )
+
+    def fim_efetivo(self, fim, buscado_em, agora=None):
+        """Até que dia um intervalo buscado em `buscado_em` ainda pode ser considerado completo."""
+        agora = agora or time.time()
+        if agora - buscado_em < self.ttl:
+            return fim
+        estavel = datetime.fromtimestamp(buscado_em).date() - timedelta(days=self.frescor_dias)
+        return min(fim, estavel)
+
+    def disponivel(self, arquivo):
+        return os.path.exists(arquivo) or (self.armazem is not None and self.armazem.conhece_pacote(arquivo))
+
+    def intervalos(self, cpf, ie, oper, ini, fim):
+        """
+        Intervalos cobertos dentro de [ini, fim], com os arquivos ainda disponíveis. Um intervalo
+        que passa dos limites não serve: os arquivos dele trariam notas de fora do pedido.
+        """
+        linhas = self._conexao().execute(
+            "SELECT * FROM cobertura WHERE cpf = ? AND ie = ? AND oper = ? AND ini >= ? AND fim <= ? ORDER BY ini",
+            (str(cpf), str(ie), str(oper), data_iso(ini), data_iso(fim))
+        ).fetchall()
+        agora = time.time()
+        cobertos = []
+        for l in linhas:
+            arquivos = json.loads(l["arquivos"])
+            if sem_arquivos(l["status"], l["total_notas"], arquivos) or not all(self.disponivel(a) for a in arquivos):
+                continue
+            inicio = _data(l["ini"])
+            final = self.fim_efetivo(_data(l["fim"]), l["buscado_em"], agora)
+            if final < inicio:
+                continue
+            cobertos.append({
+                "ini": inicio, "fim": final, "status": l["status"], "erro": l["erro"],
+                "total_notas": l["total_notas"], "arquivos": arquivos
+            })
+        return cobertos
+
+    def planejar(self, cpf, ie, oper, data_inicial, data_final):
+        """
+        Divide [data_inicial, data_final] em lacunas a consultar no portal e intervalos já cobertos.
+        Retorna (lacunas, reaproveitados): lacunas como [(ini, fim)] em 'YYYY-MM-DD' e os registros
+        de cobertura escolhidos (o mínimo de intervalos que cobre o que dá para cobrir).
+        """
+        inicio, final = _data(data_iso(data_inicial)), _data(data_iso(data_final))
+        cobertos = self.intervalos(cpf, ie, oper, inicio, final)
+        lacunas, reaproveitados = [], []
+        cursor = inicio
+        while cursor <= final:
+            candidatos = [c for c in cobertos if c["ini"] <= cursor <= c["fim"]]
+            if candidatos:
+                melhor = max(candidatos, key=lambda c: c["fim"])
+                reaproveitados.append(melhor)
+                cursor = melhor["fim"] + timedelta(days=1)
+                continue
+            proximos = [c["ini"] for c in cobertos if c["ini"] > cursor]
+            fim_lacuna = min(min(proximos) - timedelta(days=1), final) if proximos else final
+            lacunas.append((cursor.isoformat(), fim_lacuna.isoformat()))
+            cursor = fim_lacuna + timedelta(days=1)
+        return lacunas, reaproveitados
+
+    def remover_antigos(self, dias):
+        with self._conexao() as conexao:
+            return conexao.execute(
+                "DELETE FROM cobertura WHERE buscado_em < ?", (time.time() - dias * 86400,)
+            ).rowcount
+
+
+def materializar(arquivos, destino, armazem=None):
+    """
+    Disponibiliza em `destino` arquivos baixados por outro job (hard link; cópia se não der).
+    ZIPs que só existem no armazém são devolvidos como estão: a ingestão liga os XMLs deles.
+    """
+    os.makedirs(destino, exist_ok=True)
+    copiados = []
+    for origem in arquivos:
+        if not os.path.exists(origem) and armazem is not None and armazem.conhece_pacote(origem):
+            copiados.append(origem)
+            continue
+        alvo = os.path.join(destino, os.path.basename(origem))
+        if os.path.abspath(origem) != os.path.abspath(alvo) and not os.path.exists(alvo):
+            try:
+                os.link(origem, alvo)
+            except OSError:
+                shutil.copy2(origem, alvo)
+        copiados.append(alvo)
+    return copiados
+
+
+_indice = None
+_indice_lock = threading.Lock()
+
+
+def get_cobertura():
+    global _indice
+    with _indice_lock:
+        if _indice is None:
+            from config.config import CHECKPOINT_DB, COBERTURA_FRESCOR_DIAS, COBERTURA_TTL, COBERTURA_RETENCAO_DIAS
+            from config.config import INGESTAO_ATIVA, ARMAZEM_ATIVO
+            from utils.armazem import get_armazem
+            armazem = get_armazem() if INGESTAO_ATIVA and ARMAZEM_ATIVO else None
+            _indice = IndiceCobertura(CHECKPOINT_DB, COBERTURA_FRESCOR_DIAS, COBERTURA_TTL, armazem)
+            _indice.remover_antigos(COBERTURA_RETENCAO_DIAS)
+        return _indice
@@ -0,0 +1,343 @@
+"""
+Concessões de login por CPF de contador: no máximo N sessões simultâneas no portal com a
+mesma credencial, para que os logins de tarefas paralelas não derrubem uns aos outros.
+
+Cada tarefa pede uma vaga antes de pegar o Chrome. Ao terminar com a sessão ainda logada
+no pool, a vaga não volta para o backend: fica ociosa neste processo junto com a sessão e
+vai para a próxima tarefa do mesmo contador, que reaproveita o login em vez de logar de
+novo. Vagas ociosas voltam ao backend depois de `ociosa_max` segundos ou assim que outro
+processo estiver esperando por aquele CPF.
+
+As vagas ficam num backend com prazo (`ttl`) renovado por uma thread do processo dono;
+as de um worker que caiu vencem sozinhas. Backends:
+  - ConcessoesSqlite: SQLite ao lado dos checkpoints, compartilhado pelos processos da máquina.
+  - ConcessoesMemoria: só este processo (o antigo semáforo por processo).
+Um backend compartilhado entre máquinas só precisa dos mesmos métodos: tentar, renovar,
+liberar, desistir e esperando (ver ConcessoesMemoria).
+"""
+import os
+import time
+import uuid
+import socket
+import threading
+from utils.checkpoints import abrir_conexao
+from utils.logger import log_monitoramento
+
+_ESQUEMA = """
+CREATE TABLE IF NOT EXISTS concessoes (
+    chave     TEXT NOT NULL,
+    vaga      INTEGER NOT NULL,
+    dono      TEXT NOT NULL,
+    obtida_em REAL NOT NULL,
+    expira_em REAL NOT NULL,
+    PRIMARY KEY (chave, vaga)
+);
+CREATE TABLE IF NOT EXISTS esperas (
+    chave     TEXT NOT NULL,
+    dono      TEXT NOT NULL,
+    expira_em REAL NOT NULL,
+    PRIMARY KEY (chave, dono)
+);
+"""
+
+
+class SemVaga(Exception):
+    """Nenhuma vaga de login para o contador dentro do timeout."""
+
+
+class ConcessoesMemoria:
+    """
+    Backend deste processo. Define a interface dos backends:
+      - tentar(chave, dono, limite, ttl): número da vaga obtida, ou None (e o dono fica
+        registrado como esperando pela chave);
+      - renovar(vagas, dono, ttl): estende o prazo de [(chave, vaga)]; retorna as que o dono perdeu;
+      - liberar(chave, vaga, dono);
+      - desistir(chave, dono): o dono não espera mais pela chave;
+      - esperando(chave, dono): quantos outros donos esperam pela chave.
+    """
+
+    def __init__(self):
+        self._vagas = {}
+        self._esperas = {}
+        self._lock = threading.Lock()
+
+    def _limpar(self, chave, agora):
+        vagas = self._vagas.setdefault(chave, {})
+        for vaga in [v for v, (_, expira) in vagas.items() if expira <= agora]:
+            del vagas[vaga]
+        esperas = self._esperas.setdefault(chave, {})
+        for dono in [d for d, expira in esperas.items() if expira <= agora]:
+            del esperas[dono]
+        return vagas, esperas
+
+    def tentar(self, chave, dono, limite, ttl):
+        agora = time.time()
+        with self._lock:
+            vagas, esperas = self._limpar(chave, agora)
+            livre = next((v for v in range(limite) if v not in vagas), None)
+            if livre is None:
+                esperas[dono] = agora + ttl
+                return None
+            vagas[livre] = (dono, agora + ttl)
+            esperas.pop(dono, None)
+            return livre
+
+    def renovar(self, vagas, dono, ttl):
+        perdidas = []
+        with self._lock:
+            for chave, vaga in vagas:
+                atual = self._vagas.get(chave, {}).get(vaga)
+                if atual is None or atual[0] != dono:
+                    perdidas.append((chave, vaga))
+                else:
+                    self._vagas[chave][vaga] = (dono, time.time() + ttl)
+        return perdidas
+
+    def liberar(self, chave, vaga, dono):
+        with self._lock:
+            atual = self._vagas.get(chave, {}).get(vaga)
+            if atual is not None and atual[0] == dono:
+                del self._vagas[chave][vaga]
+
+    def desistir(self, chave, dono):
+        with self._lock:
+            self._esperas.get(chave, {}).pop(dono, None)
+
+    def esperando(self, chave, dono):
+        with self._lock:
+            _, esperas = self._limpar(chave, time.time())
+            return sum(1 for d in esperas if d != dono)
+
+
+class ConcessoesSqlite:
+    """Backend compartilhado pelos processos da máquina (mesma interface de ConcessoesMemoria)."""
+
+    def __init__(self, caminho):
+        self.caminho = str(caminho)
+        self._local = threading.local()
+        os.makedirs(os.path.dirname(self.caminho) or ".", exist_ok=True)
+        self._conexao().executescript(_ESQUEMA)
+
+    def _conexao(self):
+        conexao = getattr(self._local, "conexao", None)
+        if conexao is None:
+            conexao = abrir_conexao(self.caminho)
+            conexao.isolation_level = None
+            self._local.conexao = conexao
+        return conexao
+
+    def tentar(self, chave, dono, limite, ttl):
+        agora = time.time()
+        with self._conexao() as conexao:
+            conexao.execute("BEGIN IMMEDIATE")
+            # Vagas vencidas são de processos que caíram (ou travaram) sem devolver
+            conexao.execute("DELETE FROM concessoes WHERE chave = ? AND expira_em <= ?", (chave, agora))
+            ocupadas = {l["vaga"] for l in conexao.execute("SELECT vaga FROM concessoes WHERE chave = ?", (chave,))}
+            livre = next((v for v in range(limite) if v not in ocupadas), None)
+            if livre is None:
+                conexao.execute("INSERT OR REPLACE INTO esperas (chave, dono, expira_em) VALUES (?, ?, ?)",
+                                (chave, dono, agora + ttl))
+                return None
+            conexao.execute("INSERT INTO concessoes (chave, vaga, dono, obtida_em, expira_em) VALUES (?, ?, ?, ?, ?)",
+                            (chave, livre, dono, agora, agora + ttl))
+            conexao.execute("DELETE FROM esperas WHERE chave = ? AND dono = ?", (chave, dono))
+            return livre
+
+    def renovar(self, vagas, dono, ttl):
+        expira = time.time() + ttl
+        with self._conexao() as conexao:
+            conexao.execute("BEGIN IMMEDIATE")
+            return [(chave, vaga) for chave, vaga in vagas if conexao.execute(
+                "UPDATE concessoes SET expira_em = ? WHERE chave = ? AND vaga = ? AND dono = ?",
+                (expira, chave, vaga, dono)).rowcount != 1]
+
+    def liberar(self, chave, vaga, dono):
+        self._conexao().execute("DELETE FROM concessoes WHERE chave = ? AND vaga = ? AND dono = ?", (chave, vaga, dono))
+
+    def desistir(self, chave, dono):
+        self._conexao().execute("DELETE FROM esperas WHERE chave = ? AND dono = ?", (chave, dono))
+
+    def esperando(self, chave, dono):
+        return self._conexao().execute(
+            "SELECT COUNT(*) FROM esperas WHERE chave = ? AND dono != ? AND expira_em > ?", (chave, dono, time.time())
+        ).fetchone()[0]
+
+    def fechar(self):
+        conexao = getattr(self._local, "conexao", None)
+        if conexao is not None:
+            conexao.close()
+            self._local.conexao = None
+
+
+class VagaLogin:
+    """Uma vaga de login de `cpf` com a interface de semáforo das tarefas (acquire/release ou with)."""
+
+    def __init__(self, concessoes, cpf):
+        self.concessoes = concessoes
+        self.cpf = cpf
+        self.vaga = None
+        # Quem segura a vaga marca True se a sessão voltou logada ao pool
+        self.manter = False
+
+    def acquire(self, timeout=None):
+        try:
+            self.vaga = self.concessoes.adquirir(self.cpf, timeout)
+        except SemVaga:
+            return False
+        return True
+
+    def release(self):
+        if self.vaga is not None:
+            self.concessoes.devolver(self.cpf, self.vaga, self.manter)
+            self.vaga = None
+
+    def __enter__(self):
+        self.acquire()
+        return self
+
+    def __exit__(self, *exc):
+        self.release()
+
+
+class ConcessoesLogin:
+    """
+    Vagas de login por CPF sobre um backend. `limite`: sessões simultâneas por CPF; `ttl` (s):
+    prazo de cada vaga, renovado a cada `ttl / 3`; `ociosa_max` (s): quanto uma vaga ociosa
+    (sessão logada parada no pool) fica reservada para as próximas tarefas deste processo.
+    """
+
+    def __init__(self, backend, limite, ttl=60, ociosa_max=120, intervalo_espera=1.0, dono=None):
+        self.backend = backend
+        self.limite = limite
+        self.ttl = ttl
+        self.ociosa_max = ociosa_max
+        self.intervalo_espera = intervalo_espera
+        self.dono = dono or f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+        self._cond = threading.Condition()
+        self._em_uso = set()
+        self._ociosas = {}
+        self._esperando = {}
+        self._renovador = None
+
+    def vaga(self, cpf):
+        return VagaLogin(self, str(cpf))
+
+    def adquirir(self, cpf, timeout=None):
+        """
+        Bloqueia até ter uma vaga de login para `cpf` e retorna o número dela. Prefere uma vaga
+        ociosa deste processo, com o login ainda vivo no pool.
+        """
+        limite = None if timeout is None else time.monotonic() + timeout
+        obtida = False
+        with self._cond:
+            self._esperando[cpf] = self._esperando.get(cpf, 0) + 1
+        try:
+            while True:
+                with self._cond:
+                    if self._ociosas.get(cpf):
+                        vaga, _ = self._ociosas[cpf].pop()
+                        self._em_uso.add((cpf, vaga))
+                        obtida = True
+                        return vaga
+                vaga = self.backend.tentar(cpf, self.dono, self.limite, self.ttl)
+                if vaga is not None:
+                    with self._cond:
+                        self._em_uso.add((cpf, vaga))
+                    obtida = True
+                    self._iniciar_renovador()
+                    return vaga
+                restante = None if limite is None else limite - time.monotonic()
+                if restante is not None and restante <= 0:
+                    raise SemVaga(f"Sem vaga de login para o contador {cpf}: {self.limite} sessão(ões) em uso.")
+                # Acorda com uma devolução deste processo ou volta ao backend depois do intervalo
+                with self._cond:
+                    if not self._ociosas.get(cpf):
+                        self._cond.wait(self.intervalo_espera if restante is None else min(self.intervalo_espera, restante))
+        finally:
+            with self._cond:
+                self._esperando[cpf] -= 1
+            if not obtida:
+                self.backend.desistir(cpf, self.dono)
+
+    def devolver(self, cpf, vaga, manter=False):
+        """
+        `manter`: a sessão voltou logada ao pool. A vaga fica ociosa com ela para a próxima tarefa
+        do contador neste processo, a menos que só outro processo esteja esperando por ela.
+        """
+        outros = 0 if not manter else self.backend.esperando(cpf, self.dono)
+        with self._cond:
+            self._em_uso.discard((cpf, vaga))
+            if manter and (self._esperando.get(cpf) or not outros):
+                self._ociosas.setdefault(cpf, []).append((vaga, time.monotonic()))
+                self._cond.notify_all()
+                return
+        self.backend.liberar(cpf, vaga, self.dono)
+        with self._cond:
+            self._cond.notify_all()
+
+    def _iniciar_renovador(self):
+        with self._cond:
+            if self._renovador is None:
+                self._renovador = threading.Thread(target=self._renovar, daemon=True, name="concessoes-login")
+                self._renovador.start()
+
+    def _renovar(self):
+        while True:
+            time.sleep(max(1.0, self.ttl / 3))
+            try:
+                self.renovar()
+            except Exception as e:
+                log_monitoramento(f"Concessões de login: falha ao renovar as vagas: {e}")
+
+    def renovar(self):
+        """Renova as vagas deste processo e devolve as ociosas vencidas ou pedidas por outro processo."""
+        agora = time.monotonic()
+        liberar = []
+        with self._cond:
+            for cpf, ociosas in self._ociosas.items():
+                for vaga, desde in list(ociosas):
+                    if agora - desde >= self.ociosa_max:
+                        ociosas.remove((vaga, desde))
+                        liberar.append((cpf, vaga))
+            com_ociosas = [cpf for cpf, ociosas in self._ociosas.items() if ociosas]
+        for cpf, vaga in liberar:
+            self.backend.liberar(cpf, vaga, self.dono)
+        for cpf in com_ociosas:
+            if self.backend.esperando(cpf, self.dono):
+                with self._cond:
+                    ociosas, self._ociosas[cpf] = self._ociosas[cpf], []
+                for vaga, _ in ociosas:
+                    self.backend.liberar(cpf, vaga, self.dono)
+        with self._cond:
+            mantidas = list(self._em_uso) + [(cpf, v) for cpf, ociosas in self._ociosas.items() for v, _ in ociosas]
+        perdidas = self.backend.renovar(mantidas, self.dono, self.ttl) if mantidas else []
+        if perdidas:
+            with self._cond:
+                for cpf, vaga in perdidas:
+                    self._ociosas[cpf] = [(v, d) for v, d in self._ociosas.get(cpf, []) if v != vaga]
+            log_monitoramento(f"Concessões de login: {len(perdidas)} vaga(s) venceram antes da renovação "
+                              f"(processo travado?): {', '.join(f'{c} #{v}' for c, v in perdidas)}")
+
+
+_concessoes = None
+_concessoes_lock = threading.Lock()
+
+
+def get_concessoes():
+    global _concessoes
+    with _concessoes_lock:
+        if _concessoes is None:
+            from config.config import (
+                MAX_SESSOES_POR_CONTADOR, CONCESSOES_BACKEND, CONCESSOES_DB, CONCESSOES_TTL, CONCESSOES_OCIOSA_MAX
+            )
+            if CONCESSOES_BACKEND == "sqlite":
+                backend = ConcessoesSqlite(CONCESSOES_DB)
+            elif CONCESSOES_BACKEND == "memoria":
+                backend = ConcessoesMemoria()
+            else:
+                # "pacote.modulo:fabrica" de um backend compartilhado entre máquinas
+                import importlib
+                modulo, fabrica = CONCESSOES_BACKEND.split(":")
+                backend = getattr(importlib.import_module(modulo), fabrica)()
+            _concessoes = ConcessoesLogin(backend, MAX_SESSOES_POR_CONTADOR, CONCESSOES_TTL, CONCESSOES_OCIOSA_MAX)
+        return _concessoes
@@ -0,0 +1,218 @@
+"""
+Disjuntor de queda do portal da SEFAZ, compartilhado pelos processos workers da máquina (SQLite).
+
+Fechado: tudo normal. Erros de portal fora do ar (timeout, conexão recusada, stacktrace do
+Chrome, como classificados por mapear_erro_legivel) são contados numa janela; passando do
+limite o disjuntor abre. Aberto: os consumidores param de pegar mensagens e as tarefas em
+andamento esperam em vez de abrir Chrome. Depois da espera, um único processo reserva a
+sonda (meio aberto) e faz uma requisição barata à tela de login: se o portal responder, o
+disjuntor fecha e o consumo volta; se não, abre de novo com espera dobrada.
+"""
+import time
+import threading
+import requests
+from utils.checkpoints import abrir_conexao
+from utils.logger import log_monitoramento
+
+FECHADO = "FECHADO"
+ABERTO = "ABERTO"
+MEIO_ABERTO = "MEIO_ABERTO"
+
+# Trechos (em minúsculas) das mensagens de mapear_erro_legivel que indicam portal fora do ar
+SINAIS_QUEDA = (
+    "o site demorou demais para responder",
+    "falha na conexão com o navegador ou o site está fora do ar",
+    "ocorreu um erro inesperado ao acessar o portal sefaz",
+)
+
+_ESQUEMA = """
+CREATE TABLE IF NOT EXISTS disjuntor (
+    id             INTEGER PRIMARY KEY CHECK (id = 1),
+    estado         TEXT NOT NULL,
+    falhas         INTEGER NOT NULL,
+    primeira_falha REAL NOT NULL,
+    espera         REAL NOT NULL,
+    aberto_ate     REAL NOT NULL,
+    sondando_ate   REAL NOT NULL,
+    mudou_em       REAL NOT NULL
+);
+"""
+
+
+def e_queda(erro):
+    texto = str(erro).lower()
+    return any(sinal in texto for sinal in SINAIS_QUEDA)
+
+
+def sondar_url(url, timeout=10):
+    """Sonda padrão: o portal responde à URL sem erro de servidor."""
+    try:
+        return requests.get(url, timeout=timeout).status_code < 500
+    except requests.RequestException:
+        return False
+
+
+class DisjuntorPortal:
+    """
+    `limite` falhas de queda em `janela` segundos abrem o disjuntor por `espera_base`
+    segundos (dobrando a cada sonda que falha, até `espera_maxima`). `sonda()` retorna
+    True se o portal respondeu.
+    """
+
+    def __init__(self, caminho, sonda, limite=5, janela=120, espera_base=60, espera_maxima=900, timeout_sonda=30):
+        self.caminho = str(caminho)
+        self.sonda = sonda
+        self.limite = limite
+        self.janela = janela
+        self.espera_base = espera_base
+        self.espera_maxima = espera_maxima
+        self.timeout_sonda = timeout_sonda
+        self._local = threading.local()
+        with self._conexao() as conexao:
+            conexao.executescript(_ESQUEMA)
+            conexao.execute(
+                "INSERT OR IGNORE INTO disjuntor (id, estado, falhas, primeira_falha, espera, aberto_ate, sondando_ate, "
+                "mudou_em) VALUES (1, ?, 0, 0, ?, 0, 0, ?)", (FECHADO, espera_base, time.time())
+            )
+
+    def _conexao(self):
+        conexao = getattr(self._local, "conexao", None)
+        if conexao is None:
+            conexao = abrir_conexao(self.caminho)
+            self._local.conexao = conexao
+        return conexao
+
+    def _ler(self):
+        return self._conexao().execute("SELECT * FROM disjuntor WHERE id = 1").fetchone()
+
+    def _mudar(self, conexao, **campos):
+        campos["mudou_em"] = time.time()
+        conexao.execute("UPDATE disjuntor SET " + ", ".join(f"{c} = ?" for c in campos) + " WHERE id = 1",
+                        list(campos.values()))
+
+    def situacao(self):
+        linha = self._ler()
+        return {"estado": linha["estado"], "falhas": linha["falhas"], "espera": linha["espera"],
+                "reabre_em": max(0.0, linha["aberto_ate"] - time.time()), "desde": linha["mudou_em"]}
+
+    def aberto(self):
+        return self._ler()["estado"] != FECHADO
+
+    def registrar_falha(self):
+        """Conta uma falha de queda. Retorna True se foi ela que abriu o disjuntor."""
+        agora = time.time()
+        with self._conexao() as conexao:
+            conexao.execute("BEGIN IMMEDIATE")
+            linha = conexao.execute("SELECT * FROM disjuntor WHERE id = 1").fetchone()
+            if linha["estado"] != FECHADO:
+                return False
+            falhas = 1 if agora - linha["primeira_falha"] > self.janela else linha["falhas"] + 1
+            primeira = agora if falhas == 1 else linha["primeira_falha"]
+            if falhas < self.limite:
+                conexao.execute("UPDATE disjuntor SET falhas = ?, primeira_falha = ? WHERE id = 1", (falhas, primeira))
+                return False
+            self._mudar(conexao, estado=ABERTO, falhas=falhas, primeira_falha=primeira, espera=self.espera_base,
+                        aberto_ate=agora + self.espera_base)
+            return True
+
+    def registrar_sucesso(self):
+        """Uma requisição ao portal deu certo: zera as falhas e fecha o disjuntor se estiver aberto."""
+        with self._conexao() as conexao:
+            linha = conexao.execute("SELECT estado, falhas FROM disjuntor WHERE id = 1").fetchone()
+            if linha["estado"] != FECHADO:
+                self._mudar(conexao, estado=FECHADO, falhas=0, primeira_falha=0, espera=self.espera_base)
+            elif linha["falhas"]:
+                conexao.execute("UPDATE disjuntor SET falhas = 0, primeira_falha = 0 WHERE id = 1")
+
+    def observar(self, erro):
+        """Chamado com cada erro de requisição ao portal; retorna True se foi lido como queda."""
+        if not e_queda(erro):
+            return False
+        if self.registrar_falha():
+            log_monitoramento(f"Disjuntor do portal aberto: {self.limite} falhas de queda em até {self.janela}s "
+                              f"(última: {erro}). Consumo suspenso por {self.espera_base}s.")
+        return True
+
+    def reservar_sonda(self):
+        """Só um processo sonda: retorna True para quem pegou a vez (aberto e com a espera vencida)."""
+        agora = time.time()
+        with self._conexao() as conexao:
+            cursor = conexao.execute(
+                "UPDATE disjuntor SET estado = ?, sondando_ate = ?, mudou_em = ? WHERE id = 1 AND "
+                "((estado = ? AND aberto_ate <= ?) OR (estado = ? AND sondando_ate <= ?))",
+                (MEIO_ABERTO, agora + self.timeout_sonda, agora, ABERTO, agora, MEIO_ABERTO, agora)
+            )
+            return cursor.rowcount == 1
+
+    def sondar(self):
+        """Faz a sonda reservada e fecha ou reabre o disjuntor. Retorna True se o portal voltou."""
+        try:
+            ok = bool(self.sonda())
+        except Exception:
+            ok = False
+        if ok:
+            self.registrar_sucesso()
+            log_monitoramento("Disjuntor do portal fechado: a sonda teve resposta, consumo retomado.")
+            return True
+        agora = time.time()
+        with self._conexao() as conexao:
+            espera = min(self.espera_maxima, conexao.execute("SELECT espera FROM disjuntor WHERE id = 1").fetchone()[0] * 2)
+            self._mudar(conexao, estado=ABERTO, espera=espera, aberto_ate=agora + espera)
+        log_monitoramento(f"Disjuntor do portal: sonda sem resposta, nova tentativa em {espera:.0f}s.")
+        return False
+
+    def aguardar_fechado(self, timeout, intervalo=5):
+        """Espera o disjuntor fechar (sem sondar). Retorna False se passar de `timeout`."""
+        limite = time.monotonic() + timeout
+        while self.aberto():
+            if time.monotonic() >= limite:
+                return False
+            time.sleep(min(intervalo, max(0.0, limite - time.monotonic())))
+        return True
+
+    def fechar(self):
+        conexao = getattr(self._local, "conexao", None)
+        if conexao is not None:
+            conexao.close()
+            self._local.conexao = None
+
+
+class _SemDisjuntor:
+
+    def aberto(self):
+        return False
+
+    def registrar_sucesso(self):
+        pass
+
+    def observar(self, erro):
+        return False
+
+    def reservar_sonda(self):
+        return False
+
+    def aguardar_fechado(self, timeout, intervalo=5):
+        return True
+
+
+_disjuntor = None
+_disjuntor_lock = threading.Lock()
+
+
+def get_disjuntor():
+    global _disjuntor
+    with _disjuntor_lock:
+        if _disjuntor is None:
+            from config.config import (
+                SEFAZ_URL_LOGIN, DISJUNTOR_ATIVO, DISJUNTOR_DB, DISJUNTOR_FALHAS, DISJUNTOR_JANELA,
+                DISJUNTOR_ESPERA_BASE, DISJUNTOR_ESPERA_MAXIMA, DISJUNTOR_TIMEOUT_SONDA
+            )
+            if DISJUNTOR_ATIVO:
+                _disjuntor = DisjuntorPortal(
+                    DISJUNTOR_DB, lambda: sondar_url(SEFAZ_URL_LOGIN, DISJUNTOR_TIMEOUT_SONDA),
+                    DISJUNTOR_FALHAS, DISJUNTOR_JANELA, DISJUNTOR_ESPERA_BASE, DISJUNTOR_ESPERA_MAXIMA,
+                    DISJUNTOR_TIMEOUT_SONDA * 2
+                )
+            else:
+                _disjuntor = _SemDisjuntor()
+        return _disjuntor
@@ -0,0 +1,262 @@
+"""
+Ingestão dos ZIPs baixados: extração em streaming num pool de processos e índice das NF-e.
+
+Cada ZIP é lido membro a membro (sem carregar o arquivo inteiro na memória) e os XMLs vão
+para a subpasta "xml" ao lado do ZIP. Cada XML é lido com iterparse, limpando os elementos
+já vistos, só para tirar chave de acesso, CNPJ/CPF do emitente e do destinatário, dhEmi e
+vNF. O índice é um SQLite na pasta da consulta, ao lado dos arquivos.
+
+Com o armazém (utils.armazem), cada XML é guardado uma vez pelo hash do conteúdo e a pasta
+"xml" recebe hard links; o ZIP pode então ser apagado e reconstruído sob demanda.
+"""
+import os
+import shutil
+import zipfile
+import threading
+import multiprocessing
+import xml.etree.ElementTree as ET
+from concurrent.futures import Future, ProcessPoolExecutor
+from utils.checkpoints import abrir_conexao
+from utils.armazem import guardar_objeto, vincular
+
+BLOCO_EXTRACAO = 1024 * 1024
+
+_ESQUEMA = """
+CREATE TABLE IF NOT EXISTS notas (
+    chave             TEXT NOT NULL,
+    tipo              TEXT NOT NULL,
+    ie                TEXT NOT NULL,
+    oper              TEXT NOT NULL,
+    cnpj_emitente     TEXT NOT NULL DEFAULT '',
+    cnpj_destinatario TEXT NOT NULL DEFAULT '',
+    dh_emissao        TEXT NOT NULL DEFAULT '',
+    valor             REAL,
+    arquivo_xml       TEXT NOT NULL,
+    arquivo_zip       TEXT NOT NULL,
+    PRIMARY KEY (chave, tipo)
+);
+CREATE INDEX IF NOT EXISTS notas_emitente ON notas (cnpj_emitente, dh_emissao);
+CREATE INDEX IF NOT EXISTS notas_destinatario ON notas (cnpj_destinatario, dh_emissao);
+CREATE TABLE IF NOT EXISTS arquivos (
+    arquivo_zip TEXT PRIMARY KEY,
+    tamanho     INTEGER NOT NULL,
+    modificado  REAL NOT NULL,
+    notas       INTEGER NOT NULL,
+    erros       INTEGER NOT NULL
+);
+"""
+
+# (pai, elemento) -> campo do índice
+_CAMPOS = {
+    ("emit", "CNPJ"): "cnpj_emitente",
+    ("emit", "CPF"): "cnpj_emitente",
+    ("dest", "CNPJ"): "cnpj_destinatario",
+    ("dest", "CPF"): "cnpj_destinatario",
+    ("dest", "idEstrangeiro"): "cnpj_destinatario",
+    ("ide", "dhEmi"): "dh_emissao",
+    ("ide", "dEmi"): "dh_emissao",
+    ("ICMSTot", "vNF"): "valor",
+    ("infProt", "chNFe"): "chave",
+    ("infEvento", "chNFe"): "chave",
+}
+
+
+def _nome(tag):
+    return tag.rsplit("}", 1)[-1]
+
+
+def ler_nfe(fonte):
+    """Campos do índice de um XML de NF-e (nfeProc, NFe ou procEventoNFe), lido em streaming."""
+    dados = {"tipo": "", "chave": "", "cnpj_emitente": "", "cnpj_destinatario": "", "dh_emissao": "", "valor": None}
+    pilha = []
+    for evento, elemento in ET.iterparse(fonte, events=("start", "end")):
+        nome = _nome(elemento.tag)
+        if evento == "start":
+            if not pilha:
+                dados["tipo"] = nome
+            if nome == "infNFe" and elemento.get("Id", "").startswith("NFe"):
+                dados["chave"] = elemento.get("Id")[3:]
+            pilha.append(nome)
+            continue
+        pilha.pop()
+        campo = _CAMPOS.get((pilha[-1] if pilha else "", nome))
+        if campo and not dados[campo]:
+            dados[campo] = (elemento.text or "").strip()
+        elemento.clear()
+    if dados["valor"]:
+        dados["valor"] = float(dados["valor"])
+    return dados
+
+
+def processar_zip(caminho, pasta_xml, raiz_armazem=None):
+    """
+    Roda num processo do pool: extrai os XMLs do ZIP para `pasta_xml` e lê cada um.
+    Com `raiz_armazem`, o XML vai para o armazém e `pasta_xml` recebe um hard link.
+    Retorna a lista de registros (com "erro" nos XMLs que não puderam ser lidos).
+    """
+    os.makedirs(pasta_xml, exist_ok=True)
+    registros = []
+    with zipfile.ZipFile(caminho) as arquivo_zip:
+        for item in arquivo_zip.infolist():
+            if item.is_dir() or not item.filename.lower().endswith(".xml"):
+                continue
+            nome = os.path.basename(item.filename)
+            alvo = os.path.join(pasta_xml, nome)
+            extra = {"nome": nome}
+            if raiz_armazem:
+                with arquivo_zip.open(item) as origem:
+                    extra["hash"], extra["tamanho"], objeto = guardar_objeto(raiz_armazem, origem)
+                vincular(objeto, alvo)
+            else:
+                with arquivo_zip.open(item) as origem, open(alvo + ".part", "wb") as saida:
+                    shutil.copyfileobj(origem, saida, BLOCO_EXTRACAO)
+                os.replace(alvo + ".part", alvo)
+            try:
+                dados = ler_nfe(alvo)
+            except ET.ParseError as e:
+                dados = {"erro": f"XML inválido: {e}"}
+            dados.update(extra, arquivo_xml=alvo)
+            registros.append(dados)
+    return registros
+
+
+class IndiceNfe:
+    """Índice SQLite das NF-e extraídas de uma consulta (uma linha por chave e tipo de documento)."""
+
+    def __init__(self, caminho):
+        self.caminho = str(caminho)
+        self._local = threading.local()
+        os.makedirs(os.path.dirname(self.caminho) or ".", exist_ok=True)
+        with self._conexao() as conexao:
+            conexao.executescript(_ESQUEMA)
+
+    def _conexao(self):
+        conexao = getattr(self._local, "conexao", None)
+        if conexao is None:
+            conexao = abrir_conexao(self.caminho)
+            self._local.conexao = conexao
+        return conexao
+
+    def ja_indexado(self, arquivo_zip):
+        """O ZIP já foi indexado e não mudou desde então (mesmo tamanho e data)."""
+        linha = self._conexao().execute(
+            "SELECT tamanho, modificado FROM arquivos WHERE arquivo_zip = ?", (arquivo_zip,)
+        ).fetchone()
+        if linha is None or not os.path.exists(arquivo_zip):
+            return False
+        estado = os.stat(arquivo_zip)
+        return linha["tamanho"] == estado.st_size and linha["modificado"] == estado.st_mtime
+
+    def gravar(self, arquivo_zip, registros, ie, oper):
+        validos = [r for r in registros if not r.get("erro") and r.get("chave")]
+        # Com o armazém o ZIP pode já ter sido apagado: fica registrado como indexado sem tamanho/data
+        estado = os.stat(arquivo_zip) if os.path.exists(arquivo_zip) else os.stat_result((0,) * 10)
+        with self._conexao() as conexao:
+            conexao.executemany(
+                "INSERT OR REPLACE INTO notas (chave, tipo, ie, oper, cnpj_emitente, cnpj_destinatario, dh_emissao, valor, "
+                "arquivo_xml, arquivo_zip) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                [(r["chave"], r["tipo"], str(ie), str(oper), r["cnpj_emitente"], r["cnpj_destinatario"], r["dh_emissao"],
+                  r["valor"], r["arquivo_xml"], arquivo_zip) for r in validos]
+            )
+            conexao.execute(
+                "INSERT OR REPLACE INTO arquivos (arquivo_zip, tamanho, modificado, notas, erros) VALUES (?, ?, ?, ?, ?)",
+                (arquivo_zip, estado.st_size, estado.st_mtime, len(validos), len(registros) - len(validos))
+            )
+        return len(validos)
+
+    def buscar(self, chave=None, cnpj=None, inicio=None, fim=None):
+        """Notas por chave, por CNPJ (emitente ou destinatário) e/ou faixa de dhEmi ('YYYY-MM-DD')."""
+        condicoes, parametros = [], []
+        if chave:
+            condicoes.append("chave = ?")
+            parametros.append(chave)
+        if cnpj:
+            condicoes.append("(cnpj_emitente = ? OR cnpj_destinatario = ?)")
+            parametros += [cnpj, cnpj]
+        if inicio:
+            condicoes.append("substr(dh_emissao, 1, 10) >= ?")
+            parametros.append(inicio)
+        if fim:
+            condicoes.append("substr(dh_emissao, 1, 10) <= ?")
+            parametros.append(fim)
+        sql = "SELECT * FROM notas" + (" WHERE " + " AND ".join(condicoes) if condicoes else "") + " ORDER BY dh_emissao"
+        return [dict(l) for l in self._conexao().execute(sql, parametros).fetchall()]
+
+    def fechar(self):
+        conexao = getattr(self._local, "conexao", None)
+        if conexao is not None:
+            conexao.close()
+            self._local.conexao = None
+
+
+class IngestaoJob:
+    """
+    Ingestão dos ZIPs de uma consulta: `adicionar` manda cada ZIP para o pool de processos
+    assim que ele é baixado; `aguardar` grava os resultados no índice e devolve um resumo
+    (falhas como [(ie, mensagem)]).
+    """
+
+    def __init__(self, pasta_base, nome_indice="indice_nfe.sqlite3", executor=None,
+                 id_automacao=None, armazem=None, manter_zips=True):
+        self.pasta_base = pasta_base
+        self.indice = IndiceNfe(os.path.join(pasta_base, nome_indice))
+        self.executor = executor or get_executor()
+        self.id_automacao = id_automacao
+        self.armazem = armazem
+        self.manter_zips = manter_zips
+        self.pendentes = []
+        self.enviados = set()
+
+    def adicionar(self, arquivos, ie, oper):
+        pasta_xml = os.path.join(self.pasta_base, str(ie), "xml")
+        for caminho in arquivos or []:
+            if not caminho.lower().endswith(".zip") or caminho in self.enviados:
+                continue
+            self.enviados.add(caminho)
+            if self.armazem is not None and self.armazem.conhece_pacote(caminho):
+                # Já guardado (outro job, outra entrega ou a outra operação): só os links e o manifesto
+                pronto = Future()
+                pronto.set_result(self.armazem.vincular_pacote(caminho, pasta_xml))
+                self.pendentes.append((pronto, caminho, ie, oper, True))
+            elif os.path.exists(caminho) and not self.indice.ja_indexado(caminho):
+                raiz = self.armazem.raiz if self.armazem is not None else None
+                futuro = self.executor.submit(processar_zip, caminho, pasta_xml, raiz)
+                self.pendentes.append((futuro, caminho, ie, oper, False))
+
+    def aguardar(self):
+        resumo = {"arquivos": 0, "notas": 0, "erros": 0, "falhas": []}
+        pendentes, self.pendentes = self.pendentes, []
+        for futuro, caminho, ie, oper, guardado in pendentes:
+            try:
+                registros = futuro.result()
+            except Exception as e:
+                resumo["falhas"].append((ie, f"{os.path.basename(caminho)}: {e}"))
+                continue
+            notas = self.indice.gravar(caminho, registros, ie, oper)
+            if self.armazem is not None:
+                if not guardado:
+                    self.armazem.registrar_pacote(caminho, [r for r in registros if r.get("hash")])
+                    if not self.manter_zips:
+                        os.remove(caminho)
+                self.armazem.registrar_manifesto(self.id_automacao, ie, oper, caminho)
+            resumo["arquivos"] += 1
+            resumo["notas"] += notas
+            resumo["erros"] += len(registros) - notas
+        return resumo
+
+    def fechar(self):
+        self.indice.fechar()
+
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def get_executor():
+    """Pool de processos da ingestão (spawn: o processo worker já tem threads rodando)."""
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            from config.config import INGESTAO_PROCESSOS
+            _executor = ProcessPoolExecutor(max_workers=INGESTAO_PROCESSOS, mp_context=multiprocessing.get_context("spawn"))
+        return _executor
@@ -0,0 +1,96 @@
+"""
+Verificação barata de ZIP baixado: só o diretório central e os cabeçalhos locais, via mmap.
+
+Sem extrair nada, confere que o registro de fim (EOCD) existe, que cada entrada do diretório
+central aponta para um cabeçalho local com o mesmo nome (e mesmo CRC/tamanhos, quando o
+cabeçalho local os traz) e que os dados de cada entrada cabem antes do diretório central. Um
+download truncado ou cortado no meio falha aqui. `crc_completo=True` também descompacta tudo
+e confere o CRC de cada XML (zipfile.testzip), bem mais caro.
+"""
+import os
+import mmap
+import struct
+import zipfile
+import zlib
+
+_EOCD = b"PK\x05\x06"
+_CENTRAL = b"PK\x01\x02"
+_LOCAL = b"PK\x03\x04"
+_EOCD_TAMANHO = 22
+_COMENTARIO_MAXIMO = 0xFFFF
+_DESCRITOR_DE_DADOS = 0x08
+
+
+def _resultado(entradas=0, xmls=0, erro=""):
+    return {"ok": not erro, "entradas": entradas, "xmls": xmls, "erro": erro}
+
+
+def _verificar_zipfile(caminho, crc_completo):
+    """ZIP64 e casos fora do formato simples: usa o zipfile (também só lê o diretório central)."""
+    try:
+        with zipfile.ZipFile(caminho) as arquivo_zip:
+            itens = [i for i in arquivo_zip.infolist() if not i.is_dir()]
+            if crc_completo:
+                ruim = arquivo_zip.testzip()
+                if ruim:
+                    return _resultado(len(itens), 0, f"CRC inválido em {ruim}")
+    except (zipfile.BadZipFile, zlib.error, OSError, EOFError) as e:
+        return _resultado(erro=f"ZIP ilegível: {e}")
+    return _resultado(len(itens), sum(1 for i in itens if i.filename.lower().endswith(".xml")))
+
+
+def verificar_zip(caminho, crc_completo=False):
+    """Retorna dict(ok, entradas, xmls, erro)."""
+    tamanho = os.path.getsize(caminho)
+    if tamanho < _EOCD_TAMANHO:
+        return _resultado(erro=f"arquivo com {tamanho} bytes")
+    with open(caminho, "rb") as arquivo, mmap.mmap(arquivo.fileno(), 0, access=mmap.ACCESS_READ) as dados:
+        try:
+            resultado = _verificar_estrutura(dados, tamanho)
+        except struct.error:
+            resultado = _resultado(erro="estrutura do ZIP cortada (download truncado?)")
+    if resultado is None:
+        return _verificar_zipfile(caminho, crc_completo)
+    if resultado["ok"] and crc_completo:
+        verificado = _verificar_zipfile(caminho, True)
+        if not verificado["ok"]:
+            return verificado
+    return resultado
+
+
+def _verificar_estrutura(dados, tamanho):
+    """Confere EOCD, diretório central e cabeçalhos locais. None: ZIP64, fica com o zipfile."""
+    fim = dados.rfind(_EOCD, max(0, tamanho - _EOCD_TAMANHO - _COMENTARIO_MAXIMO))
+    if fim < 0 or fim + _EOCD_TAMANHO > tamanho:
+        return _resultado(erro="registro de fim do ZIP ausente (download truncado?)")
+    _, _, _, total, tamanho_central, inicio_central, _ = struct.unpack_from("<HHHHIIH", dados, fim + 4)
+    if total == 0xFFFF or inicio_central == 0xFFFFFFFF:
+        return None
+    if inicio_central + tamanho_central > fim:
+        return _resultado(erro="diretório central fora do arquivo (download truncado?)")
+
+    posicao, entradas, xmls = inicio_central, 0, 0
+    for _ in range(total):
+        if dados[posicao:posicao + 4] != _CENTRAL:
+            return _resultado(entradas, xmls, f"entrada {entradas + 1} do diretório central corrompida")
+        (flags, _, _, _, crc, compactado, original, n_nome, n_extra, n_comentario,
+         _, _, _, local) = struct.unpack_from("<4xHHHHIIIHHHHHII", dados, posicao + 4)
+        nome = dados[posicao + 46:posicao + 46 + n_nome]
+        posicao += 46 + n_nome + n_extra + n_comentario
+
+        if dados[local:local + 4] != _LOCAL:
+            return _resultado(entradas, xmls, f"cabeçalho local ausente para {nome.decode('cp437', 'replace')}")
+        (local_crc, local_compactado, local_original,
+         local_n_nome, local_n_extra) = struct.unpack_from("<10xIIIHH", dados, local + 4)
+        if dados[local + 30:local + 30 + local_n_nome] != nome:
+            return _resultado(entradas, xmls, f"nome divergente no cabeçalho local de {nome.decode('cp437', 'replace')}")
+        if not flags & _DESCRITOR_DE_DADOS and (local_crc, local_compactado, local_original) != (crc, compactado, original):
+            return _resultado(entradas, xmls, f"CRC/tamanho divergente em {nome.decode('cp437', 'replace')}")
+        if local + 30 + local_n_nome + local_n_extra + compactado > inicio_central:
+            return _resultado(entradas, xmls, f"dados de {nome.decode('cp437', 'replace')} cortados")
+
+        if not nome.endswith(b"/"):
+            entradas += 1
+            xmls += nome.lower().endswith(b".xml")
+
+    return _resultado(entradas, xmls)
@@ -0,0 +1,210 @@
+"""
+Limite de requisições ao portal da SEFAZ (logins, pesquisas e downloads), com balde de fichas.
+
+Cada tipo tem dois baldes: um do processo (em memória) e um da máquina, num SQLite ao lado
+dos checkpoints, que todos os processos workers consultam na mesma transação. Uma requisição
+só sai com ficha nos dois. Quando aparece um erro com cara de limitação do portal (erro
+interno no download, demora para responder, HTTP 429/503), a taxa da máquina cai pela metade
+e os novos pedidos esperam uma pausa crescente; a taxa volta ao normal aos poucos.
+"""
+import time
+import threading
+from utils.checkpoints import abrir_conexao
+
+LOGIN = "login"
+PESQUISA = "pesquisa"
+DOWNLOAD = "download"
+
+# Trechos (em minúsculas) do erro original ou da mensagem de mapear_erro_legivel
+SINAIS_LIMITACAO = (
+    "erro interno ao realizar o download",
+    "erro interno do portal",
+    "o site demorou demais para responder",
+    "too many requests",
+    "429 client error",
+    "503 server error",
+)
+
+_ESQUEMA = """
+CREATE TABLE IF NOT EXISTS baldes (
+    tipo          TEXT PRIMARY KEY,
+    fichas        REAL NOT NULL,
+    atualizado_em REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS reducao (
+    id            INTEGER PRIMARY KEY CHECK (id = 1),
+    fator         REAL NOT NULL,
+    pausa_ate     REAL NOT NULL,
+    penalizado_em REAL NOT NULL
+);
+"""
+
+
+def e_limitacao(erro):
+    texto = str(erro).lower()
+    return any(sinal in texto for sinal in SINAIS_LIMITACAO)
+
+
+class BaldeFichas:
+    """Balde de fichas em memória: `por_minuto` de taxa e até `rajada` fichas acumuladas."""
+
+    def __init__(self, por_minuto, rajada):
+        self.taxa = por_minuto / 60.0
+        self.rajada = float(rajada)
+        self.fichas = float(rajada)
+        self.atualizado_em = time.monotonic()
+        self._lock = threading.Lock()
+
+    def tentar(self):
+        """Retorna 0 se pegou a ficha ou quantos segundos faltam para a próxima."""
+        with self._lock:
+            agora = time.monotonic()
+            self.fichas = min(self.rajada, self.fichas + (agora - self.atualizado_em) * self.taxa)
+            self.atualizado_em = agora
+            if self.fichas >= 1:
+                self.fichas -= 1
+                return 0.0
+            return (1 - self.fichas) / self.taxa
+
+    def devolver(self):
+        with self._lock:
+            self.fichas = min(self.rajada, self.fichas + 1)
+
+
+class LimitadorPortal:
+    """
+    `limites_maquina` e `limites_processo`: {tipo: (por_minuto, rajada)}. Tipos sem limite
+    passam direto. `pausa_base`/`pausa_maxima` (s): espera após um sinal de limitação,
+    dobrando a cada sinal seguido; `recuperacao` (s): tempo para a taxa voltar de
+    `fator_minimo` a 100%.
+    """
+
+    def __init__(self, caminho, limites_maquina, limites_processo=None, pausa_base=10, pausa_maxima=300,
+                 recuperacao=600, fator_minimo=0.1, intervalo_sinais=5):
+        self.caminho = str(caminho)
+        self.limites = dict(limites_maquina)
+        self.locais = {tipo: BaldeFichas(*limite) for tipo, limite in (limites_processo or {}).items()}
+        self.pausa_base = pausa_base
+        self.pausa_maxima = pausa_maxima
+        self.recuperacao = recuperacao
+        self.fator_minimo = fator_minimo
+        self.intervalo_sinais = intervalo_sinais
+        self._local = threading.local()
+        with self._conexao() as conexao:
+            conexao.executescript(_ESQUEMA)
+            conexao.execute("INSERT OR IGNORE INTO reducao (id, fator, pausa_ate, penalizado_em) VALUES (1, 1.0, 0, 0)")
+
+    def _conexao(self):
+        conexao = getattr(self._local, "conexao", None)
+        if conexao is None:
+            conexao = abrir_conexao(self.caminho)
+            conexao.isolation_level = None
+            self._local.conexao = conexao
+        return conexao
+
+    def _fator(self, linha, agora):
+        """Fator atual da taxa: sobe linearmente desde a última penalização."""
+        recuperado = (agora - linha["penalizado_em"]) / self.recuperacao * (1 - self.fator_minimo)
+        return min(1.0, linha["fator"] + recuperado)
+
+    def _tentar_maquina(self, tipo):
+        por_minuto, rajada = self.limites[tipo]
+        agora = time.time()
+        with self._conexao() as conexao:
+            conexao.execute("BEGIN IMMEDIATE")
+            reducao = conexao.execute("SELECT * FROM reducao WHERE id = 1").fetchone()
+            if reducao["pausa_ate"] > agora:
+                return reducao["pausa_ate"] - agora
+            taxa = por_minuto / 60.0 * self._fator(reducao, agora)
+            linha = conexao.execute("SELECT fichas, atualizado_em FROM baldes WHERE tipo = ?", (tipo,)).fetchone()
+            fichas = rajada if linha is None else min(rajada, linha["fichas"] + max(0.0, agora - linha["atualizado_em"]) * taxa)
+            espera = 0.0 if fichas >= 1 else (1 - fichas) / taxa
+            if not espera:
+                fichas -= 1
+            conexao.execute("INSERT OR REPLACE INTO baldes (tipo, fichas, atualizado_em) VALUES (?, ?, ?)",
+                            (tipo, fichas, agora))
+            return espera
+
+    def aguardar(self, tipo, timeout=None):
+        """Bloqueia até poder fazer uma requisição `tipo`. Retorna o tempo esperado (s)."""
+        inicio = time.monotonic()
+        while True:
+            local = self.locais.get(tipo)
+            espera = local.tentar() if local else 0.0
+            if not espera and tipo in self.limites:
+                espera = self._tentar_maquina(tipo)
+                if espera and local:
+                    local.devolver()
+            if not espera:
+                return time.monotonic() - inicio
+            if timeout is not None and time.monotonic() - inicio + espera > timeout:
+                raise Exception(f"Limite de requisições ao portal ({tipo}): sem vaga em {timeout}s.")
+            time.sleep(min(espera, 5))
+
+    def sinalizar_limitacao(self):
+        """
+        O portal deu sinal de limitação: corta a taxa da máquina pela metade e pausa os pedidos.
+        Sinais repetidos em menos de `intervalo_sinais` (o mesmo erro visto por várias
+        threads ou logado mais de uma vez) contam uma vez só. Retorna a pausa aplicada ou 0.
+        """
+        agora = time.time()
+        with self._conexao() as conexao:
+            conexao.execute("BEGIN IMMEDIATE")
+            reducao = conexao.execute("SELECT * FROM reducao WHERE id = 1").fetchone()
+            if agora - reducao["penalizado_em"] < self.intervalo_sinais:
+                return 0
+            fator = max(self.fator_minimo, self._fator(reducao, agora) / 2)
+            pausa = min(self.pausa_maxima, self.pausa_base / fator)
+            conexao.execute("UPDATE reducao SET fator = ?, pausa_ate = ?, penalizado_em = ? WHERE id = 1",
+                            (fator, agora + pausa, agora))
+            return pausa
+
+    def observar(self, erro):
+        """Chamado com cada erro de requisição ao portal; retorna True se foi lido como limitação."""
+        if not e_limitacao(erro):
+            return False
+        self.sinalizar_limitacao()
+        return True
+
+    def situacao(self):
+        linha = self._conexao().execute("SELECT * FROM reducao WHERE id = 1").fetchone()
+        agora = time.time()
+        return {"fator": self._fator(linha, agora), "pausa": max(0.0, linha["pausa_ate"] - agora)}
+
+    def fechar(self):
+        conexao = getattr(self._local, "conexao", None)
+        if conexao is not None:
+            conexao.close()
+            self._local.conexao = None
+
+
+class _SemLimite:
+
+    def aguardar(self, tipo, timeout=None):
+        return 0.0
+
+    def sinalizar_limitacao(self):
+        return 0
+
+    def observar(self, erro):
+        return False
+
+
+_limitador = None
+_limitador_lock = threading.Lock()
+
+
+def get_limitador():
+    global _limitador
+    with _limitador_lock:
+        if _limitador is None:
+            from config.config import (
+                LIMITADOR_ATIVO, LIMITADOR_DB, LIMITES_PORTAL_MAQUINA, LIMITES_PORTAL_PROCESSO,
+                LIMITADOR_PAUSA_BASE, LIMITADOR_PAUSA_MAXIMA, LIMITADOR_RECUPERACAO
+            )
+            if LIMITADOR_ATIVO:
+                _limitador = LimitadorPortal(LIMITADOR_DB, LIMITES_PORTAL_MAQUINA, LIMITES_PORTAL_PROCESSO,
+                                             LIMITADOR_PAUSA_BASE, LIMITADOR_PAUSA_MAXIMA, LIMITADOR_RECUPERACAO)
+            else:
+                _limitador = _SemLimite()
+        return _limitador
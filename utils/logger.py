@@ -1,15 +1,159 @@
 import os
+import time
+import queue
+import atexit
 import logging
+import threading
+from collections import OrderedDict
 from datetime import datetime
 
+
+class EscritorLogs:
+    """
+    Grava as linhas de log em uma thread de fundo.
+
+    Quem loga só coloca (caminho, linha) na fila. A thread agrupa as linhas
+    por arquivo, grava em lotes e mantém os arquivos abertos em um cache LRU
+    com no máximo `max_abertos` descritores.
+    """
+
+    def __init__(self, max_abertos=64, lote=500, intervalo=0.5, ocioso=60):
+        self.max_abertos = max_abertos
+        self.lote = lote
+        self.intervalo = intervalo
+        self.ocioso = ocioso
+        self._fila = queue.Queue()
+        self._arquivos = OrderedDict()   # caminho -> (arquivo, último uso)
+        self._pastas = set()
+        self._thread = None
+        self._lock = threading.Lock()
+
+    def escrever(self, caminho, mensagem):
+        agora = datetime.now()
+        linha = f"{agora.strftime('%Y-%m-%d %H:%M:%S')},{agora.microsecond // 1000:03d} - {mensagem}\n"
+        self._iniciar()
+        self._fila.put((str(caminho), linha))
+
+    def flush(self, timeout=10):
+        """Bloqueia até tudo que foi enfileirado antes desta chamada estar gravado."""
+        if self._thread is None:
+            return
+        pronto = threading.Event()
+        self._fila.put(pronto)
+        pronto.wait(timeout)
+
+    def encerrar(self, timeout=10):
+        if self._thread is None:
+            return
+        self._fila.put(None)
+        self._thread.join(timeout)
+        self._thread = None
+
+    def _iniciar(self):
+        if self._thread is not None:
+            return
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._loop, name="escritor-logs", daemon=True)
+                self._thread.start()
+
+    def _loop(self):
+        while True:
+            try:
+                itens = [self._fila.get(timeout=self.intervalo)]
+            except queue.Empty:
+                self._fechar_ociosos()
+                continue
+            while len(itens) < self.lote:
+                try:
+                    itens.append(self._fila.get_nowait())
+                except queue.Empty:
+                    break
+
+            por_arquivo = OrderedDict()
+            avisos = []
+            encerrar = False
+            for item in itens:
+                if item is None:
+                    encerrar = True
+                elif isinstance(item, threading.Event):
+                    avisos.append(item)
+                else:
+                    por_arquivo.setdefault(item[0], []).append(item[1])
+
+            for caminho, linhas in por_arquivo.items():
+                try:
+                    arquivo = self._abrir(caminho)
+                    arquivo.write("".join(linhas))
+                    arquivo.flush()
+                except Exception as e:
+                    print(f"Erro ao gravar log {caminho}: {e}")
+                    self._fechar(caminho)
+
+            for aviso in avisos:
+                aviso.set()
+            if encerrar:
+                for caminho in list(self._arquivos):
+                    self._fechar(caminho)
+                return
+
+    def _abrir(self, caminho):
+        agora = time.monotonic()
+        if caminho in self._arquivos:
+            arquivo, _ = self._arquivos.pop(caminho)
+            self._arquivos[caminho] = (arquivo, agora)
+            return arquivo
+        pasta = os.path.dirname(caminho)
+        if pasta and pasta not in self._pastas:
+            os.makedirs(pasta, exist_ok=True)
+            self._pastas.add(pasta)
+        arquivo = open(caminho, "a", encoding="utf-8")
+        self._arquivos[caminho] = (arquivo, agora)
+        while len(self._arquivos) > self.max_abertos:
+            self._fechar(next(iter(self._arquivos)))
+        return arquivo
+
+    def _fechar(self, caminho):
+        arquivo, _ = self._arquivos.pop(caminho, (None, None))
+        if arquivo is not None:
+            try:
+                arquivo.close()
+            except Exception:
+                pass
+
+    def _fechar_ociosos(self):
+        limite = time.monotonic() - self.ocioso
+        for caminho, (_, ultimo_uso) in list(self._arquivos.items()):
+            if ultimo_uso < limite:
+                self._fechar(caminho)
+
+
+_escritor = None
+_escritor_lock = threading.Lock()
+
+def get_escritor():
+    global _escritor
+    with _escritor_lock:
+        if _escritor is None:
+            from config.config import (
+                LOG_MAX_ARQUIVOS_ABERTOS, LOG_LOTE, LOG_INTERVALO_FLUSH, LOG_ARQUIVO_OCIOSO
+            )
+            _escritor = EscritorLogs(LOG_MAX_ARQUIVOS_ABERTOS, LOG_LOTE, LOG_INTERVALO_FLUSH, LOG_ARQUIVO_OCIOSO)
+            atexit.register(_escritor.encerrar)
+        return _escritor
+
 def gerar_nome_log(empresa_id, cpf, data_ini, data_fim, ie):
     return f"{empresa_id}_{cpf}_{data_ini}_{data_fim}_{ie}"
 
 def setup_logger(nome_arquivo, caminho_log):
     logger = logging.getLogger(str(caminho_log))
     logger.setLevel(logging.INFO)
-    if logger.hasHandlers():
-        logger.handlers.clear()
+    caminho_abs = os.path.abspath(str(caminho_log))
+    if any(getattr(h, "baseFilename", None) == caminho_abs for h in logger.handlers):
+        return logger
+    for handler in list(logger.handlers):
+        logger.removeHandler(handler)
+        handler.close()
     os.makedirs(os.path.dirname(str(caminho_log)), exist_ok=True)
     handler = logging.FileHandler(str(caminho_log), encoding='utf-8')
     formatter = logging.Formatter('%(asctime)s - %(message)s')
@@ -20,23 +164,20 @@ def setup_logger(nome_arquivo, caminho_log):
 def log_funcionamento_execucao(id_automacao, empresa_id, cpf, data_ini, data_fim, ie, mensagem):
     from config.config import LOG_OK
     nome = f"LogFuncionamento_{id_automacao}_{empresa_id}_{cpf}_{data_ini}_{data_fim}_{ie}.log"
-    caminho = os.path.join(LOG_OK, nome)
-    logger = setup_logger(nome, caminho)
-    logger.info(mensagem)
+    get_escritor().escrever(os.path.join(LOG_OK, nome), mensagem)
 
 def log_erro_execucao(id_automacao, empresa_id, cpf, data_ini, data_fim, ie, mensagem):
     from config.config import LOG_ERRO
     nome = f"LogErro_{id_automacao}_{empresa_id}_{cpf}_{data_ini}_{data_fim}_{ie}.log"
-    caminho = os.path.join(LOG_ERRO, nome)
-    logger = setup_logger(nome, caminho)
-    logger.error(mensagem)
+    get_escritor().escrever(os.path.join(LOG_ERRO, nome), mensagem)
 
 def log_monitoramento(mensagem):
     from config.config import LOG_MONITORAMENTO
     data = datetime.now().strftime("%d%m%Y")
-    caminho = os.path.join(LOG_MONITORAMENTO, f"logMonitoramento_{data}.log")
-    logger = setup_logger("monitoramento", caminho)
-    logger.info(mensagem)
+    get_escritor().escrever(os.path.join(LOG_MONITORAMENTO, f"logMonitoramento_{data}.log"), mensagem)
+
+def flush_logs(timeout=10):
+    get_escritor().flush(timeout)
 
 def tirar_screenshot(nome_arquivo, destino):
     import pyautogui
@@ -70,11 +211,3 @@ def enviar_discord_mensagem(mensagem, webhook_url):
         print("Discord status:", resp.status_code, resp.text)  # Isso vai para o terminal/log, ajuda a debugar
     except Exception as e:
         print(f"Erro ao enviar para Discord: {e}")
-
-
-def salvar_controle_ie(id_automacao, empresa_id, cpf, data_ini, data_fim, ie, pasta):
-    nome = f"ControleIEs {id_automacao} {empresa_id} {cpf} {data_ini}_{data_fim}.log"
-    caminho = os.path.join(pasta, nome)
-    os.makedirs(os.path.dirname(caminho), exist_ok=True)
-    with open(caminho, "a", encoding="utf-8") as f:
-        f.write(f"{ie} - {datetime.now()}\n")
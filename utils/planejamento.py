@@ -0,0 +1,96 @@
+from datetime import date, timedelta
+from utils.checkpoints import data_iso
+
+
+def _data(valor):
+    return date.fromisoformat(data_iso(valor))
+
+
+def _br(dia):
+    return dia.strftime("%d/%m/%Y")
+
+
+class PerfilVolume:
+    """
+    Notas por dia de uma IE/operação, estimadas pelo total da legenda de resultados
+    das buscas anteriores (checkpoints de qualquer job). Cada busca espalha seu total
+    igualmente pelos dias do intervalo; a busca mais recente de um dia prevalece.
+    Dias nunca consultados usam a média dos dias conhecidos.
+    """
+
+    def __init__(self, registros=()):
+        self.por_dia = {}
+        for ini, fim, total_notas in registros:
+            inicio, final = _data(ini), _data(fim)
+            dias = (final - inicio).days + 1
+            if dias <= 0:
+                continue
+            taxa = (total_notas or 0) / dias
+            for i in range(dias):
+                self.por_dia[inicio + timedelta(days=i)] = taxa
+        self.media = sum(self.por_dia.values()) / len(self.por_dia) if self.por_dia else None
+
+    @classmethod
+    def carregar(cls, checkpoints, cpf, ie, oper):
+        return cls(checkpoints.historico(cpf, ie, oper))
+
+    @property
+    def vazio(self):
+        return self.media is None
+
+    def estimar(self, dia):
+        return self.por_dia.get(dia, self.media or 0.0)
+
+    def estimar_intervalo(self, ini, fim):
+        inicio, final = _data(ini), _data(fim)
+        return sum(self.estimar(inicio + timedelta(days=i)) for i in range((final - inicio).days + 1))
+
+
+def dividir_periodo_adaptativo(data_inicial, data_final, perfil, limite_notas=8000, dias_padrao=30, dias_max=366):
+    """
+    Como dividir_periodo, mas juntando meses fracos: cada janela tem no mínimo `dias_padrao`
+    dias e cresce enquanto as notas estimadas ficam abaixo de `limite_notas`. Janelas fortes
+    não são quebradas: acima do download único o caminho paginado custa menos idas ao portal
+    do que várias pesquisas menores (ver benchmarks/simular_planejamento.py). Sem histórico,
+    usa janelas fixas de `dias_padrao`. Retorna [(ini, fim)] em 'dd/mm/yyyy'.
+    """
+    inicio, final = _data(data_inicial), _data(data_final)
+    periodos = []
+    cursor = inicio
+    while cursor <= final:
+        sub_fim = min(cursor + timedelta(days=dias_padrao - 1), final)
+        if perfil is not None and not perfil.vazio:
+            estimado = perfil.estimar_intervalo(cursor, sub_fim)
+            while sub_fim < final and (sub_fim - cursor).days + 1 < dias_max:
+                proximo = perfil.estimar(sub_fim + timedelta(days=1))
+                if estimado + proximo > limite_notas:
+                    break
+                estimado += proximo
+                sub_fim += timedelta(days=1)
+        periodos.append((_br(cursor), _br(sub_fim)))
+        cursor = sub_fim + timedelta(days=1)
+    return periodos
+
+
+def subtrair_intervalos(lacunas, intervalos):
+    """
+    Tira de `lacunas` ([(ini, fim)] em ISO) os `intervalos` já encerrados que cabem inteiros
+    numa lacuna. Retorna (restantes, usados): o que ainda falta consultar e quais intervalos
+    foram descontados. Serve para retomar uma mensagem reentregue mesmo que o plano de
+    janelas tenha mudado desde a primeira entrega.
+    """
+    restantes = [(_data(ini), _data(fim)) for ini, fim in lacunas]
+    usados = []
+    for intervalo in sorted(intervalos, key=lambda i: data_iso(i[0])):
+        ini, fim = _data(intervalo[0]), _data(intervalo[1])
+        for pos, (l_ini, l_fim) in enumerate(restantes):
+            if l_ini <= ini and fim <= l_fim:
+                pedacos = []
+                if l_ini < ini:
+                    pedacos.append((l_ini, ini - timedelta(days=1)))
+                if fim < l_fim:
+                    pedacos.append((fim + timedelta(days=1), l_fim))
+                restantes[pos:pos + 1] = pedacos
+                usados.append(intervalo)
+                break
+    return [(i.isoformat(), f.isoformat()) for i, f in restantes], usados
@@ -3,6 +3,7 @@ import time
 import threading
 from utils.logger import log_monitoramento
 from config import config
+from utils.capacidade import NOMES_NIVEL
 
 def contar_chrome_selenium():
     count = 0
@@ -19,19 +20,34 @@ def contar_chrome_selenium():
             continue
     return count
 
-def monitor_resources():
-    while True:
+def monitor_resources(parar=None, sinal=None):
+    # Mede a cada MONITOR_INTERVALO e publica no `sinal` (usado pelo controle de admissão
+    # dos consumidores); o log completo continua saindo a cada MONITOR_INTERVALO_LOG.
+    ultimo_log = 0
+    ultimo_nivel = None
+    while not (parar is not None and parar.is_set()):
         cpu = psutil.cpu_percent(interval=1)
         ram = psutil.virtual_memory().percent
         chromes = contar_chrome_selenium()
 
-        log_monitoramento(f"CPU: {cpu}% | RAM: {ram}% | Chrome Selenium: {chromes}")
+        nivel = sinal.publicar(cpu, ram, chromes) if sinal is not None else None
+        if nivel != ultimo_nivel and ultimo_nivel is not None:
+            log_monitoramento(f"Capacidade da máquina: {NOMES_NIVEL[ultimo_nivel]} -> {NOMES_NIVEL[nivel]} "
+                              f"(CPU: {cpu}% | RAM: {ram}% | Chrome Selenium: {chromes})")
+        ultimo_nivel = nivel
 
-        if cpu > config.MAX_CPU_USAGE:
-            log_monitoramento(f"⚠️ Uso de CPU acima do limite ({cpu}% > {config.MAX_CPU_USAGE}%)")
-        if ram > config.MAX_RAM_USAGE:
-            log_monitoramento(f"⚠️ Uso de RAM acima do limite ({ram}% > {config.MAX_RAM_USAGE}%)")
-        if chromes > config.MAX_CHROME_INSTANCES:
-            log_monitoramento(f"⚠️ Instâncias do Chrome Selenium excedendo o limite ({chromes} > {config.MAX_CHROME_INSTANCES})")
+        if time.time() - ultimo_log >= config.MONITOR_INTERVALO_LOG:
+            ultimo_log = time.time()
+            log_monitoramento(f"CPU: {cpu}% | RAM: {ram}% | Chrome Selenium: {chromes}")
 
-        time.sleep(60)
+            if cpu > config.MAX_CPU_USAGE:
+                log_monitoramento(f"⚠️ Uso de CPU acima do limite ({cpu}% > {config.MAX_CPU_USAGE}%)")
+            if ram > config.MAX_RAM_USAGE:
+                log_monitoramento(f"⚠️ Uso de RAM acima do limite ({ram}% > {config.MAX_RAM_USAGE}%)")
+            if chromes > config.MAX_CHROME_INSTANCES:
+                log_monitoramento(f"⚠️ Instâncias do Chrome Selenium excedendo o limite ({chromes} > {config.MAX_CHROME_INSTANCES})")
+
+        if parar is not None:
+            parar.wait(config.MONITOR_INTERVALO)
+        else:
+            time.sleep(config.MONITOR_INTERVALO)
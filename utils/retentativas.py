@@ -0,0 +1,117 @@
+"""
+Retentativas no nível mais barato que resolve a falha.
+
+Cada falha é classificada:
+  - PASSO: o portal falhou num passo (erro interno no download, pesquisa sem resposta,
+    elemento que não apareceu, ZIP incompleto). Refaz o clique/pesquisa no mesmo Chrome logado.
+  - SESSAO: o portal derrubou o login. Refaz o login no mesmo Chrome.
+  - TAREFA: o Chrome quebrou (sessão do driver inválida, conexão recusada, stacktrace).
+    Pega um Chrome novo do pool.
+  - FATAL: não adianta repetir (login inválido, captcha, permissão negada).
+
+Cada nível tem seu orçamento de tentativas; esgotado, a próxima falha sobe para o nível
+seguinte (PASSO -> SESSAO -> TAREFA) e, sem orçamento em nenhum, a política desiste. A espera
+entre tentativas é exponencial por nível com jitter ("full jitter"). Toda tentativa fica
+registrada com nível, classificação, duração e espera.
+"""
+import random
+from collections import namedtuple
+
+PASSO = "PASSO"
+SESSAO = "SESSAO"
+TAREFA = "TAREFA"
+FATAL = "FATAL"
+NIVEIS = (PASSO, SESSAO, TAREFA)
+
+# Trechos (em minúsculas) do erro original ou da mensagem legível, do nível mais grave ao mais leve
+_SINAIS = (
+    (FATAL, ("invalid_login", "usuário ou senha inválidos", "captcha", "permissão negada")),
+    (TAREFA, ("invalid session id", "chrome not reachable", "no such window", "target window already closed",
+              "disconnected", "connection refused", "connectionreseterror", "falha na conexão com o navegador",
+              "gethandleverifier", "stacktrace", "ocorreu um erro inesperado ao acessar o portal")),
+    (SESSAO, ("acessorestrito/login", "sessão expirada", "redirecionado para o login")),
+)
+
+Decisao = namedtuple("Decisao", "nivel espera classe")
+
+
+class ErroFatal(Exception):
+    """Falha que não deve ser repetida em nenhum nível."""
+
+
+def classificar(erro, legivel=""):
+    """Nível em que `erro` deve ser repetido (ou FATAL). Sem sinal conhecido, é falha de PASSO."""
+    if isinstance(erro, ErroFatal):
+        return FATAL
+    if type(erro).__name__ == "SessaoHttpExpirada":
+        return SESSAO
+    texto = f"{type(erro).__name__} {erro} {legivel}".lower()
+    for nivel, sinais in _SINAIS:
+        if any(sinal in texto for sinal in sinais):
+            return nivel
+    return PASSO
+
+
+class PoliticaRetentativas:
+    """
+    `orcamentos`: {nível: tentativas extras permitidas}; `espera_base`: {nível: segundos da
+    primeira espera}, dobrando a cada uso do nível até `espera_maxima`. `ao_registrar(registro)`
+    recebe cada tentativa encerrada (dict com numero, nivel, classe, erro, duracao, espera).
+    """
+
+    def __init__(self, orcamentos, espera_base, espera_maxima=120, ao_registrar=None, aleatorio=random.random):
+        self.orcamentos = dict(orcamentos)
+        self.espera_base = dict(espera_base)
+        self.espera_maxima = espera_maxima
+        self.ao_registrar = ao_registrar
+        self.aleatorio = aleatorio
+        self.usos = {nivel: 0 for nivel in NIVEIS}
+        self.tentativas = []
+        self.nivel = TAREFA
+
+    @property
+    def numero(self):
+        """Número da tentativa em andamento (1 na primeira)."""
+        return len(self.tentativas) + 1
+
+    def _registrar(self, classe, erro, duracao, espera):
+        registro = {"numero": self.numero, "nivel": self.nivel, "classe": classe, "erro": erro,
+                    "duracao": duracao, "espera": espera}
+        self.tentativas.append(registro)
+        if self.ao_registrar:
+            self.ao_registrar(registro)
+        return registro
+
+    def sucesso(self, duracao):
+        self._registrar("OK", "", duracao, 0.0)
+
+    def falhou(self, erro, duracao, legivel=""):
+        """
+        Registra a falha e decide a próxima tentativa: Decisao(nivel, espera, classe), ou None
+        se é fatal ou não sobrou orçamento. `nivel` é onde a próxima tentativa recomeça.
+        """
+        classe = classificar(erro, legivel)
+        proximo = None
+        if classe != FATAL:
+            for nivel in NIVEIS[NIVEIS.index(classe):]:
+                if self.usos[nivel] < self.orcamentos.get(nivel, 0):
+                    proximo = nivel
+                    break
+        espera = 0.0
+        if proximo is not None:
+            self.usos[proximo] += 1
+            teto = min(self.espera_maxima, self.espera_base.get(proximo, 1) * 2 ** (self.usos[proximo] - 1))
+            espera = teto * self.aleatorio()
+        self._registrar(classe, legivel or str(erro), duracao, espera)
+        if proximo is None:
+            return None
+        self.nivel = proximo
+        return Decisao(proximo, espera, classe)
+
+    def resumo(self):
+        """'4 tentativas (PASSO 2, TAREFA 1), 93.4s no portal e 12.0s de espera'."""
+        usados = ", ".join(f"{nivel} {n}" for nivel, n in self.usos.items() if n)
+        duracao = sum(t["duracao"] for t in self.tentativas)
+        espera = sum(t["espera"] for t in self.tentativas)
+        return (f"{len(self.tentativas)} tentativa(s)" + (f" ({usados})" if usados else "") +
+                f", {duracao:.1f}s no portal e {espera:.1f}s de espera")